@@ -11,7 +11,7 @@ CACHE_DB_PATH = os.path.join(CACHE_DIR, 'stock_cache.db')
 
 engine = create_engine(
     f'sqlite:///{CACHE_DB_PATH}',
-    connect_args={'check_same_thread': False},
+    connect_args={'check_same_thread': False, 'timeout': settings.SQLITE_BUSY_TIMEOUT},
     echo=settings.DEBUG,
     pool_pre_ping=True
 )
@@ -23,6 +23,9 @@ def receive_connect(dbapi_conn, connection_record):
     """设置 SQLite 连接参数"""
     cursor = dbapi_conn.cursor()
     cursor.execute("PRAGMA foreign_keys=ON")
+    # WAL模式：同步写入时读请求不被阻塞，多个同步任务可以轮流写入
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.close()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
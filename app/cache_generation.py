@@ -0,0 +1,73 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.cache_database import engine as cache_engine
+from app.models import CacheGeneration
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 读取数据版本号的缓存时间（秒）：热点读路径不必每次查询SQLite，
+# 其他进程（uvicorn worker）完成的同步最多延迟这么久被感知
+GENERATION_CHECK_INTERVAL = 1.0
+
+# dataset -> (generation, updated_at, checked_at)
+_generations = {}
+_generations_lock = threading.Lock()
+
+
+def bump_generation(dataset: str) -> int:
+    """数据集同步提交了数据变化后调用，版本号加1并返回新版本号"""
+    table = CacheGeneration.__table__
+    now = datetime.now().isoformat()
+
+    stmt = sqlite_insert(table).values(dataset=dataset, generation=1, updated_at=now)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['dataset'],
+        set_={'generation': table.c.generation + 1, 'updated_at': now}
+    )
+    with cache_engine.begin() as conn:
+        conn.execute(stmt)
+        generation = conn.execute(
+            select(table.c.generation).where(table.c.dataset == dataset)
+        ).scalar()
+
+    with _generations_lock:
+        _generations[dataset] = (generation, now, time.monotonic())
+
+    logger.info(f"{dataset} 数据版本号更新为 {generation}")
+    return generation
+
+
+def get_generation_info(dataset: str, max_age: float = GENERATION_CHECK_INTERVAL) -> Tuple[int, Optional[str]]:
+    """获取数据集当前 (版本号, 最后变化时间)，从未同步过的数据集版本号为 0"""
+    now = time.monotonic()
+    with _generations_lock:
+        cached = _generations.get(dataset)
+    if cached is not None and now - cached[2] < max_age:
+        return cached[0], cached[1]
+
+    table = CacheGeneration.__table__
+    with cache_engine.connect() as conn:
+        row = conn.execute(
+            select(table.c.generation, table.c.updated_at).where(table.c.dataset == dataset)
+        ).first()
+    generation, updated_at = (row.generation, row.updated_at) if row else (0, None)
+
+    with _generations_lock:
+        _generations[dataset] = (generation, updated_at, now)
+    return generation, updated_at
+
+
+def get_generation(dataset: str, max_age: float = GENERATION_CHECK_INTERVAL) -> int:
+    """获取数据集当前版本号"""
+    return get_generation_info(dataset, max_age)[0]
+
+
+def result_changed_data(result: dict) -> bool:
+    """同步结果是否改动了缓存数据（新增/更新/删除了记录，或替换了整表）"""
+    return bool(result.get('inserted') or result.get('updated') or result.get('deleted')) or 'swap_ms' in result
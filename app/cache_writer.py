@@ -0,0 +1,245 @@
+import logging
+import time
+import uuid
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+from sqlalchemy import MetaData, Table, and_, select, text, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Connection, Engine
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 每批写入的行数（SQLite 单条语句的绑定参数数量有限，批量过大反而变慢）
+DEFAULT_BATCH_SIZE = 500
+
+
+def _count_new_keys(conn: Connection, table: Table, key_columns: Sequence[str], batch: List[Dict[str, Any]]) -> int:
+    """批次中表内还不存在的唯一键个数（写入前按唯一索引查找批次内的键，不统计整表）"""
+    keys = {tuple(row[name] for name in key_columns) for row in batch}
+    columns = [table.c[name] for name in key_columns]
+    if len(columns) == 1:
+        condition = columns[0].in_([key[0] for key in keys])
+    else:
+        condition = tuple_(*columns).in_(list(keys))
+    existing = conn.execute(select(*columns).where(condition)).all()
+    return len(keys) - len(existing)
+
+
+def bulk_upsert(
+    conn: Connection,
+    table: Table,
+    rows: List[Dict[str, Any]],
+    key_columns: Optional[Sequence[str]] = None,
+    version_column: Optional[str] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    stats: Optional[dict] = None,
+    hash_column: Optional[str] = None
+) -> dict:
+    """
+    批量写入本地缓存表（SQLite INSERT ... ON CONFLICT DO UPDATE）
+
+    - key_columns: 冲突判定的唯一键；为空时执行普通批量插入
+    - version_column: 版本列（如 updated_at），只有新数据更“新”时才覆盖已有记录
+    - hash_column: 内容哈希列，指定时只有内容变化才覆盖（版本列相同也允许覆盖）
+    - 每批通过一次 executemany 执行，返回插入/更新/跳过的行数及每批明细
+      （插入数为批次中写入前不存在的键数，更新数为受影响行数减去插入数）
+    - stats: 流式同步时传入上一块的统计结果，在其基础上累加
+    """
+    if stats is None:
+        stats = {
+            'inserted': 0,
+            'updated': 0,
+            'skipped': 0,
+            'batches': []
+        }
+
+    if not rows:
+        return stats
+
+    stmt = sqlite_insert(table)
+    if key_columns:
+        update_columns = {
+            name: stmt.excluded[name]
+            for name in rows[0].keys()
+            if name not in key_columns
+        }
+        conditions = []
+        if version_column:
+            if hash_column:
+                conditions.append(stmt.excluded[version_column] >= table.c[version_column])
+            else:
+                conditions.append(stmt.excluded[version_column] > table.c[version_column])
+        if hash_column:
+            conditions.append(stmt.excluded[hash_column].is_distinct_from(table.c[hash_column]))
+        where = and_(*conditions) if conditions else None
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(key_columns),
+            set_=update_columns,
+            where=where
+        )
+
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+
+        if key_columns:
+            inserted = _count_new_keys(conn, table, key_columns, batch)
+            affected = conn.execute(stmt, batch).rowcount
+            updated = max(affected - inserted, 0)
+        else:
+            conn.execute(stmt, batch)
+            inserted = len(batch)
+            updated = 0
+
+        batch_stats = {
+            'size': len(batch),
+            'inserted': inserted,
+            'updated': updated,
+            'skipped': len(batch) - inserted - updated
+        }
+        stats['batches'].append(batch_stats)
+        stats['inserted'] += batch_stats['inserted']
+        stats['updated'] += batch_stats['updated']
+        stats['skipped'] += batch_stats['skipped']
+
+        logger.debug(f"{table.name} 批量写入: {batch_stats}")
+
+    return stats
+
+
+def ensure_columns(engine: Engine, table: Table):
+    """为旧版本创建的缓存表补充模型中新增的列（SQLite ALTER TABLE ADD COLUMN）"""
+    with engine.begin() as conn:
+        existing = {
+            row['name']
+            for row in conn.execute(text(f"PRAGMA table_info('{table.name}')")).mappings()
+        }
+        if not existing:
+            return
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            logger.info(f"为 {table.name} 补充列 {column.name} {column_type}")
+            conn.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}')
+
+
+def ensure_indexes(engine: Engine, table: Table):
+    """为旧版本创建的缓存表补建模型中新增的索引（按列判断，影子表替换后索引名带后缀也能识别）"""
+    with engine.begin() as conn:
+        existing = [
+            [info['name'] for info in conn.execute(text(f"PRAGMA index_info('{index_row['name']}')")).mappings()]
+            for index_row in conn.execute(text(f"PRAGMA index_list('{table.name}')")).mappings()
+        ]
+        if not existing:
+            return
+        for index in table.indexes:
+            # 唯一索引需要先去重，由 ensure_unique_key 负责
+            if index.unique or [column.name for column in index.columns] in existing:
+                continue
+            logger.info(f"为 {table.name} 补建索引 {index.name}")
+            index.create(bind=conn)
+
+
+def ensure_unique_key(engine: Engine, table: Table, columns: Sequence[str]):
+    """
+    确保缓存表在指定列上存在唯一索引（ON CONFLICT 依赖唯一索引）
+    旧版本创建的表只有普通索引，这里先按键去重（保留最新 id），再补建唯一索引
+    """
+    columns = list(columns)
+    with engine.begin() as conn:
+        for index_row in conn.execute(text(f"PRAGMA index_list('{table.name}')")).mappings():
+            if not index_row['unique']:
+                continue
+            index_columns = [
+                info['name']
+                for info in conn.execute(text(f"PRAGMA index_info('{index_row['name']}')")).mappings()
+            ]
+            if index_columns == columns:
+                return
+
+        column_list = ', '.join(columns)
+        logger.info(f"为 {table.name}({column_list}) 补建唯一索引")
+        conn.execute(text(
+            f"DELETE FROM {table.name} WHERE id NOT IN "
+            f"(SELECT MAX(id) FROM {table.name} GROUP BY {column_list})"
+        ))
+        conn.execute(text(
+            f"CREATE UNIQUE INDEX uq_{table.name}_{'_'.join(columns)} ON {table.name} ({column_list})"
+        ))
+
+
+# 全量同步写入影子表，完成后整表替换，读请求始终看到完整的旧数据或新数据
+SHADOW_MARKER = '__shadow_'
+RETIRED_MARKER = '__retired_'
+
+
+def create_shadow_table(engine: Engine, table: Table) -> Table:
+    """
+    按模型定义创建影子表（表名及索引名带随机后缀，避免与正式表冲突）
+    同时清理之前异常中断遗留的影子表
+    """
+    drop_stale_shadow_tables(engine, table)
+
+    token = uuid.uuid4().hex[:8]
+    shadow = table.to_metadata(MetaData(), name=f'{table.name}{SHADOW_MARKER}{token}')
+    # 列上 index=True 生成的索引会按新表名重新命名，显式命名的索引需要手动加后缀
+    for index in shadow.indexes:
+        if not index.name.startswith(f'ix_{shadow.name}'):
+            index.name = f'{index.name}_{token}'
+    shadow.create(bind=engine)
+    logger.info(f"已创建影子表 {shadow.name}")
+    return shadow
+
+
+def swap_shadow_table(engine: Engine, table: Table, shadow: Table) -> float:
+    """
+    在一个短事务内用影子表替换正式表，返回替换耗时（毫秒，从拿到写锁到提交）
+    旧表在事务提交后再删除，不占用替换时间
+    """
+    return swap_shadow_tables(engine, [(table, shadow)])
+
+
+def swap_shadow_tables(engine: Engine, pairs: Sequence[Tuple[Table, Table]]) -> float:
+    """在同一个事务内替换多张相互关联的表（如主表和明细表），读请求不会看到一新一旧"""
+    retired_names = [shadow.name.replace(SHADOW_MARKER, RETIRED_MARKER) for _, shadow in pairs]
+
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.exec_driver_sql('BEGIN IMMEDIATE')
+        start = time.perf_counter()
+        try:
+            for (table, shadow), retired_name in zip(pairs, retired_names):
+                conn.exec_driver_sql(f'ALTER TABLE "{table.name}" RENAME TO "{retired_name}"')
+                conn.exec_driver_sql(f'ALTER TABLE "{shadow.name}" RENAME TO "{table.name}"')
+            conn.exec_driver_sql('COMMIT')
+        except Exception:
+            conn.exec_driver_sql('ROLLBACK')
+            raise
+        swap_ms = round((time.perf_counter() - start) * 1000, 3)
+
+        for retired_name in retired_names:
+            conn.exec_driver_sql(f'DROP TABLE IF EXISTS "{retired_name}"')
+
+    logger.info(f"{', '.join(table.name for table, _ in pairs)} 已切换为新数据，替换耗时 {swap_ms}ms")
+    return swap_ms
+
+
+def drop_shadow_table(engine: Engine, shadow: Optional[Table]):
+    """同步失败时删除未完成的影子表"""
+    if shadow is None:
+        return
+    try:
+        shadow.drop(bind=engine, checkfirst=True)
+    except Exception as e:
+        logger.warning(f"删除影子表 {shadow.name} 失败: {e}")
+
+
+def drop_stale_shadow_tables(engine: Engine, table: Table):
+    """删除异常中断后遗留的影子表和待删除旧表"""
+    with engine.begin() as conn:
+        stale_names = conn.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'table' AND (name LIKE :shadow OR name LIKE :retired)"),
+            {'shadow': f'{table.name}{SHADOW_MARKER}%', 'retired': f'{table.name}{RETIRED_MARKER}%'}
+        ).scalars().all()
+        for name in stale_names:
+            logger.info(f"删除遗留表 {name}")
+            conn.exec_driver_sql(f'DROP TABLE IF EXISTS "{name}"')
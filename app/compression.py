@@ -0,0 +1,298 @@
+import gzip
+import logging
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.cache_generation import get_generation
+from app.http_cache import cache_control_header
+
+try:
+    import brotli
+except ImportError:  # 未安装 brotli 时只提供 gzip
+    brotli = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 可缓存压缩结果的 API 路由 -> 响应依赖的数据集（数据版本变化后使用新的缓存键）
+CACHEABLE_ROUTES: Dict[str, Tuple[str, ...]] = {
+    '/api/screening': ('financial_scores',),
+    '/api/screening/search/suggestions': ('financial_scores',),
+    '/api/screening/top-stocks': ('financial_scores',),
+    '/api/market-breadth': ('market_breadth',),
+    '/api/market-breadth/industries': ('market_breadth',),
+    '/api/market-breadth/analytics': ('market_breadth',),
+    '/api/market-breadth/correlation': ('market_breadth',),
+    '/api/fund-analysis/etf-clusters': ('etf_cluster',),
+}
+
+# 不带查询参数的请求（页面默认加载的数据）每个数据版本只压缩一次后被大量请求命中，使用最高压缩级别并缓存全部编码；
+# 带查询参数的请求（如市场宽度的 since/start_date/industries）和其余路由（选股、搜索建议、分析等）组合多
+# 且每次同步后全部失效，只按请求的编码用快速级别压缩
+PRECOMPRESSED_ROUTES = frozenset({
+    '/api/market-breadth',
+    '/api/market-breadth/industries',
+    '/api/screening/top-stocks',
+})
+# 每个 API 路由最多缓存的键数（路由内 LRU，避免高基数路由挤占静态资源和低基数路由的缓存）
+ROUTE_MAX_ENTRIES = 64
+
+# 预压缩的静态文件类型
+STATIC_SUFFIXES = ('.js', '.css')
+
+# 小于该字节数的响应不压缩（压缩收益小于响应头开销）
+MINIMUM_SIZE = 500
+# 压缩结果缓存的总字节数上限（LRU）
+CACHE_MAX_BYTES = 32 * 1024 * 1024
+# 静态资源和低基数路由只在每个缓存键第一次请求时压缩，使用最高压缩级别
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+# 高基数路由的压缩级别（压缩耗时接近序列化耗时量级，压缩率略低）
+FAST_GZIP_LEVEL = 5
+FAST_BROTLI_QUALITY = 4
+
+
+def _available_encodings() -> Tuple[str, ...]:
+    """服务端支持的编码，按优先级排列"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """按 Accept-Encoding（含 q 值）选择最佳编码，q 值相同时优先 br；不接受压缩时返回 None"""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        weight = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name.strip().lower()] = weight
+
+    best, best_weight = None, 0.0
+    for encoding in _available_encodings():
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compress_body(body: bytes, encoding: str, fast: bool = False) -> bytes:
+    """按指定编码压缩；fast=True 时使用快速压缩级别"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=FAST_BROTLI_QUALITY if fast else BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=FAST_GZIP_LEVEL if fast else GZIP_LEVEL, mtime=0)
+
+
+def compress_variants(body: bytes) -> Dict[str, bytes]:
+    """以最高级别一次生成全部编码的压缩结果（同一缓存键之后的请求无论接受哪种编码都直接命中）"""
+    return {encoding: compress_body(body, encoding) for encoding in _available_encodings()}
+
+
+class CompressedEntry:
+    """一个缓存键对应的响应：状态码、响应头（不含长度和编码）和各编码的压缩结果"""
+
+    def __init__(self, status: int, headers: List[Tuple[bytes, bytes]], variants: Dict[str, bytes]):
+        self.status = status
+        self.headers = headers
+        self.variants = variants
+        self.size = sum(len(body) for body in variants.values())
+
+
+def _route_of(key: tuple) -> Optional[str]:
+    """缓存键所属的 API 路由（静态资源不按路由限制条数）"""
+    return key[1] if key[0] == 'api' else None
+
+
+class CompressedBodyCache:
+    """
+    按总字节数限制容量的 LRU，每个 API 路由另外限制条数（路由内淘汰最久未用的键）
+    缓存键包含数据版本，过期的条目不会再命中，随 LRU 淘汰
+    """
+
+    def __init__(self, max_bytes: int, max_entries_per_route: int = ROUTE_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries_per_route = max_entries_per_route
+        self.total_bytes = 0
+        self._entries: "OrderedDict[tuple, CompressedEntry]" = OrderedDict()
+        # 路由 -> 该路由的缓存键（按最近使用排序）；路由集合固定，空的路由不需要删除
+        self._routes: Dict[str, "OrderedDict[tuple, None]"] = {}
+
+    def get(self, key: tuple) -> Optional[CompressedEntry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            route = _route_of(key)
+            if route is not None:
+                self._routes[route].move_to_end(key)
+        return entry
+
+    def _remove(self, key: tuple):
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry.size
+        route = _route_of(key)
+        if route is not None:
+            del self._routes[route][key]
+
+    def put(self, key: tuple, entry: CompressedEntry):
+        if entry.size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        route = _route_of(key)
+        if route is not None:
+            keys = self._routes.setdefault(route, OrderedDict())
+            while len(keys) >= self.max_entries_per_route:
+                self._remove(next(iter(keys)))
+            keys[key] = None
+        self._entries[key] = entry
+        self.total_bytes += entry.size
+        while self.total_bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+
+def _merge_vary(headers: MutableHeaders, value: str):
+    vary = [item.strip() for item in headers.get('vary', '').split(',') if item.strip()]
+    if value.lower() not in (item.lower() for item in vary):
+        vary.append(value)
+    headers['Vary'] = ', '.join(vary)
+
+
+class PrecompressedResponseMiddleware:
+    """
+    预压缩响应：可缓存的 API 响应按 (路由, 规范化查询参数, Accept, 数据版本) 缓存压缩结果，
+    静态 JS/CSS 按 (路径, 修改时间, 大小) 缓存；命中时直接返回压缩好的字节，不调用接口也不重复压缩
+    - 静态资源和 PRECOMPRESSED_ROUTES 中不带查询参数的请求以最高级别一次压缩出全部编码
+    - 其余请求只压缩请求的编码（编码是缓存键的一部分），使用快速压缩级别
+    - 同一缓存键并发未命中时只由第一个请求调用接口并压缩，其余请求等待后直接使用缓存结果
+    条件请求（If-None-Match 等）和 Range 请求交给下层处理（304 本身很便宜）
+    """
+
+    def __init__(self, app: ASGIApp, static_dir: str, static_prefix: str = '/static/', max_bytes: int = CACHE_MAX_BYTES):
+        self.app = app
+        self.static_dir = os.path.realpath(static_dir)
+        self.static_prefix = static_prefix
+        self.cache = CompressedBodyCache(max_bytes)
+        # 正在生成的缓存键 -> 生成结束（成功或失败）时触发的事件
+        self._pending: Dict[tuple, anyio.Event] = {}
+
+    def _cache_key(self, scope: Scope, headers: Headers) -> Optional[tuple]:
+        """请求对应的缓存键；不可缓存的请求返回 None"""
+        path = scope['path']
+        datasets = CACHEABLE_ROUTES.get(path)
+        if datasets is not None:
+            query = tuple(sorted(parse_qsl(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True)))
+            generations = tuple(get_generation(dataset) for dataset in datasets)
+            return ('api', path, query, headers.get('accept', ''), generations)
+
+        if path.startswith(self.static_prefix) and path.endswith(STATIC_SUFFIXES):
+            file_path = os.path.realpath(os.path.join(self.static_dir, path[len(self.static_prefix):]))
+            if not file_path.startswith(self.static_dir + os.sep):
+                return None
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                return None
+            return ('static', path, stat.st_mtime_ns, stat.st_size)
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http' or scope['method'] != 'GET':
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        if any(name in headers for name in ('if-none-match', 'if-modified-since', 'range')):
+            await self.app(scope, receive, send)
+            return
+
+        base_key = self._cache_key(scope, headers)
+        encoding = choose_encoding(headers.get('accept-encoding')) if base_key is not None else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        fast = base_key[0] == 'api' and (base_key[1] not in PRECOMPRESSED_ROUTES or bool(base_key[2]))
+        key = base_key + (encoding,) if fast else base_key
+
+        entry = self.cache.get(key)
+        if entry is None and key in self._pending:
+            # 同一缓存键正在生成：等待后使用其结果（响应不可缓存时再自行请求）
+            await self._pending[key].wait()
+            entry = self.cache.get(key)
+        if entry is not None and encoding in entry.variants:
+            await self._send_entry(key, entry, encoding, send)
+            return
+
+        if key in self._pending:
+            await self._respond(scope, receive, send, headers, base_key, key, encoding, fast)
+            return
+        done = self._pending[key] = anyio.Event()
+        try:
+            await self._respond(scope, receive, send, headers, base_key, key, encoding, fast)
+        finally:
+            del self._pending[key]
+            done.set()
+
+    async def _respond(self, scope: Scope, receive: Receive, send: Send, headers: Headers,
+                       base_key: tuple, key: tuple, encoding: str, fast: bool):
+        # 未命中：完整读取下层响应后压缩一次并缓存
+        # 去掉 pathsend 扩展，确保静态文件以 body 消息返回
+        extensions = {
+            name: value for name, value in scope.get('extensions', {}).items() if name != 'http.response.pathsend'
+        }
+        start: Dict[str, Message] = {}
+        chunks: List[bytes] = []
+
+        async def capture(message: Message):
+            if message['type'] == 'http.response.start':
+                start['message'] = message
+            elif message['type'] == 'http.response.body':
+                chunks.append(message.get('body', b''))
+
+        await self.app(dict(scope, extensions=extensions), receive, capture)
+        message = start['message']
+        body = b''.join(chunks)
+        response_headers = MutableHeaders(raw=list(message.get('headers', [])))
+
+        cacheable = (
+            message['status'] == 200
+            and 'content-encoding' not in response_headers
+            and 'no-store' not in response_headers.get('cache-control', '')
+            and len(body) >= MINIMUM_SIZE
+        )
+        if not cacheable:
+            await send(message)
+            await send({'type': 'http.response.body', 'body': body})
+            return
+
+        if fast:
+            variants = {encoding: await anyio.to_thread.run_sync(compress_body, body, encoding, True)}
+        else:
+            variants = await anyio.to_thread.run_sync(compress_variants, body)
+        del response_headers['content-length']
+        entry = CompressedEntry(message['status'], response_headers.raw, variants)
+        # 处理期间数据版本已变化时不缓存，避免旧数据占用新版本的缓存键
+        if self._cache_key(scope, headers) == base_key:
+            self.cache.put(key, entry)
+        await self._send_entry(key, entry, encoding, send)
+
+    async def _send_entry(self, key: tuple, entry: CompressedEntry, encoding: str, send: Send):
+        body = entry.variants[encoding]
+        headers = MutableHeaders(raw=list(entry.headers))
+        headers['Content-Encoding'] = encoding
+        headers['Content-Length'] = str(len(body))
+        _merge_vary(headers, 'Accept-Encoding')
+        if key[0] == 'api' and 'cache-control' in headers:
+            # 有效期随下一次定时同步时间变化，命中缓存时重新计算
+            headers['Cache-Control'] = cache_control_header()
+        await send({'type': 'http.response.start', 'status': entry.status, 'headers': headers.raw})
+        await send({'type': 'http.response.body', 'body': body})
@@ -9,6 +9,10 @@ class Settings(BaseSettings):
     DB_PASSWORD: str
     DB_NAME: str
 
+    # 远程连接池：并行同步时每个数据集占用一个连接
+    DB_POOL_SIZE: int = 4
+    DB_MAX_OVERFLOW: int = 1
+
     # 应用配置
     APP_NAME: str = "Stock Dashboard"
     APP_ENV: str = "production"
@@ -18,6 +22,19 @@ class Settings(BaseSettings):
     HOST: str = "0.0.0.0"
     PORT: int = 8000
 
+    # 同步配置：远程查询使用服务端游标，每次拉取的行数
+    SYNC_CHUNK_SIZE: int = 1000
+    # 并行同步的线程数（各数据集同时同步）
+    SYNC_MAX_WORKERS: int = 4
+    # SQLite写锁等待时间（秒），并行同步时各数据集轮流获取写锁
+    SQLITE_BUSY_TIMEOUT: int = 120
+    # 跨进程同步锁：租约时长（秒，同步过程中随进度上报续约，同步卡住超过租约时长后可被接管）和获取锁的最长等待时间（秒，0表示直接跳过）
+    SYNC_LOCK_LEASE_SECONDS: int = 600
+    SYNC_LOCK_WAIT_SECONDS: int = 0
+
+    # 快速响应路径：选股行、搜索建议、市场宽度的响应按数据版本预序列化（orjson），跳过 Pydantic 校验
+    FAST_JSON_RESPONSES: bool = False
+
     @property
     def DATABASE_URL(self) -> str:
         return f"mysql+pymysql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}?charset=utf8mb4&connect_timeout=10"
@@ -2,14 +2,119 @@ import json
 from typing import List, Optional, Tuple, Dict, Any
 from datetime import datetime
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, asc, or_
+from sqlalchemy import desc, asc, or_, select, tuple_
 from app.models import (
     FinancialScoresCache,
+    FinancialMetricCache,
     MarketBreadthMetricsCache,
+    MarketBreadthIndustryCache,
     EtfClusterSelection,
     EtfClusterSelectionCache
 )
 from app.schemas import ScreeningFilterParams
+from app.json_response import RawJSON, fragment
+from app.metrics_store import METRIC_OPERATORS, METRIC_PREFIX, parse_metrics_detail
+from app.screening_cursor import cursor_sort_column
+from app.result_cache import GenerationCache
+from app.search_index import PINYIN_SEPARATOR
+
+
+def financial_score_to_dict(item: FinancialScoresCache) -> Dict[str, Any]:
+    """
+    把financial_scores缓存记录转换为接口返回格式
+    metrics_detail_parsed 使用同步时预序列化的片段（RawJSON），读取时不解析JSON
+    """
+    metrics_fragment = item.metrics_detail_parsed_json
+    if metrics_fragment is None:
+        # 尚未补齐预拆分指标的旧记录
+        metrics_fragment = parse_metrics_detail(item.stock_code, item.metrics_detail)[0]
+    metrics_detail_parsed = RawJSON(metrics_fragment)
+
+    return {
+        "id": item.id,
+        "stock_code": item.stock_code,
+        "stock_name": item.stock_name,
+        "overall_score": float(item.total_score) if item.total_score is not None else None,
+        "total_score": float(item.total_score) if item.total_score is not None else None,
+        "grade": item.grade,
+        "recommendation": item.grade,  # 兼容前端字段名
+        "metrics_detail": item.metrics_detail,
+        "metrics_detail_parsed": metrics_detail_parsed,
+        "completeness_ratio": float(item.completeness_ratio) if item.completeness_ratio is not None else None,
+        "sector_name": item.sector_name,
+        "data_date": item.data_date.isoformat() if item.data_date else None,
+        "created_at": item.created_at.isoformat() if item.created_at else None,
+        "updated_at": item.updated_at.isoformat() if item.updated_at else None
+    }
+
+
+# Top3 推荐只返回概要字段
+TOP3_FIELDS = (
+    "id", "stock_code", "stock_name", "overall_score", "total_score",
+    "grade", "recommendation", "sector_name", "data_date"
+)
+
+# 搜索建议 / 排名列表返回的字段
+SUGGESTION_FIELDS = ("stock_code", "stock_name", "overall_score", "grade", "sector_name")
+
+# 筛选结果总数和排行榜在两次同步之间不变，按 financial_scores 数据版本缓存
+SCREENING_RESULT_CACHE_SIZE = 512
+screening_result_cache = GenerationCache('financial_scores', SCREENING_RESULT_CACHE_SIZE)
+
+
+# 快速响应路径（settings.FAST_JSON_RESPONSES）：选股行按 (行ID, 是否含原始指标) 缓存预序列化片段，
+# 搜索建议按 (关键词, 数量) 缓存 (序列化好的响应体, 是否来自内存索引)，只缓存来自内存索引的结果
+SCREENING_FRAGMENT_CACHE_SIZE = 4096
+screening_fragment_cache = GenerationCache('financial_scores', SCREENING_FRAGMENT_CACHE_SIZE)
+suggestion_response_cache = GenerationCache('financial_scores', 1024)
+# 默认响应路径：选股行的 metrics_detail_parsed 片段按行ID缓存解析后的列表（容量覆盖全部A股）
+SCREENING_METRICS_CACHE_SIZE = 8192
+screening_metrics_cache = GenerationCache('financial_scores', SCREENING_METRICS_CACHE_SIZE)
+
+
+# 行业维表在两次同步之间不变，按 market_breadth 数据版本缓存
+breadth_result_cache = GenerationCache('market_breadth', 16)
+# 快速响应路径：市场宽度响应体按规范化的查询条件缓存
+breadth_response_cache = GenerationCache('market_breadth', 64)
+# 市场宽度滚动统计按 (window, history) 缓存
+breadth_analytics_cache = GenerationCache('market_breadth', 16)
+# 行业相关性按 (交易日区间, 行业, 最大偏移) 缓存
+breadth_correlation_cache = GenerationCache('market_breadth', 64)
+
+
+def financial_score_fragment(row: Dict[str, Any], include_raw_metrics: bool = True) -> RawJSON:
+    """选股行（financial_score_to_dict 的结果）的预序列化片段，同一数据版本内每行只序列化一次"""
+    def compute() -> RawJSON:
+        if include_raw_metrics:
+            return fragment(row)
+        return fragment({key: value for key, value in row.items() if key != "metrics_detail"})
+
+    return screening_fragment_cache.get_or_compute((row["id"], include_raw_metrics), compute)
+
+
+def financial_score_metrics(row: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """选股行 metrics_detail_parsed 片段解析后的列表，同一数据版本内每行只解析一次（返回的列表不可修改）"""
+    return screening_metrics_cache.get_or_compute(
+        row["id"], lambda: json.loads(row["metrics_detail_parsed"])
+    )
+
+
+def screening_filter_signature(params: ScreeningFilterParams) -> tuple:
+    """规范化的筛选条件（不含分页和排序），相同条件的请求共享结果总数"""
+    return (
+        params.search,
+        None if params.search else params.stock_code,
+        None if params.search else params.stock_name,
+        params.sector_name,
+        params.min_overall_score,
+        params.max_overall_score,
+        params.recommendation,
+        tuple(sorted((f.key, f.op, f.value) for f in params.metric_filters))
+    )
+
+
+def _count_screening_query(query, params: ScreeningFilterParams) -> int:
+    return screening_result_cache.get_or_compute(('count', screening_filter_signature(params)), query.count)
 
 
 def get_screening_list(
@@ -18,18 +123,136 @@ def get_screening_list(
 ) -> Tuple[List[Dict[str, Any]], int]:
     """
     从本地缓存获取基本面选股数据列表
+    优先使用内存列式索引，索引未建立或已过期时查询SQLite
     返回: (数据列表, 总数)
     """
-    query = db.query(FinancialScoresCache)
+    from app.screening_index import get_screening_index
+
+    index = get_screening_index()
+    if index is not None:
+        result = index.query(params)
+        if result is not None:
+            return result
+
+    query = _filter_screening_query(db.query(FinancialScoresCache), params)
+    total = _count_screening_query(query, params)
+    
+    # 映射排序字段
+    sort_by = params.sort_by
+    if sort_by == 'overall_score':
+        sort_by = 'total_score'
+    
+    # 相同排序值按股票代码同向排列，与游标分页（get_screening_page）的顺序一致
+    direction = desc if params.sort_order == 'desc' else asc
+    if sort_by and sort_by.startswith(METRIC_PREFIX):
+        # 按指标数值排序，没有该指标的股票视为空值
+        metric_value = _metric_value_column(sort_by)
+        query = query.outerjoin(metric_value.table, metric_value.table.c.stock_code == FinancialScoresCache.stock_code)
+        query = query.order_by(direction(metric_value), direction(FinancialScoresCache.stock_code))
+    elif sort_by and hasattr(FinancialScoresCache, sort_by):
+        sort_column = getattr(FinancialScoresCache, sort_by)
+        query = query.order_by(direction(sort_column), direction(FinancialScoresCache.stock_code))
     
+    offset = (params.page - 1) * params.page_size
+    raw_data = query.offset(offset).limit(params.page_size).all()
+    
+    # 处理数据，解析metrics_detail并添加板块名称
+    data = [financial_score_to_dict(item) for item in raw_data]
+    
+    return data, total
+
+
+def get_screening_page(
+    db: Session,
+    params: ScreeningFilterParams
+) -> Tuple[List[Dict[str, Any]], int, Optional[Tuple[Any, str]]]:
+    """
+    游标分页获取基本面选股数据：按 (排序值, 股票代码) 定位到 params.after 之后，不使用 OFFSET
+    排序字段须为 cursor_sort_column 支持的字段
+    返回: (数据列表, 总数, 下一页起点 (排序值, 股票代码)；没有下一页时为 None)
+    """
+    from app.screening_index import get_screening_index
+
+    index = get_screening_index()
+    if index is not None:
+        return index.query_after(params)
+
+    query = _filter_screening_query(db.query(FinancialScoresCache), params)
+    total = _count_screening_query(query, params)
+
+    sort_by = cursor_sort_column(params.sort_by)
+    if sort_by.startswith(METRIC_PREFIX):
+        sort_value = _metric_value_column(sort_by)
+        query = query.outerjoin(sort_value.table, sort_value.table.c.stock_code == FinancialScoresCache.stock_code)
+    else:
+        sort_value = getattr(FinancialScoresCache, sort_by)
+    query = query.add_columns(sort_value)
+
+    descending = params.sort_order == 'desc'
+    stock_code = FinancialScoresCache.stock_code
+    # 游标之后的记录按排序顺序分为若干段，每段都是 (排序值, 股票代码) 索引上的一个区间，
+    # 用行值比较直接定位，避免 OR 条件退化为从头扫描索引
+    # SQLite 中空值最小：升序排在最前，降序排在最后
+    segments = [None]
+    if params.after is not None:
+        value, code = params.after.value, params.after.stock_code
+        if descending:
+            if value is None:
+                segments = [sort_value.is_(None) & (stock_code < code)]
+            else:
+                segments = [tuple_(sort_value, stock_code) < tuple_(value, code), sort_value.is_(None)]
+        else:
+            if value is None:
+                segments = [sort_value.is_(None) & (stock_code > code), sort_value.isnot(None)]
+            else:
+                segments = [tuple_(sort_value, stock_code) > tuple_(value, code)]
+
+    direction = desc if descending else asc
+    rows = []
+    for condition in segments:
+        segment_query = query if condition is None else query.filter(condition)
+        rows.extend(
+            segment_query.order_by(direction(sort_value), direction(stock_code))
+            .limit(params.page_size + 1 - len(rows))
+            .all()
+        )
+        if len(rows) > params.page_size:
+            break
+
+    data = [financial_score_to_dict(item) for item, _ in rows[:params.page_size]]
+    next_after = None
+    if len(rows) > params.page_size:
+        item, value = rows[params.page_size - 1]
+        next_after = (float(value) if value is not None and sort_by != 'stock_code' else value, item.stock_code)
+    return data, total, next_after
+
+
+def _metric_value_column(sort_by: str):
+    """metric.<指标名> 对应的指标数值列（子查询，需与主表按股票代码外连接）"""
+    metric = select(FinancialMetricCache.stock_code, FinancialMetricCache.value).where(
+        FinancialMetricCache.metric_key == sort_by[len(METRIC_PREFIX):]
+    ).subquery()
+    return metric.c.value
+
+
+def _search_condition(keyword: str):
+    """
+    代码/名称子串匹配，或名称拼音（全拼/首字母）前缀匹配
+    与内存搜索索引（StockSearchIndex）的语义一致，结果不取决于索引是否已建立
+    """
+    keyword = keyword.strip()
+    return or_(
+        FinancialScoresCache.stock_code.like(f"%{keyword}%"),
+        FinancialScoresCache.stock_name.like(f"%{keyword}%"),
+        FinancialScoresCache.name_pinyin.like(f"%{PINYIN_SEPARATOR}{keyword.lower()}%")
+    )
+
+
+def _filter_screening_query(query, params: ScreeningFilterParams):
+    """按筛选参数添加查询条件（列表分页与游标分页共用）"""
     # 处理搜索参数
     if params.search:
-        query = query.filter(
-            or_(
-                FinancialScoresCache.stock_code.like(f"%{params.search}%"),
-                FinancialScoresCache.stock_name.like(f"%{params.search}%")
-            )
-        )
+        query = query.filter(_search_condition(params.search))
     
     # 处理其他筛选参数（这些参数可以与搜索参数组合使用）
     if params.stock_code and not params.search:
@@ -57,62 +280,33 @@ def get_screening_list(
     if params.recommendation:
         query = query.filter(FinancialScoresCache.grade == params.recommendation)
     
-    total = query.count()
-    
-    # 映射排序字段
-    sort_by = params.sort_by
-    if sort_by == 'overall_score':
-        sort_by = 'total_score'
-    
-    if sort_by and hasattr(FinancialScoresCache, sort_by):
-        sort_column = getattr(FinancialScoresCache, sort_by)
-        if params.sort_order == 'desc':
-            query = query.order_by(desc(sort_column))
-        else:
-            query = query.order_by(asc(sort_column))
-    
-    offset = (params.page - 1) * params.page_size
-    raw_data = query.offset(offset).limit(params.page_size).all()
-    
-    # 处理数据，解析metrics_detail并添加板块名称
-    data = []
-    for item in raw_data:
-        # 解析metrics_detail JSON
-        metrics_detail_parsed = []
-        if item.metrics_detail:
-            try:
-                metrics_dict = json.loads(item.metrics_detail)
-                metrics_detail_parsed = [
-                    {"key": key, "value": value}
-                    for key, value in metrics_dict.items()
-                ]
-            except (json.JSONDecodeError, TypeError):
-                metrics_detail_parsed = []
-        
-        data.append({
-            "id": item.id,
-            "stock_code": item.stock_code,
-            "stock_name": item.stock_name,
-            "overall_score": float(item.total_score) if item.total_score is not None else None,
-            "total_score": float(item.total_score) if item.total_score is not None else None,
-            "grade": item.grade,
-            "recommendation": item.grade,  # 兼容前端字段名
-            "metrics_detail": item.metrics_detail,
-            "metrics_detail_parsed": metrics_detail_parsed,
-            "completeness_ratio": float(item.completeness_ratio) if item.completeness_ratio is not None else None,
-            "sector_name": item.sector_name,
-            "data_date": item.data_date.isoformat() if item.data_date else None,
-            "created_at": item.created_at.isoformat() if item.created_at else None,
-            "updated_at": item.updated_at.isoformat() if item.updated_at else None
-        })
+    # 指标范围筛选：每个条件通过 (metric_key, value) 索引查出满足条件的股票
+    for metric_filter in params.metric_filters:
+        compare = METRIC_OPERATORS[metric_filter.op]
+        query = query.filter(FinancialScoresCache.stock_code.in_(
+            select(FinancialMetricCache.stock_code).where(
+                FinancialMetricCache.metric_key == metric_filter.key,
+                compare(FinancialMetricCache.value, metric_filter.value)
+            )
+        ))
     
-    return data, total
+    return query
 
 
 def get_top3_by_overall_score(db: Session) -> List[Dict[str, Any]]:
     """
-    从本地缓存获取综合得分前3的股票
+    从本地缓存获取综合得分前3的股票（按数据版本缓存）
     """
+    return screening_result_cache.get_or_compute(('top3',), lambda: _query_top3_by_overall_score(db))
+
+
+def _query_top3_by_overall_score(db: Session) -> List[Dict[str, Any]]:
+    from app.screening_index import get_screening_index
+
+    index = get_screening_index()
+    if index is not None:
+        return index.top(3, TOP3_FIELDS)
+
     top3 = db.query(FinancialScoresCache)\
         .order_by(desc(FinancialScoresCache.total_score))\
         .limit(3)\
@@ -138,20 +332,30 @@ def get_top3_by_overall_score(db: Session) -> List[Dict[str, Any]]:
 
 def search_stock_suggestions(db: Session, query: str, limit: int = 10) -> List[Dict[str, Any]]:
     """
-    搜索股票代码或名称的建议（OR逻辑，模糊匹配）
+    搜索股票代码或名称的建议（OR逻辑，模糊匹配，同时匹配名称拼音全拼/首字母）
+    优先使用内存搜索索引，索引未建立或已过期时查询SQLite
     返回: 建议列表
     """
-    search_query = db.query(FinancialScoresCache).filter(
-        or_(
-            FinancialScoresCache.stock_code.like(f"%{query}%"),
-            FinancialScoresCache.stock_name.like(f"%{query}%")
-        )
-    )
-    
-    suggestions = search_query.order_by(
-        FinancialScoresCache.total_score.desc()
-    ).limit(limit).all()
-    
+    return search_stock_suggestions_with_source(db, query, limit)[0]
+
+
+def search_stock_suggestions_with_source(db: Session, query: str, limit: int = 10) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    同 search_stock_suggestions，另外返回结果是否来自与当前数据版本一致的内存索引
+    回退查询时索引正在后台重建，调用方据此决定是否按数据版本缓存结果
+    """
+    from app.screening_index import get_screening_index
+
+    index = get_screening_index()
+    if index is not None:
+        return index.suggest(query, limit, SUGGESTION_FIELDS), True
+
+    suggestions = db.query(FinancialScoresCache)\
+        .filter(_search_condition(query))\
+        .order_by(FinancialScoresCache.total_score.desc())\
+        .limit(limit)\
+        .all()
+
     # 处理数据
     result = []
     for item in suggestions:
@@ -162,15 +366,25 @@ def search_stock_suggestions(db: Session, query: str, limit: int = 10) -> List[D
             "grade": item.grade,
             "sector_name": item.sector_name
         })
-    
-    return result
+
+    return result, False
 
 
 def get_top_stocks_by_overall_score(db: Session, limit: int = 8) -> List[Dict[str, Any]]:
     """
-    从本地缓存获取综合得分前N名的股票
+    从本地缓存获取综合得分前N名的股票（按数据版本缓存）
     返回: 前N名股票列表
     """
+    return screening_result_cache.get_or_compute(('top', limit), lambda: _query_top_stocks_by_overall_score(db, limit))
+
+
+def _query_top_stocks_by_overall_score(db: Session, limit: int) -> List[Dict[str, Any]]:
+    from app.screening_index import get_screening_index
+
+    index = get_screening_index()
+    if index is not None:
+        return index.top(limit, SUGGESTION_FIELDS)
+
     top_stocks = db.query(FinancialScoresCache)\
         .order_by(desc(FinancialScoresCache.total_score))\
         .limit(limit)\
@@ -190,6 +404,89 @@ def get_top_stocks_by_overall_score(db: Session, limit: int = 8) -> List[Dict[st
     return result
 
 
+def get_market_breadth_delta(
+    db: Session,
+    since: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    industries: Optional[List[str]] = None
+) -> Optional[dict]:
+    """
+    获取市场宽度增量数据：只返回 since（上次响应的 sync_token 或日期）之后新增/变化的交易日和新增行业列
+    矩阵不可用或令牌已失效时返回全量数据（delta=False），客户端整体替换本地数据
+    """
+    from app.market_breadth_matrix import get_market_breadth_matrix
+
+    matrix = get_market_breadth_matrix()
+    if matrix is not None:
+        delta = matrix.delta(since, start_date, end_date, industries)
+        if delta is not None:
+            return delta
+
+    data = get_market_breadth_data(db, start_date, end_date, industries)
+    if data is not None:
+        data = dict(data, delta=False)
+    return data
+
+
+def get_market_breadth_analytics(
+    window: int,
+    history: int,
+    series: List[str],
+    stats: List[str],
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+) -> Optional[dict]:
+    """
+    市场宽度滚动统计（均值、z-score、历史百分位、宽度推力），基于同步时物化的矩阵计算
+    series 包含未知的行业时抛出 ValueError；矩阵不可用或日期范围内没有数据时返回 None
+    """
+    from app.market_breadth_analytics import MarketBreadthAnalytics
+    from app.market_breadth_matrix import get_market_breadth_matrix
+
+    matrix = get_market_breadth_matrix()
+    if matrix is None:
+        return None
+    analytics = breadth_analytics_cache.get_or_compute(
+        (matrix.generation, window, history),
+        lambda: MarketBreadthAnalytics(matrix, window, history)
+    )
+    unknown = analytics.unknown_series(series)
+    if unknown:
+        raise ValueError(f"未知的序列: {', '.join(unknown)}")
+    return analytics.query(series, stats, start_date, end_date)
+
+
+def get_market_breadth_correlation(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    days: Optional[int] = None,
+    industries: Optional[List[str]] = None,
+    max_lag: int = 3
+) -> Optional[dict]:
+    """
+    行业 × 行业相关系数和领先/滞后相关，基于同步时物化的矩阵计算
+    days 为日期范围内最近的交易日数；同一交易日区间的请求共享缓存。矩阵不可用或区间内没有数据时返回 None
+    """
+    from app.market_breadth_analytics import industry_correlation
+    from app.market_breadth_matrix import get_market_breadth_matrix
+
+    matrix = get_market_breadth_matrix()
+    if matrix is None:
+        return None
+    start, end = matrix.row_range(start_date, end_date)
+    if days:
+        start = max(start, end - days)
+    if start >= end:
+        return None
+
+    selected = tuple(sorted(set(industries))) if industries else None
+    return breadth_correlation_cache.get_or_compute(
+        (matrix.generation, start, end, selected, max_lag),
+        lambda: industry_correlation(matrix, start, end, selected, max_lag)
+    )
+
+
 def get_market_breadth_data(
     db: Session,
     start_date: Optional[str] = None,
@@ -197,10 +494,16 @@ def get_market_breadth_data(
     industries: Optional[List[str]] = None
 ) -> Optional[dict]:
     """
-    获取市场宽度热力图数据（从JSON字段解析）
+    获取市场宽度热力图数据
+    优先对同步时物化的稠密矩阵切片，矩阵尚未按当前数据版本构建时从JSON字段解析
     返回格式: {dates: [], columns: [行业列表 + 'index_all' + 'sum'], data: [[...]], statistics: {}, last_update: datetime}
     """
     import json
+    from app.market_breadth_matrix import get_market_breadth_matrix
+
+    matrix = get_market_breadth_matrix()
+    if matrix is not None:
+        return matrix.query(start_date, end_date, industries)
     
     # 构建查询
     query = db.query(MarketBreadthMetricsCache)
@@ -312,22 +615,25 @@ def get_market_breadth_data(
 
 
 def get_market_breadth_industries(db: Session) -> List[str]:
-    """获取所有可用行业列表"""
-    import json
-    
-    # 从所有记录的JSON字段中提取唯一行业
-    all_industries = set()
-    records = db.query(MarketBreadthMetricsCache).all()
-    
-    for record in records:
-        if record.industries_data:
-            try:
-                industries_dict = json.loads(record.industries_data)
-                all_industries.update(industries_dict.keys())
-            except (json.JSONDecodeError, TypeError):
-                continue
-    
-    return sorted(list(all_industries))
+    """获取所有可用行业列表（读取同步时维护的行业维表，按数据版本缓存）"""
+    return [item['name'] for item in get_market_breadth_industry_items(db)]
+
+
+def get_market_breadth_industry_items(db: Session) -> List[Dict[str, Any]]:
+    """行业维表：行业ID、名称、首次/最近出现日期（按名称排序，按数据版本缓存）"""
+    def query_items():
+        rows = db.query(MarketBreadthIndustryCache).order_by(MarketBreadthIndustryCache.name).all()
+        return [
+            {
+                "id": row.id,
+                "name": row.name,
+                "first_seen_date": row.first_seen_date,
+                "last_seen_date": row.last_seen_date
+            }
+            for row in rows
+        ]
+
+    return breadth_result_cache.get_or_compute(('industry_items',), query_items)
 
 
 def get_etf_cluster_selection_latest(db: Session) -> Optional[Dict[str, Any]]:
@@ -1,13 +1,29 @@
+import functools
 import logging
 import json
 from datetime import datetime
-from typing import Optional
-from sqlalchemy import desc
+from typing import List, Optional, Tuple
+from sqlalchemy import desc, func, select, update
 from app.database import SessionLocal as RemoteSessionLocal
 from app.cache_database import SessionLocal as CacheSessionLocal, engine as cache_engine, Base as CacheBase
-from app.models import FinancialScores, FinancialScoresCache, StockDetails, StockDetailsCache, SyncMetadata
-from app.market_breadth_sync import init_market_breadth_cache_db, sync_market_breadth_data_from_remote, get_market_breadth_sync_status
-from app.etf_cluster_sync import init_etf_cluster_cache_db, sync_etf_cluster_data_from_remote, get_etf_cluster_sync_status
+from app.models import (
+    FinancialScores, FinancialScoresCache, FinancialMetricCache, StockDetails, StockDetailsCache, SyncMetadata
+)
+from app.cache_writer import (
+    DEFAULT_BATCH_SIZE, bulk_upsert, ensure_columns, ensure_indexes, create_shadow_table, swap_shadow_table, swap_shadow_tables,
+    drop_shadow_table
+)
+from app.metrics_store import parse_metrics_detail, replace_metrics, backfill_financial_metrics
+from app.search_index import pinyin_search_text
+from app.sync_pipeline import (
+    iter_query_chunks, iter_rows_by_keys, get_peak_rss_mb, get_remote_bytes, start_progress, update_progress,
+    timed_phase, estimate_bytes, row_hash_expr, parse_watermark, after_watermark, max_watermark, find_changed_keys
+)
+from app.sync_lock import single_flight, get_lock_holder
+from app.cache_generation import bump_generation, result_changed_data
+from app.sync_history import DEFAULT_TREND_RUNS, record_sync_run, get_sync_trend
+from app.market_breadth_sync import init_market_breadth_cache_db, get_market_breadth_sync_status
+from app.etf_cluster_sync import init_etf_cluster_cache_db, get_etf_cluster_sync_status
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -17,6 +33,13 @@ def init_cache_db():
     """初始化本地缓存数据库表结构"""
     try:
         CacheBase.metadata.create_all(bind=cache_engine)
+        # 旧版本创建的缓存表补充新增列（如 row_hash）和索引
+        for table in CacheBase.metadata.sorted_tables:
+            ensure_columns(cache_engine, table)
+            ensure_indexes(cache_engine, table)
+        # 旧版本同步的记录补齐预拆分的指标明细和名称拼音
+        if backfill_financial_metrics() + backfill_name_pinyin():
+            bump_generation('financial_scores')
         init_market_breadth_cache_db()
         init_etf_cluster_cache_db()
         logger.info("本地缓存数据库表结构初始化完成")
@@ -25,11 +48,35 @@ def init_cache_db():
         raise
 
 
+def backfill_name_pinyin() -> int:
+    """
+    旧版本同步的记录没有名称拼音（SQLite 回退搜索无法按拼音匹配），启动时一次性补齐
+    未安装 pypinyin 时跳过；返回补齐的记录数
+    """
+    if pinyin_search_text('股') is None:
+        return 0
+    scores = FinancialScoresCache.__table__
+    with cache_engine.begin() as conn:
+        pending = conn.execute(
+            select(scores.c.stock_code, scores.c.stock_name).where(scores.c.name_pinyin.is_(None))
+        ).all()
+        for row in pending:
+            conn.execute(
+                update(scores)
+                .where(scores.c.stock_code == row.stock_code)
+                .values(name_pinyin=pinyin_search_text(row.stock_name))
+            )
+    if pending:
+        logger.info(f"已为 {len(pending)} 条financial_scores缓存记录补齐名称拼音")
+    return len(pending)
+
+
 def get_last_sync_info() -> Optional[SyncMetadata]:
-    """获取上次同步信息"""
+    """获取上次financial_scores同步信息"""
     cache_db = CacheSessionLocal()
     try:
         last_sync = cache_db.query(SyncMetadata)\
+            .filter(SyncMetadata.sync_status.in_(['success', 'failed']))\
             .order_by(desc(SyncMetadata.id))\
             .first()
         return last_sync
@@ -37,164 +84,524 @@ def get_last_sync_info() -> Optional[SyncMetadata]:
         cache_db.close()
 
 
-def sync_data_from_remote() -> dict:
+def get_last_sync_watermark() -> Tuple[Optional[str], Optional[str]]:
+    """
+    获取financial_scores增量同步的复合水位线 (远程最大更新时间, 该时间下的最大股票代码)
+    取最近一次成功同步的记录，失败记录不带水位线，不能用来判断增量起点
+    """
+    cache_db = CacheSessionLocal()
+    try:
+        last_success = cache_db.query(SyncMetadata)\
+            .filter(SyncMetadata.sync_status == 'success')\
+            .order_by(desc(SyncMetadata.id))\
+            .first()
+        if not last_success:
+            return None, None
+        return last_success.remote_max_update_time, last_success.remote_max_key
+    finally:
+        cache_db.close()
+
+
+def financial_scores_hash_expr():
+    """financial_scores远程行内容哈希（不含时间戳列）"""
+    return row_hash_expr(
+        FinancialScores.stock_name,
+        FinancialScores.total_score,
+        FinancialScores.grade,
+        FinancialScores.metrics_detail,
+        FinancialScores.completeness_ratio,
+        FinancialScores.data_date
+    ).label('row_hash')
+
+
+def _write_financial_scores_chunk(cache_db, target_table, metrics_table, chunk, write_stats: Optional[dict]) -> dict:
+    """
+    把一块远程 (FinancialScores, row_hash) 记录写入缓存表，板块名称取自本地stock_details缓存
+    同时拆分metrics_detail：预序列化响应片段写入主表，各指标写入指标明细表
+    """
+    with timed_phase('financial_scores', 'transform'):
+        stock_codes = [item.stock_code for item, _ in chunk]
+        stock_details_map = dict(
+            cache_db.query(StockDetailsCache.stock_code, StockDetailsCache.sector_name)
+            .filter(StockDetailsCache.stock_code.in_(stock_codes))
+            .all()
+        )
+
+        cache_rows = []
+        metric_rows = []
+        for remote_item, row_hash in chunk:
+            # 获取板块名称
+            sector_name = stock_details_map.get(remote_item.stock_code, '')
+            metrics_fragment, item_metric_rows = parse_metrics_detail(remote_item.stock_code, remote_item.metrics_detail)
+            metric_rows.extend(item_metric_rows)
+
+            cache_rows.append({
+                'stock_code': remote_item.stock_code,
+                'stock_name': remote_item.stock_name,
+                'total_score': remote_item.total_score,
+                'grade': remote_item.grade,
+                'metrics_detail': remote_item.metrics_detail,
+                'completeness_ratio': remote_item.completeness_ratio,
+                'sector_name': sector_name,
+                'data_date': remote_item.data_date,
+                'created_at': remote_item.created_at,
+                'updated_at': remote_item.updated_at,
+                'row_hash': row_hash,
+                'metrics_detail_parsed_json': metrics_fragment,
+                'name_pinyin': pinyin_search_text(remote_item.stock_name)
+            })
+
+    # 批量upsert：只有内容哈希变化（且远程updated_at不早于本地）时才覆盖本地记录
+    with timed_phase('financial_scores', 'cache_write'):
+        write_stats = bulk_upsert(
+            cache_db.connection(),
+            target_table,
+            cache_rows,
+            key_columns=['stock_code'],
+            version_column='updated_at',
+            hash_column='row_hash',
+            stats=write_stats
+        )
+        replace_metrics(cache_db.connection(), metrics_table, stock_codes, metric_rows)
+    return write_stats
+
+
+@single_flight('financial_scores')
+@record_sync_run('financial_scores')
+def sync_financial_scores_from_remote(full: bool = False) -> dict:
     """
-    从远程MySQL同步financial_scores和stock_details数据到本地SQLite缓存
-    支持增量同步（基于updated_at）
-    同步失败时保留上一次数据
+    从远程MySQL同步financial_scores数据到本地SQLite缓存
+    - 全量同步：流式拉取完整记录写入影子表，完成后整表替换
+    - 增量同步：先按复合水位线 (updated_at, stock_code) 只拉取 主键+更新时间+内容哈希，
+      与本地哈希比对后，仅对内容变化的记录按主键批量拉取完整数据（含metrics_detail）
+    板块名称取自本地stock_details缓存，同步失败时保留上一次数据
+    full=True 时（强制全量同步）持有同步锁后先清除本数据集的同步元数据（水位线），再执行全量同步
     """
     result = {
         'success': False,
         'record_count': 0,
         'sync_type': 'full',
         'error': None,
-        'last_sync_time': None,
-        'financial_scores_sync': {'success': False, 'record_count': 0},
-        'stock_details_sync': {'success': False, 'record_count': 0}
+        'last_sync_time': None
     }
 
     remote_db = RemoteSessionLocal()
     cache_db = CacheSessionLocal()
+    shadow_table = None
+    metrics_shadow_table = None
 
     try:
-        logger.info("开始数据同步...")
+        logger.info("同步financial_scores数据...")
+        start_progress('financial_scores')
 
-        last_sync = get_last_sync_info()
-        remote_max_update_time = None  # 初始化变量
+        if full:
+            cache_db.query(SyncMetadata)\
+                .filter(SyncMetadata.sync_status.in_(['success', 'failed']))\
+                .delete(synchronize_session=False)
+            cache_db.commit()
+            logger.info("已清除financial_scores同步元数据，执行全量同步")
 
-        # 同步financial_scores数据
-        logger.info("同步financial_scores数据...")
-        if last_sync and last_sync.remote_max_update_time:
-            logger.info(f"执行增量同步，上次同步时间: {last_sync.remote_max_update_time}")
-            query = remote_db.query(FinancialScores)\
-                .filter(FinancialScores.updated_at > last_sync.remote_max_update_time)
+        watermark, watermark_key = get_last_sync_watermark()
+        # 本次同步扫描到的最大 (updated_at, stock_code)
+        remote_max = None
+        row_hash = financial_scores_hash_expr()
+
+        financial_scores_count = 0
+        write_stats = None
+
+        if watermark:
+            logger.info(f"执行增量同步，上次同步水位线: ({watermark}, {watermark_key})")
             result['sync_type'] = 'incremental'
+
+            # 第一步：只拉取主键、更新时间和内容哈希
+            key_query = remote_db.query(FinancialScores.stock_code, FinancialScores.updated_at, row_hash)\
+                .filter(after_watermark(
+                    FinancialScores.updated_at, FinancialScores.stock_code,
+                    parse_watermark(watermark), watermark_key
+                ))
+            remote_hashes = {}
+            for chunk in iter_query_chunks(key_query, dataset='financial_scores'):
+                for row in chunk:
+                    remote_hashes[row.stock_code] = row.row_hash
+                    remote_max = max_watermark(remote_max, (row.updated_at, row.stock_code))
+
+            # 第二步：只对内容变化的记录拉取完整数据
+            with timed_phase('financial_scores', 'transform'):
+                changed_codes = find_changed_keys(
+                    cache_db, FinancialScoresCache.stock_code, FinancialScoresCache.row_hash, remote_hashes
+                )
+            result['unchanged'] = len(remote_hashes) - len(changed_codes)
+            logger.info(
+                f"水位线之后共 {len(remote_hashes)} 条记录，内容变化 {len(changed_codes)} 条，"
+                f"跳过未变化 {result['unchanged']} 条"
+            )
+
+            update_progress('financial_scores', phase='payload')
+            payload_query = remote_db.query(FinancialScores, row_hash)
+            for chunk in iter_rows_by_keys(
+                payload_query, FinancialScores.stock_code, changed_codes, dataset='financial_scores'
+            ):
+                financial_scores_count += len(chunk)
+                write_stats = _write_financial_scores_chunk(
+                    cache_db, FinancialScoresCache.__table__, FinancialMetricCache.__table__, chunk, write_stats
+                )
+                with timed_phase('financial_scores', 'commit'):
+                    cache_db.commit()
         else:
             logger.info("执行全量同步")
-            query = remote_db.query(FinancialScores)
+            query = remote_db.query(FinancialScores, row_hash)
 
-        financial_scores_data = query.all()
-        financial_scores_count = len(financial_scores_data)
+            for chunk in iter_query_chunks(query, dataset='financial_scores'):
+                if shadow_table is None:
+                    logger.info("全量同步：写入financial_scores影子表")
+                    shadow_table = create_shadow_table(cache_engine, FinancialScoresCache.__table__)
+                    metrics_shadow_table = create_shadow_table(cache_engine, FinancialMetricCache.__table__)
 
+                financial_scores_count += len(chunk)
+                for item, _ in chunk:
+                    remote_max = max_watermark(remote_max, (item.updated_at, item.stock_code))
+
+                write_stats = _write_financial_scores_chunk(
+                    cache_db, shadow_table, metrics_shadow_table, chunk, write_stats
+                )
+                # 逐块提交，缩短SQLite写锁持有时间，便于其他数据集并行写入（影子表对读请求不可见）
+                with timed_phase('financial_scores', 'commit'):
+                    cache_db.commit()
+
+        update_progress('financial_scores', phase='finalizing')
         if financial_scores_count == 0:
             logger.info("没有新的financial_scores数据需要同步")
         else:
-            logger.info(f"从远程获取到 {financial_scores_count} 条financial_scores记录")
-
-            remote_max_update_time = max([item.updated_at for item in financial_scores_data]) if financial_scores_data else None
-
-            if result['sync_type'] == 'full':
-                logger.info("全量同步：清空本地financial_scores缓存表")
-                cache_db.query(FinancialScoresCache).delete()
-
-            # 获取所有股票代码，用于查询板块名称
-            stock_codes = [item.stock_code for item in financial_scores_data]
-            
-            # 查询stock_details获取板块名称
-            stock_details_map = {}
-            if stock_codes:
-                stock_details = remote_db.query(StockDetails)\
-                    .filter(StockDetails.stock_code.in_(stock_codes))\
-                    .all()
-                stock_details_map = {item.stock_code: item.sector_name for item in stock_details}
-
-            for remote_item in financial_scores_data:
-                existing = cache_db.query(FinancialScoresCache)\
-                    .filter(FinancialScoresCache.stock_code == remote_item.stock_code)\
-                    .first()
-
-                # 获取板块名称
-                sector_name = stock_details_map.get(remote_item.stock_code, '')
-
-                cache_item_data = {
-                    'stock_code': remote_item.stock_code,
-                    'stock_name': remote_item.stock_name,
-                    'total_score': remote_item.total_score,
-                    'grade': remote_item.grade,
-                    'metrics_detail': remote_item.metrics_detail,
-                    'completeness_ratio': remote_item.completeness_ratio,
-                    'sector_name': sector_name,
-                    'data_date': remote_item.data_date,
-                    'created_at': remote_item.created_at,
-                    'updated_at': remote_item.updated_at
-                }
-
-                if existing:
-                    if remote_item.updated_at > existing.updated_at:
-                        for key, value in cache_item_data.items():
-                            setattr(existing, key, value)
-                        logger.debug(f"更新financial_scores记录: {remote_item.stock_code}")
-                    else:
-                        logger.debug(f"跳过记录（数据未更新）: {remote_item.stock_code}")
-                else:
-                    cache_item = FinancialScoresCache(**cache_item_data)
-                    cache_db.add(cache_item)
-                    logger.debug(f"新增financial_scores记录: {remote_item.stock_code}")
-
+            logger.info(
+                f"从远程获取到 {financial_scores_count} 条financial_scores记录: 新增 {write_stats['inserted']} 条，"
+                f"更新 {write_stats['updated']} 条，跳过 {write_stats['skipped']} 条"
+            )
+            if shadow_table is not None:
+                with timed_phase('financial_scores', 'commit'):
+                    result['swap_ms'] = swap_shadow_tables(cache_engine, [
+                        (FinancialScoresCache.__table__, shadow_table),
+                        (FinancialMetricCache.__table__, metrics_shadow_table)
+                    ])
+                shadow_table = None
+                metrics_shadow_table = None
+            result.update(write_stats)
+
+        with timed_phase('financial_scores', 'post_sync_counts'):
+            total_financial_scores = cache_db.query(FinancialScoresCache).count()
+
+        # 保存同步元数据；水位线之后没有记录时沿用上一次的水位线
+        if remote_max:
+            watermark, watermark_key = remote_max[0].isoformat(), remote_max[1]
+        sync_metadata = SyncMetadata(
+            last_sync_time=datetime.now().isoformat(),
+            record_count=total_financial_scores,
+            sync_status='success',
+            error_message=None,
+            remote_max_update_time=watermark,
+            remote_max_key=watermark_key
+        )
+        cache_db.add(sync_metadata)
+        with timed_phase('financial_scores', 'commit'):
             cache_db.commit()
-            result['financial_scores_sync']['success'] = True
-            result['financial_scores_sync']['record_count'] = financial_scores_count
 
-        # 同步stock_details数据
+        # 数据有变化时更新版本号，内存索引和响应缓存据此失效
+        if result_changed_data(result):
+            bump_generation('financial_scores')
+
+        logger.info(f"financial_scores同步成功！本地缓存共 {total_financial_scores} 条记录")
+        update_progress('financial_scores', phase='done')
+
+        result.update({
+            'success': True,
+            'record_count': financial_scores_count,
+            'last_sync_time': datetime.now(),
+            'remote_bytes': get_remote_bytes('financial_scores'),
+            'peak_rss_mb': get_peak_rss_mb()
+        })
+
+    except Exception as e:
+        cache_db.rollback()
+        drop_shadow_table(cache_engine, shadow_table)
+        drop_shadow_table(cache_engine, metrics_shadow_table)
+        update_progress('financial_scores', phase='failed')
+        logger.error(f"financial_scores同步失败: {e}")
+
+        sync_metadata = SyncMetadata(
+            last_sync_time=datetime.now().isoformat(),
+            record_count=0,
+            sync_status='failed',
+            error_message=str(e)[:500],
+            remote_max_update_time=None
+        )
+        cache_db.add(sync_metadata)
+        cache_db.commit()
+
+        result['error'] = str(e)
+
+    finally:
+        remote_db.close()
+        cache_db.close()
+
+    return result
+
+
+def get_last_stock_details_sync_info() -> Optional[SyncMetadata]:
+    """获取上次stock_details同步信息"""
+    cache_db = CacheSessionLocal()
+    try:
+        last_sync = cache_db.query(SyncMetadata)\
+            .filter(SyncMetadata.sync_status.in_(['stock_details_success', 'stock_details_failed']))\
+            .order_by(desc(SyncMetadata.id))\
+            .first()
+        return last_sync
+    finally:
+        cache_db.close()
+
+
+def get_stock_details_watermark() -> Tuple[Optional[str], Optional[str]]:
+    """获取stock_details增量同步的复合水位线 (远程最大更新时间, 该时间下的最大股票代码)"""
+    cache_db = CacheSessionLocal()
+    try:
+        last_success = cache_db.query(SyncMetadata)\
+            .filter(SyncMetadata.sync_status == 'stock_details_success')\
+            .order_by(desc(SyncMetadata.id))\
+            .first()
+        if not last_success:
+            return None, None
+        return last_success.remote_max_update_time, last_success.remote_max_key
+    finally:
+        cache_db.close()
+
+
+def _delete_missing_stock_details(remote_db, cache_db) -> int:
+    """
+    比对远程与本地的股票代码集合，删除远程已不存在的stock_details缓存记录
+    只拉取主键列，开销远小于全表比对
+    """
+    remote_codes = set()
+    for chunk in iter_query_chunks(remote_db.query(StockDetails.stock_code)):
+        remote_codes.update(row.stock_code for row in chunk)
+        update_progress('stock_details', remote_bytes=estimate_bytes(chunk))
+
+    local_codes = {row.stock_code for row in cache_db.query(StockDetailsCache.stock_code)}
+    missing_codes = sorted(local_codes - remote_codes)
+
+    deleted = 0
+    for start in range(0, len(missing_codes), DEFAULT_BATCH_SIZE):
+        batch = missing_codes[start:start + DEFAULT_BATCH_SIZE]
+        deleted += cache_db.query(StockDetailsCache)\
+            .filter(StockDetailsCache.stock_code.in_(batch))\
+            .delete(synchronize_session=False)
+
+    return deleted
+
+
+def _refresh_financial_scores_sectors(cache_db, stock_codes: List[str]) -> int:
+    """stock_details板块变化时，同步更新financial_scores缓存中的板块名称"""
+    updated = 0
+    for start in range(0, len(stock_codes), DEFAULT_BATCH_SIZE):
+        batch = stock_codes[start:start + DEFAULT_BATCH_SIZE]
+        sector_name = select(StockDetailsCache.sector_name)\
+            .where(StockDetailsCache.stock_code == FinancialScoresCache.stock_code)\
+            .scalar_subquery()
+        updated += cache_db.execute(
+            update(FinancialScoresCache)
+            .where(FinancialScoresCache.stock_code.in_(batch))
+            .where(FinancialScoresCache.sector_name.is_distinct_from(func.coalesce(sector_name, '')))
+            .values(sector_name=func.coalesce(sector_name, ''))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+    return updated
+
+
+def stock_details_hash_expr():
+    """stock_details远程行内容哈希（不含时间戳列）"""
+    return row_hash_expr(
+        StockDetails.stock_name,
+        StockDetails.sector_code,
+        StockDetails.sector_name,
+        StockDetails.detail_info
+    ).label('row_hash')
+
+
+def _write_stock_details_chunk(cache_db, target_table, chunk, write_stats: Optional[dict]) -> dict:
+    """把一块远程 (StockDetails, row_hash) 记录写入缓存表"""
+    with timed_phase('stock_details', 'transform'):
+        cache_rows = [
+            {
+                'stock_code': remote_item.stock_code,
+                'stock_name': remote_item.stock_name,
+                'sector_code': remote_item.sector_code,
+                'sector_name': remote_item.sector_name,
+                'detail_info': remote_item.detail_info,
+                'created_at': remote_item.created_at,
+                'updated_at': remote_item.updated_at,
+                'row_hash': remote_hash
+            }
+            for remote_item, remote_hash in chunk
+        ]
+
+    with timed_phase('stock_details', 'cache_write'):
+        return bulk_upsert(
+            cache_db.connection(),
+            target_table,
+            cache_rows,
+            key_columns=['stock_code'],
+            version_column='updated_at',
+            hash_column='row_hash',
+            stats=write_stats
+        )
+
+
+@single_flight('stock_details')
+@record_sync_run('stock_details')
+def sync_stock_details_from_remote(full: bool = False) -> dict:
+    """
+    从远程MySQL同步stock_details数据到本地SQLite缓存
+    - 首次同步（无水位线）：写入影子表后整表替换
+    - 增量同步：先只拉取复合水位线之后记录的 主键+更新时间+内容哈希，
+      仅对内容变化的记录按主键批量拉取完整数据（含detail_info）并upsert，
+      再通过主键集合比对删除远程已删除的记录；无变化时不改动任何数据行
+    full=True 时（强制全量同步）持有同步锁后先清除本数据集的同步元数据（水位线），再执行全量同步
+    """
+    result = {
+        'success': False,
+        'record_count': 0,
+        'sync_type': 'full',
+        'error': None,
+        'last_sync_time': None
+    }
+
+    remote_db = RemoteSessionLocal()
+    cache_db = CacheSessionLocal()
+    shadow_table = None
+
+    try:
         logger.info("同步stock_details数据...")
-        stock_details_data = remote_db.query(StockDetails).all()
-        stock_details_count = len(stock_details_data)
-
-        if stock_details_count > 0:
-            logger.info(f"从远程获取到 {stock_details_count} 条stock_details记录")
-            
-            # 清空并重新同步stock_details缓存表
-            cache_db.query(StockDetailsCache).delete()
-            
-            for remote_item in stock_details_data:
-                cache_item = StockDetailsCache(
-                    stock_code=remote_item.stock_code,
-                    stock_name=remote_item.stock_name,
-                    sector_code=remote_item.sector_code,
-                    sector_name=remote_item.sector_name,
-                    detail_info=remote_item.detail_info,
-                    created_at=remote_item.created_at,
-                    updated_at=remote_item.updated_at
-                )
-                cache_db.add(cache_item)
-                logger.debug(f"新增stock_details记录: {remote_item.stock_code}")
-            
+        start_progress('stock_details')
+
+        if full:
+            cache_db.query(SyncMetadata)\
+                .filter(SyncMetadata.sync_status.in_(['stock_details_success', 'stock_details_failed']))\
+                .delete(synchronize_session=False)
             cache_db.commit()
-            result['stock_details_sync']['success'] = True
-            result['stock_details_sync']['record_count'] = stock_details_count
+            logger.info("已清除stock_details同步元数据，执行全量同步")
 
-        # 计算总记录数
-        total_financial_scores = cache_db.query(FinancialScoresCache).count()
-        total_stock_details = cache_db.query(StockDetailsCache).count()
-        total_count = total_financial_scores + total_stock_details
+        watermark, watermark_key = get_stock_details_watermark()
+        remote_max = None
+        row_hash = stock_details_hash_expr()
 
-        # 保存同步元数据
+        stock_details_count = 0
+        write_stats = None
+        changed_codes = []
+
+        if watermark:
+            logger.info(f"执行stock_details增量同步，上次同步水位线: ({watermark}, {watermark_key})")
+            result['sync_type'] = 'incremental'
+
+            key_query = remote_db.query(StockDetails.stock_code, StockDetails.updated_at, row_hash)\
+                .filter(after_watermark(
+                    StockDetails.updated_at, StockDetails.stock_code,
+                    parse_watermark(watermark), watermark_key
+                ))
+            remote_hashes = {}
+            for chunk in iter_query_chunks(key_query, dataset='stock_details'):
+                for row in chunk:
+                    remote_hashes[row.stock_code] = row.row_hash
+                    remote_max = max_watermark(remote_max, (row.updated_at, row.stock_code))
+
+            with timed_phase('stock_details', 'transform'):
+                changed_codes = find_changed_keys(
+                    cache_db, StockDetailsCache.stock_code, StockDetailsCache.row_hash, remote_hashes
+                )
+            result['unchanged'] = len(remote_hashes) - len(changed_codes)
+
+            update_progress('stock_details', phase='payload')
+            payload_query = remote_db.query(StockDetails, row_hash)
+            for chunk in iter_rows_by_keys(payload_query, StockDetails.stock_code, changed_codes, dataset='stock_details'):
+                stock_details_count += len(chunk)
+                write_stats = _write_stock_details_chunk(cache_db, StockDetailsCache.__table__, chunk, write_stats)
+                with timed_phase('stock_details', 'commit'):
+                    cache_db.commit()
+        else:
+            logger.info("执行stock_details全量同步")
+            query = remote_db.query(StockDetails, row_hash)
+
+            for chunk in iter_query_chunks(query, dataset='stock_details'):
+                if shadow_table is None:
+                    # 写入影子表，完成后替换stock_details缓存表
+                    shadow_table = create_shadow_table(cache_engine, StockDetailsCache.__table__)
+
+                stock_details_count += len(chunk)
+                for item, _ in chunk:
+                    remote_max = max_watermark(remote_max, (item.updated_at, item.stock_code))
+
+                write_stats = _write_stock_details_chunk(cache_db, shadow_table, chunk, write_stats)
+                with timed_phase('stock_details', 'commit'):
+                    cache_db.commit()
+
+        update_progress('stock_details', phase='finalizing')
+        if shadow_table is not None:
+            with timed_phase('stock_details', 'commit'):
+                result['swap_ms'] = swap_shadow_table(cache_engine, StockDetailsCache.__table__, shadow_table)
+            shadow_table = None
+
+        if write_stats:
+            result.update(write_stats)
+
+        with timed_phase('stock_details', 'post_sync_counts'):
+            if result['sync_type'] == 'incremental':
+                result['deleted'] = _delete_missing_stock_details(remote_db, cache_db)
+                result['sector_refreshed'] = _refresh_financial_scores_sectors(cache_db, changed_codes)
+                cache_db.commit()
+
+            total_stock_details = cache_db.query(StockDetailsCache).count()
+
+        # 保存同步元数据；没有新数据时沿用上一次的水位线
+        if remote_max:
+            watermark, watermark_key = remote_max[0].isoformat(), remote_max[1]
         sync_metadata = SyncMetadata(
             last_sync_time=datetime.now().isoformat(),
-            record_count=total_financial_scores,  # 只记录financial_scores的数量
-            sync_status='success',
+            record_count=total_stock_details,
+            sync_status='stock_details_success',
             error_message=None,
-            remote_max_update_time=remote_max_update_time.isoformat() if remote_max_update_time else None
+            remote_max_update_time=watermark,
+            remote_max_key=watermark_key
         )
         cache_db.add(sync_metadata)
-        cache_db.commit()
+        with timed_phase('stock_details', 'commit'):
+            cache_db.commit()
 
-        logger.info(f"同步成功！本地缓存共 {total_financial_scores} 条financial_scores记录，{total_stock_details} 条stock_details记录")
+        if result_changed_data(result):
+            bump_generation('stock_details')
+        # 板块名称变化会改动financial_scores缓存
+        if result.get('sector_refreshed'):
+            bump_generation('financial_scores')
+
+        logger.info(
+            f"stock_details同步成功！从远程获取到 {stock_details_count} 条记录，"
+            f"删除 {result.get('deleted', 0)} 条，本地缓存共 {total_stock_details} 条记录"
+        )
+        update_progress('stock_details', phase='done')
 
         result.update({
             'success': True,
-            'record_count': total_financial_scores,
-            'last_sync_time': datetime.now()
+            'record_count': stock_details_count,
+            'last_sync_time': datetime.now(),
+            'remote_bytes': get_remote_bytes('stock_details'),
+            'peak_rss_mb': get_peak_rss_mb()
         })
 
     except Exception as e:
         cache_db.rollback()
-        logger.error(f"同步失败: {e}")
+        drop_shadow_table(cache_engine, shadow_table)
+        update_progress('stock_details', phase='failed')
+        logger.error(f"stock_details同步失败: {e}")
 
         sync_metadata = SyncMetadata(
             last_sync_time=datetime.now().isoformat(),
             record_count=0,
-            sync_status='failed',
+            sync_status='stock_details_failed',
             error_message=str(e)[:500],
             remote_max_update_time=None
         )
@@ -207,46 +614,125 @@ def sync_data_from_remote() -> dict:
         remote_db.close()
         cache_db.close()
 
-    if result['success']:
-        logger.info("开始同步市场宽度数据...")
-        breadth_result = sync_market_breadth_data_from_remote()
-        result['market_breadth_sync'] = breadth_result
+    return result
 
-        if not breadth_result['success']:
-            logger.error(f"市场宽度数据同步失败: {breadth_result.get('error')}")
-            result['success'] = False
-            result['market_breadth_sync_error'] = breadth_result.get('error')
 
-        logger.info("开始同步ETF聚类选股数据...")
-        etf_result = sync_etf_cluster_data_from_remote()
-        result['etf_cluster_sync'] = etf_result
+def get_stock_details_sync_status() -> dict:
+    """获取stock_details同步状态"""
+    cache_db = CacheSessionLocal()
+    try:
+        details_count = cache_db.query(StockDetailsCache).count()
+        last_sync = get_last_stock_details_sync_info()
+
+        sync_status = 'never'
+        if last_sync:
+            if last_sync.sync_status == 'stock_details_success':
+                sync_status = 'success'
+            elif last_sync.sync_status == 'stock_details_failed':
+                sync_status = 'failed'
+
+        return {
+            'last_sync_time': last_sync.last_sync_time if last_sync and last_sync.last_sync_time else None,
+            'remote_max_update_time': last_sync.remote_max_update_time if last_sync and last_sync.remote_max_update_time else None,
+            'record_count': details_count,
+            'sync_status': sync_status,
+            'has_data': details_count > 0
+        }
+    finally:
+        cache_db.close()
 
-        if not etf_result['success']:
-            logger.error(f"ETF聚类选股数据同步失败: {etf_result.get('error')}")
-            result['etf_cluster_sync_error'] = etf_result.get('error')
-    else:
-        result['market_breadth_sync'] = None
-        result['etf_cluster_sync'] = None
 
-    return result
+def sync_data_from_remote(full: bool = False) -> dict:
+    """
+    从远程MySQL同步所有数据集到本地SQLite缓存
+    各数据集由同步编排器按依赖关系并行执行（stock_details -> financial_scores，
+    market_breadth、etf_cluster相互独立），同步失败时保留上一次数据
+    full=True 时各数据集在各自的同步锁内清除水位线后全量同步
+    """
+    from app.sync_orchestrator import SYNC_DAG, run_sync_dag
+    from app.screening_index import build_screening_index
 
+    logger.info("开始数据同步...")
+    dag = {
+        name: (functools.partial(sync_func, full=True) if full else sync_func, deps)
+        for name, (sync_func, deps) in SYNC_DAG.items()
+    }
+    dag_result = run_sync_dag(dag)
+    results = dag_result['results']
+
+    financial_result = results['financial_scores']
+    stock_details_result = results['stock_details']
+    breadth_result = results['market_breadth']
+    etf_result = results['etf_cluster']
+
+    result = {
+        'success': financial_result['success'] and stock_details_result['success'],
+        'record_count': 0,
+        'sync_type': financial_result.get('sync_type', 'full'),
+        'error': financial_result.get('error') or stock_details_result.get('error'),
+        'last_sync_time': datetime.now(),
+        'financial_scores_sync': financial_result,
+        'stock_details_sync': stock_details_result,
+        'market_breadth_sync': breadth_result,
+        'etf_cluster_sync': etf_result,
+        'timings': dag_result['timings'],
+        'critical_path': dag_result['critical_path'],
+        'critical_path_time': dag_result['critical_path_time'],
+        'total_time': dag_result['total_time'],
+        'remote_bytes': {name: item.get('remote_bytes', 0) for name, item in results.items()},
+        'peak_rss_mb': get_peak_rss_mb()
+    }
 
-def force_full_sync() -> dict:
-    """强制执行全量同步"""
-    logger.info("执行强制全量同步...")
     cache_db = CacheSessionLocal()
     try:
-        cache_db.query(SyncMetadata).delete()
-        cache_db.commit()
-        logger.info("已清除同步元数据，接下来将执行全量同步")
+        result['record_count'] = cache_db.query(FinancialScoresCache).count()
     finally:
         cache_db.close()
 
-    return sync_data_from_remote()
+    if not breadth_result['success']:
+        logger.error(f"市场宽度数据同步失败: {breadth_result.get('error')}")
+        result['success'] = False
+        result['market_breadth_sync_error'] = breadth_result.get('error')
+
+    if not etf_result['success']:
+        logger.error(f"ETF聚类选股数据同步失败: {etf_result.get('error')}")
+        result['etf_cluster_sync_error'] = etf_result.get('error')
 
+    # 同步完成后立即重建选股内存索引（数据未变化时不会重建）
+    try:
+        build_screening_index()
+    except Exception as e:
+        logger.error(f"重建选股内存索引失败: {e}")
+
+    logger.info(
+        f"数据同步结束，总耗时 {result['total_time']}s，"
+        f"关键路径 {' -> '.join(result['critical_path'])} 耗时 {result['critical_path_time']}s"
+    )
+
+    return result
 
-def get_sync_status() -> dict:
-    """获取同步状态"""
+
+def force_full_sync() -> dict:
+    """
+    强制执行全量同步：各数据集取得同步锁后才清除自己的水位线
+    因其他进程正在同步而跳过的数据集保留原水位线，并在结果中标记为未强制全量同步
+    """
+    logger.info("执行强制全量同步...")
+    result = sync_data_from_remote(full=True)
+
+    result['forced_datasets'] = []
+    result['not_forced_datasets'] = []
+    for name in ('stock_details', 'financial_scores', 'market_breadth', 'etf_cluster'):
+        dataset_result = result[f'{name}_sync']
+        dataset_result['forced'] = dataset_result.get('sync_type') != 'skipped'
+        result['forced_datasets' if dataset_result['forced'] else 'not_forced_datasets'].append(name)
+    if result['not_forced_datasets']:
+        logger.warning(f"以下数据集正在由其他进程同步，未执行强制全量同步: {result['not_forced_datasets']}")
+    return result
+
+
+def get_sync_status(history_runs: int = DEFAULT_TREND_RUNS) -> dict:
+    """获取同步状态，history_runs > 0 时附带各数据集最近几次同步的耗时趋势"""
     last_sync = get_last_sync_info()
     total_count = 0
 
@@ -279,8 +765,18 @@ def get_sync_status() -> dict:
     market_breadth_sync_status = get_market_breadth_sync_status()
     etf_cluster_sync_status = get_etf_cluster_sync_status()
 
+    datasets = ['stock_details', 'financial_scores', 'market_breadth', 'etf_cluster']
+    locks = {}
+    for dataset in datasets:
+        holder = get_lock_holder(dataset)
+        if holder:
+            locks[dataset] = holder
+
     return {
+        'locks': locks,
+        'history': get_sync_trend(datasets, history_runs) if history_runs > 0 else {},
         'stock': stock_sync_status,
+        'stock_details': get_stock_details_sync_status(),
         'market_breadth': market_breadth_sync_status,
         'etf_cluster': etf_cluster_sync_status
     }
@@ -5,8 +5,8 @@ from app.config import settings
 
 engine = create_engine(
     settings.DATABASE_URL,
-    pool_size=1,
-    max_overflow=1,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
     pool_pre_ping=True,
     pool_recycle=3600,
     echo=settings.DEBUG
@@ -5,6 +5,11 @@ from sqlalchemy import desc
 from app.database import SessionLocal as RemoteSessionLocal
 from app.cache_database import SessionLocal as CacheSessionLocal, engine as cache_engine, Base as CacheBase
 from app.models import EtfClusterSelection, EtfClusterSelectionCache, SyncMetadata
+from app.cache_writer import bulk_upsert, create_shadow_table, swap_shadow_table, drop_shadow_table
+from app.sync_pipeline import iter_query_chunks, get_peak_rss_mb, get_remote_bytes, start_progress, update_progress, timed_phase
+from app.sync_lock import single_flight
+from app.cache_generation import bump_generation
+from app.sync_history import record_sync_run
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -33,9 +38,12 @@ def get_last_etf_cluster_sync_info() -> Optional[SyncMetadata]:
         cache_db.close()
 
 
-def sync_etf_cluster_data_from_remote() -> dict:
+@single_flight('etf_cluster')
+@record_sync_run('etf_cluster')
+def sync_etf_cluster_data_from_remote(full: bool = False) -> dict:
     """
     从远程MySQL同步ETF聚类选股数据到本地SQLite缓存
+    full=True 时（强制全量同步）持有同步锁后先清除本数据集的同步元数据（水位线），再执行全量同步
     """
     result = {
         'success': False,
@@ -47,16 +55,26 @@ def sync_etf_cluster_data_from_remote() -> dict:
 
     remote_db = RemoteSessionLocal()
     cache_db = CacheSessionLocal()
+    shadow_table = None
 
     try:
         logger.info("开始同步ETF聚类选股数据...")
+        start_progress('etf_cluster')
+
+        if full:
+            cache_db.query(SyncMetadata)\
+                .filter(SyncMetadata.sync_status.in_(['etf_cluster_success', 'etf_cluster_failed']))\
+                .delete(synchronize_session=False)
+            cache_db.commit()
+            logger.info("已清除etf_cluster同步元数据，执行全量同步")
 
         last_sync = get_last_etf_cluster_sync_info()
 
         # 获取远程最新的update_date
-        latest_remote_date = remote_db.query(
-            EtfClusterSelection.update_date
-        ).order_by(desc(EtfClusterSelection.update_date)).first()
+        with timed_phase('etf_cluster', 'remote_query'):
+            latest_remote_date = remote_db.query(
+                EtfClusterSelection.update_date
+            ).order_by(desc(EtfClusterSelection.update_date)).first()
 
         if not latest_remote_date or not latest_remote_date[0]:
             logger.info("远程没有ETF聚类选股数据")
@@ -65,6 +83,7 @@ def sync_etf_cluster_data_from_remote() -> dict:
                 'record_count': 0,
                 'last_sync_time': None
             })
+            update_progress('etf_cluster', phase='done')
             return result
 
         latest_remote_date_str = latest_remote_date[0].strftime('%Y-%m-%d')
@@ -80,16 +99,47 @@ def sync_etf_cluster_data_from_remote() -> dict:
                     'sync_type': 'none',
                     'last_sync_time': last_sync.last_sync_time
                 })
+                update_progress('etf_cluster', phase='done')
                 return result
 
         logger.info(f"执行ETF聚类选股数据同步，最新日期: {latest_remote_date_str}")
 
         # 查询最新日期的数据
-        remote_data = remote_db.query(EtfClusterSelection)\
-            .filter(EtfClusterSelection.update_date == latest_remote_date[0])\
-            .all()
-
-        record_count = len(remote_data)
+        query = remote_db.query(EtfClusterSelection)\
+            .filter(EtfClusterSelection.update_date == latest_remote_date[0])
+
+        record_count = 0
+        write_stats = None
+
+        for chunk in iter_query_chunks(query, dataset='etf_cluster'):
+            if record_count == 0:
+                # ETF聚类数据按日期完全替换：写入影子表，完成后整表替换
+                shadow_table = create_shadow_table(cache_engine, EtfClusterSelectionCache.__table__)
+
+            record_count += len(chunk)
+            with timed_phase('etf_cluster', 'transform'):
+                cache_rows = [
+                    {
+                        'fund_code': remote_item.fund_code,
+                        'fund_name': remote_item.fund_name,
+                        'cluster_name': remote_item.cluster_name,
+                        'update_date': remote_item.update_date.strftime('%Y-%m-%d') if remote_item.update_date else None,
+                        'rank': remote_item.rank,
+                        'score': remote_item.score,
+                        'created_at': remote_item.created_at
+                    }
+                    for remote_item in chunk
+                ]
+
+            with timed_phase('etf_cluster', 'cache_write'):
+                write_stats = bulk_upsert(
+                    cache_db.connection(),
+                    shadow_table,
+                    cache_rows,
+                    stats=write_stats
+                )
+            with timed_phase('etf_cluster', 'commit'):
+                cache_db.commit()
 
         if record_count == 0:
             logger.info("最新日期没有ETF聚类选股数据")
@@ -98,29 +148,18 @@ def sync_etf_cluster_data_from_remote() -> dict:
                 'record_count': 0,
                 'last_sync_time': latest_remote_date_str
             })
+            update_progress('etf_cluster', phase='done')
             return result
 
         logger.info(f"从远程获取到 {record_count} 条ETF聚类选股记录")
+        update_progress('etf_cluster', phase='finalizing')
 
-        # 清空缓存并重新同步（ETF聚类数据按日期完全替换）
-        cache_db.query(EtfClusterSelectionCache).delete()
-
-        for remote_item in remote_data:
-            cache_item = EtfClusterSelectionCache(
-                fund_code=remote_item.fund_code,
-                fund_name=remote_item.fund_name,
-                cluster_name=remote_item.cluster_name,
-                update_date=remote_item.update_date.strftime('%Y-%m-%d') if remote_item.update_date else None,
-                rank=remote_item.rank,
-                score=remote_item.score,
-                created_at=remote_item.created_at
-            )
-            cache_db.add(cache_item)
-            logger.debug(f"新增ETF聚类记录: {remote_item.fund_code} - {remote_item.cluster_name} - Rank {remote_item.rank}")
-
-        cache_db.commit()
+        with timed_phase('etf_cluster', 'commit'):
+            result['swap_ms'] = swap_shadow_table(cache_engine, EtfClusterSelectionCache.__table__, shadow_table)
+        shadow_table = None
 
-        total_count = cache_db.query(EtfClusterSelectionCache).count()
+        with timed_phase('etf_cluster', 'post_sync_counts'):
+            total_count = cache_db.query(EtfClusterSelectionCache).count()
 
         sync_metadata = SyncMetadata(
             last_sync_time=datetime.now().isoformat(),
@@ -130,18 +169,27 @@ def sync_etf_cluster_data_from_remote() -> dict:
             remote_max_update_time=latest_remote_date_str
         )
         cache_db.add(sync_metadata)
-        cache_db.commit()
+        with timed_phase('etf_cluster', 'commit'):
+            cache_db.commit()
+
+        bump_generation('etf_cluster')
 
         logger.info(f"ETF聚类选股数据同步成功！本地缓存共 {total_count} 条记录")
+        update_progress('etf_cluster', phase='done')
 
         result.update({
             'success': True,
             'record_count': total_count,
-            'last_sync_time': datetime.now()
+            'last_sync_time': datetime.now(),
+            'remote_bytes': get_remote_bytes('etf_cluster'),
+            'peak_rss_mb': get_peak_rss_mb()
         })
+        result.update(write_stats)
 
     except Exception as e:
         cache_db.rollback()
+        drop_shadow_table(cache_engine, shadow_table)
+        update_progress('etf_cluster', phase='failed')
         logger.error(f"ETF聚类选股数据同步失败: {e}")
 
         sync_metadata = SyncMetadata(
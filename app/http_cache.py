@@ -0,0 +1,91 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional
+from fastapi import Request, Response
+from app.cache_generation import get_generation_info
+
+# 浏览器缓存的最长有效期（秒）：手动触发的同步随时可能发生，有效期过后需要重新验证
+CACHE_MAX_AGE_SECONDS = 300
+
+
+def _next_sync_seconds() -> Optional[int]:
+    """距离下一次定时同步的秒数，调度器未运行时返回 None"""
+    from app.sync_scheduler import get_scheduler_status
+
+    status = get_scheduler_status()
+    if not status['running']:
+        return None
+    next_runs = [
+        datetime.fromisoformat(job['next_run_time'])
+        for job in status['jobs']
+        if job['next_run_time']
+    ]
+    if not next_runs:
+        return None
+    next_run = min(next_runs)
+    return max(int((next_run - datetime.now(next_run.tzinfo)).total_seconds()), 0)
+
+
+def cache_control_header() -> str:
+    """Cache-Control：有效期不超过下一次定时同步，也不超过 CACHE_MAX_AGE_SECONDS；调度器未运行时每次重新验证"""
+    seconds = _next_sync_seconds()
+    if seconds is None:
+        return 'no-cache'
+    return f'public, max-age={min(seconds, CACHE_MAX_AGE_SECONDS)}, must-revalidate'
+
+
+def cache_headers(*datasets: str) -> Dict[str, str]:
+    """
+    按数据集版本号生成缓存响应头：
+    - ETag: 由数据集 (版本号, 变化时间) 计算，同步提交数据变化后才会改变
+    - Last-Modified: 数据集最近一次数据变化的时间
+    - Cache-Control: 有效期不超过下一次定时同步，也不超过 CACHE_MAX_AGE_SECONDS
+    """
+    versions = [(dataset,) + get_generation_info(dataset) for dataset in datasets]
+    digest = hashlib.sha1(repr(versions).encode('utf-8')).hexdigest()[:16]
+    headers = {'ETag': f'W/"{digest}"'}
+
+    updated_times = [
+        datetime.fromisoformat(updated_at).astimezone(timezone.utc)
+        for _, _, updated_at in versions
+        if updated_at
+    ]
+    if updated_times:
+        headers['Last-Modified'] = format_datetime(max(updated_times).replace(microsecond=0), usegmt=True)
+
+    headers['Cache-Control'] = cache_control_header()
+    return headers
+
+
+def representation_headers(headers: Dict[str, str], vary: str, variant: Optional[str] = None) -> Dict[str, str]:
+    """
+    同一 URL 按请求头协商多种表示时：添加 Vary，非默认表示的 ETag 追加后缀，避免不同格式的缓存互相命中
+    """
+    headers = dict(headers, Vary=vary)
+    if variant:
+        headers['ETag'] = headers['ETag'][:-1] + f'-{variant}"'
+    return headers
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match 按弱比较匹配（忽略 W/ 前缀）"""
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or any(tag.replace('W/', '', 1) == etag.replace('W/', '', 1) for tag in tags)
+
+
+def not_modified_response(request: Request, headers: Dict[str, str]) -> Optional[Response]:
+    """客户端缓存仍然有效时返回 304 响应（不查询数据、不序列化），否则返回 None"""
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        matched = _etag_matches(if_none_match, headers['ETag'])
+    else:
+        # 只有没有 If-None-Match 时才使用 If-Modified-Since
+        matched = False
+        if_modified_since = request.headers.get('if-modified-since')
+        if if_modified_since and 'Last-Modified' in headers:
+            try:
+                matched = parsedate_to_datetime(if_modified_since) >= parsedate_to_datetime(headers['Last-Modified'])
+            except (TypeError, ValueError):
+                matched = False
+    return Response(status_code=304, headers=headers) if matched else None
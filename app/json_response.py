@@ -0,0 +1,94 @@
+import json
+from typing import Any
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # 未安装 orjson 时使用标准库 json
+    orjson = None
+
+
+class RawJSON(str):
+    """已序列化好的 JSON 片段，生成响应时原样拼接，不再解析和重新序列化"""
+
+
+def _dumps_value(obj: Any) -> str:
+    """序列化不含 RawJSON 片段的值；日期时间等类型按 str() 输出，与标准库 json 的结果一致"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=str, option=orjson.OPT_PASSTHROUGH_DATETIME).decode('utf-8')
+        except TypeError:
+            # 超出 64 位的整数、非字符串键等 orjson 不支持的值交给标准库处理
+            pass
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(',', ':'), default=str)
+
+
+def _orjson_default(obj: Any) -> Any:
+    """
+    orjson 不直接处理的值：RawJSON 片段原样嵌入，其余子类转为基础类型，其他类型按 str() 输出
+    orjson < 3.9 不支持嵌入片段，遇到 RawJSON 时抛出 TypeError，由调用方逐层拼接
+    """
+    if isinstance(obj, RawJSON):
+        if not hasattr(orjson, 'Fragment'):
+            raise TypeError('RawJSON')
+        return orjson.Fragment(obj)
+    if isinstance(obj, str):
+        return str.__str__(obj)
+    if isinstance(obj, dict):
+        return dict(obj)
+    if isinstance(obj, (list, tuple)):
+        return list(obj)
+    if isinstance(obj, (int, float)):
+        return float(obj) if isinstance(obj, float) else int(obj)
+    return str(obj)
+
+
+# 需要逐项处理的元素：容器和预序列化片段
+_NESTED_TYPES = (dict, list, tuple, RawJSON)
+
+
+def _dumps_tree(obj: Any) -> str:
+    if isinstance(obj, RawJSON):
+        return obj
+    if isinstance(obj, dict):
+        return '{' + ','.join(
+            f'{_dumps_value(str(key))}:{_dumps_tree(value)}' for key, value in obj.items()
+        ) + '}'
+    if isinstance(obj, (list, tuple)):
+        # 只含标量的数组（如热力图矩阵的行）整体序列化
+        if not any(isinstance(item, _NESTED_TYPES) for item in obj):
+            return _dumps_value(list(obj))
+        return '[' + ','.join(_dumps_tree(item) for item in obj) + ']'
+    return _dumps_value(obj)
+
+
+def dumps(obj: Any) -> str:
+    """序列化为紧凑 JSON，遇到 RawJSON 片段直接拼接"""
+    if orjson is not None:
+        # 整棵对象树一次序列化（orjson >= 3.9 可嵌入 RawJSON 片段）
+        try:
+            return orjson.dumps(
+                obj,
+                default=_orjson_default,
+                option=orjson.OPT_PASSTHROUGH_SUBCLASS | orjson.OPT_PASSTHROUGH_DATETIME
+            ).decode('utf-8')
+        except TypeError:
+            pass
+    return _dumps_tree(obj)
+
+
+def fragment(obj: Any) -> RawJSON:
+    """预序列化为 RawJSON 片段（按数据版本缓存，之后的请求直接拼接）"""
+    return RawJSON(dumps(obj))
+
+
+class FragmentJSONResponse(JSONResponse):
+    """
+    支持 RawJSON 片段的 JSON 响应：预序列化的片段原样输出，其余字段正常序列化
+    content 为 bytes 时视为已序列化好的完整响应体，直接输出
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content).encode('utf-8')
@@ -1,9 +1,10 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, HTTPException, Query
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 from app.routers import screening, market_breadth, fund_analysis
+from app.compression import PrecompressedResponseMiddleware
 from app.config import settings
 from app.data_sync import init_cache_db, sync_data_from_remote, get_sync_status
 from app.sync_scheduler import init_scheduler, shutdown_scheduler, get_scheduler_status
@@ -19,6 +20,14 @@ app = FastAPI(
     version="2.0.0"
 )
 
+base_dir = os.path.dirname(os.path.abspath(__file__))
+static_dir = os.path.join(base_dir, "static")
+templates_dir = os.path.join(static_dir, "templates")
+
+# 预压缩：可缓存的 API 响应和静态 JS/CSS 按数据版本/文件版本缓存 gzip、brotli 压缩结果
+# （先注册，位于 CORS 内层，CORS 响应头按每个请求添加）
+app.add_middleware(PrecompressedResponseMiddleware, static_dir=static_dir)
+
 # 配置 CORS
 app.add_middleware(
     CORSMiddleware,
@@ -32,10 +41,6 @@ app.include_router(screening.router, prefix="/api")
 app.include_router(market_breadth.router, prefix="/api")
 app.include_router(fund_analysis.router, prefix="/api")
 
-base_dir = os.path.dirname(os.path.abspath(__file__))
-static_dir = os.path.join(base_dir, "static")
-templates_dir = os.path.join(static_dir, "templates")
-
 app.mount("/static", StaticFiles(directory=static_dir), name="static")
 templates = Jinja2Templates(directory=templates_dir)
 
@@ -71,6 +76,10 @@ async def startup_event():
             else:
                 logger.warning(f"首次同步失败: {result.get('error', 'Unknown error')}")
 
+        # 后台建立选股内存索引，建好之前选股查询使用SQLite
+        from app.screening_index import schedule_screening_index_rebuild
+        schedule_screening_index_rebuild()
+
         logger.info("应用启动完成！")
 
     except Exception as e:
@@ -130,12 +139,15 @@ async def health_check():
 
 
 @app.get("/api/sync/status", summary="获取同步状态")
-async def get_sync_status_api():
-    """获取数据同步状态"""
+async def get_sync_status_api(history: int = Query(10, ge=0, le=100, description="返回最近几次同步的耗时趋势，0表示不返回")):
+    """
+    获取数据同步状态
+    - sync.history: 各数据集最近几次同步的总耗时、处理速度、传输量序列及各阶段平均耗时
+    """
     from app.data_sync import get_sync_status
     from app.sync_scheduler import get_scheduler_status
     try:
-        sync_status = get_sync_status()
+        sync_status = get_sync_status(history_runs=history)
         scheduler_status = get_scheduler_status()
         return {
             "sync": sync_status,
@@ -145,28 +157,36 @@ async def get_sync_status_api():
         return {"error": str(e)}
 
 
-@app.post("/api/sync/trigger", summary="手动触发数据同步")
+@app.post("/api/sync/trigger", status_code=202, summary="手动触发数据同步")
 async def trigger_sync(force: bool = False):
     """
-    手动触发数据同步
+    手动触发数据同步（后台执行，立即返回任务ID）
     - force=False: 增量同步（仅同步新增/更新的数据）
     - force=True: 强制全量同步（清除缓存，重新同步所有数据）
+    - 已有同步任务在运行时合并到该任务，返回 coalesced=true
+    - 通过 GET /api/sync/jobs/{job_id} 查询进度和结果
     """
     from app.data_sync import sync_data_from_remote, force_full_sync
-    try:
-        logger.info(f"收到手动同步请求，force={force}")
-        if force:
-            result = force_full_sync()
-        else:
-            result = sync_data_from_remote()
-        return result
-    except Exception as e:
-        logger.error(f"手动同步失败: {e}")
-        return {
-            "success": False,
-            "error": str(e),
-            "sync_type": "full" if force else "incremental"
-        }
+    from app.sync_jobs import submit_sync_job
+    logger.info(f"收到手动同步请求，force={force}")
+    return submit_sync_job('all', force_full_sync if force else sync_data_from_remote, force=force)
+
+
+@app.get("/api/sync/jobs/{job_id}", summary="查询后台同步任务进度")
+async def get_sync_job(job_id: str):
+    """
+    查询后台同步任务状态
+    - phase: 当前阶段（各数据集的 remote_query/transfer/finalizing 等）
+    - rows_processed / rows_total: 已处理行数 / 总行数
+    - rows_per_sec: 处理速度（行/秒）
+    - eta_seconds: 预计剩余时间（秒）
+    - result: 任务完成后的同步结果
+    """
+    from app.sync_jobs import get_job_status
+    job = get_job_status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="同步任务不存在")
+    return job
 
 
 if __name__ == "__main__":
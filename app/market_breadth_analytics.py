@@ -0,0 +1,267 @@
+import logging
+import time
+from typing import Dict, List, Optional, Sequence
+from app.market_breadth_matrix import MarketBreadthMatrix
+
+try:
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+except ImportError:  # 未安装 numpy 时不提供分析接口
+    np = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 全市场序列（其余序列为行业名称）
+MARKET_SERIES = ('market_breadth', 'total_breadth')
+ANALYTICS_STATS = ('ma', 'zscore', 'percentile', 'thrust')
+DEFAULT_SERIES = MARKET_SERIES
+
+# 宽度推力（Zweig Breadth Thrust）：比例的 10 日 EMA 在 10 个交易日内从 40% 以下升至 61.5% 以上
+THRUST_EMA_SPAN = 10
+THRUST_LOW = 40.0
+THRUST_HIGH = 61.5
+THRUST_DAYS = 10
+
+# 相关系数至少需要的共同交易日数，不足时为 null
+CORRELATION_MIN_PERIODS = 10
+MAX_CORRELATION_LAG = 10
+
+# 百分位按行分块比较时每块最多比较的元素数（交易日 × 序列 × history），限制临时数组的内存
+PERCENTILE_CHUNK_ELEMENTS = 1 << 22
+
+
+def _trailing_sums(values: "np.ndarray", window: int) -> "np.ndarray":
+    """各行向前 window 行（含当前行）的列和，前 window-1 行按已有的行求和"""
+    cumsum = np.cumsum(values, axis=0)
+    sums = cumsum.copy()
+    sums[window:] -= cumsum[:-window]
+    return sums
+
+
+def rolling_mean_std(values: "np.ndarray", window: int):
+    """滚动均值和标准差（总体标准差）；窗口内有缺失值（NaN）时结果为 NaN"""
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+    counts = _trailing_sums(valid.astype(np.int64), window)
+    sums = _trailing_sums(filled, window)
+    squares = _trailing_sums(filled * filled, window)
+
+    full = counts == window
+    mean = np.full(values.shape, np.nan)
+    std = np.full(values.shape, np.nan)
+    mean[full] = sums[full] / window
+    # 浮点误差可能使方差略小于 0
+    std[full] = np.sqrt(np.maximum(squares[full] / window - mean[full] ** 2, 0.0))
+    return mean, std
+
+
+def rolling_percentile(values: "np.ndarray", history: int, min_periods: int) -> "np.ndarray":
+    """
+    当前值在向前 history 个交易日（含当日）中的百分位（0-100），有效值少于 min_periods 时为 NaN
+    按行分块与滑动窗口视图比较，临时数组不超过 PERCENTILE_CHUNK_ELEMENTS 个元素（不随交易日数 × history 增长）
+    """
+    padded = np.vstack([np.full((history - 1, values.shape[1]), np.nan), values])
+    windows = sliding_window_view(padded, history, axis=0)  # (交易日, 序列, history)，不复制数据
+    counts = _trailing_sums((~np.isnan(values)).astype(np.int64), history)
+    below = np.empty(values.shape, dtype=np.int64)
+    step = max(1, PERCENTILE_CHUNK_ELEMENTS // max(1, values.shape[1] * history))
+    for start in range(0, values.shape[0], step):
+        end = start + step
+        below[start:end] = np.count_nonzero(windows[start:end] <= values[start:end, :, None], axis=-1)
+
+    result = np.full(values.shape, np.nan)
+    ok = (counts >= min_periods) & ~np.isnan(values)
+    result[ok] = below[ok] * 100.0 / counts[ok]
+    return result
+
+
+def exponential_average(values: "np.ndarray", span: int) -> "np.ndarray":
+    """指数移动平均（alpha = 2/(span+1)），按交易日递推、各序列同时计算；缺失值沿用上一日结果"""
+    alpha = 2.0 / (span + 1)
+    result = np.full(values.shape, np.nan)
+    current = np.full(values.shape[1], np.nan)
+    for row in range(values.shape[0]):
+        value = values[row]
+        current = np.where(np.isnan(current), value, np.where(np.isnan(value), current, current + alpha * (value - current)))
+        result[row] = current
+    return result
+
+
+def thrust_signals(ema: "np.ndarray", low: float = THRUST_LOW, high: float = THRUST_HIGH, days: int = THRUST_DAYS) -> "np.ndarray":
+    """宽度推力信号：EMA 当日上穿 high，且最近 days 个交易日内曾低于 low"""
+    previous = np.vstack([np.full((1, ema.shape[1]), np.nan), ema[:-1]])
+    crossed = (ema >= high) & (previous < high)
+    padded = np.vstack([np.full((days, ema.shape[1]), np.inf), np.where(np.isnan(ema), np.inf, ema)])
+    recent_min = sliding_window_view(padded, days + 1, axis=0).min(axis=-1)
+    return crossed & (recent_min < low)
+
+
+def pairwise_correlation(a: "np.ndarray", b: "np.ndarray", min_periods: int = CORRELATION_MIN_PERIODS) -> "np.ndarray":
+    """
+    a 的各列与 b 的各列两两之间的 Pearson 相关系数（行数相同，缺失值为 NaN，按两列都有数据的行计算）
+    全部由矩阵乘法得到：结果 [i, j] 为 corr(a[:, i], b[:, j])
+    """
+    valid_a = (~np.isnan(a)).astype(np.float64)
+    valid_b = (~np.isnan(b)).astype(np.float64)
+    xa = np.where(valid_a > 0, a, 0.0)
+    xb = np.where(valid_b > 0, b, 0.0)
+
+    counts = valid_a.T @ valid_b
+    sum_a = xa.T @ valid_b
+    sum_b = valid_a.T @ xb
+    sum_aa = (xa * xa).T @ valid_b
+    sum_bb = valid_a.T @ (xb * xb)
+    sum_ab = xa.T @ xb
+
+    covariance = counts * sum_ab - sum_a * sum_b
+    variance = (counts * sum_aa - sum_a ** 2) * (counts * sum_bb - sum_b ** 2)
+    result = np.full(counts.shape, np.nan)
+    ok = (counts >= min_periods) & (variance > 0)
+    result[ok] = np.clip(covariance[ok] / np.sqrt(variance[ok]), -1.0, 1.0)
+    return result
+
+
+def _nullable(values: "np.ndarray", decimals: int) -> list:
+    """NaN 转为 null，其余保留指定小数位（支持一维和二维数组）"""
+    if values.ndim > 1:
+        return [_nullable(row, decimals) for row in values]
+    missing = np.isnan(values).tolist()
+    return [None if is_missing else value for value, is_missing in zip(np.round(values, decimals).tolist(), missing)]
+
+
+def industry_correlation(
+    matrix: MarketBreadthMatrix,
+    start: int,
+    end: int,
+    industries: Optional[Sequence[str]],
+    max_lag: int
+) -> dict:
+    """
+    行 [start, end) 内各行业比例的相关系数矩阵和领先/滞后相关
+    - correlation[i][j]: 同日相关系数
+    - lagged[k][i][j]: 行业 i 第 t 日与行业 j 第 t+lags[k] 日的相关系数（i 领先 j）
+    - best_lag[i][j] / best_correlation[i][j]: -max_lag..max_lag 中相关系数最高的偏移（正数表示 i 领先 j）
+    """
+    start_time = time.perf_counter()
+    selected = set(industries) if industries else None
+    present = matrix.presence[start:end].any(axis=0)
+    column_indexes = [
+        i for i, name in enumerate(matrix.industries)
+        if present[i] and (selected is None or name in selected)
+    ]
+    columns = [matrix.industries[i] for i in column_indexes]
+    values = np.where(
+        matrix.presence[start:end, column_indexes],
+        matrix.values[start:end, column_indexes].astype(np.float64),
+        np.nan
+    )
+
+    correlation = pairwise_correlation(values, values)
+    lags = [lag for lag in range(1, max_lag + 1) if lag < values.shape[0]]
+    lagged = [pairwise_correlation(values[:-lag], values[lag:]) for lag in lags]
+
+    # 候选偏移依次为 0, +1..+L, -1..-L；corr(i 滞后 L, j) 即 lag L 矩阵的转置
+    candidates = np.stack([correlation] + lagged + [m.T for m in lagged]) if columns else np.empty((1, 0, 0))
+    offsets = np.array([0] + lags + [-lag for lag in lags])
+    filled = np.where(np.isnan(candidates), -np.inf, candidates)
+    best = filled.argmax(axis=0)
+    best_correlation = np.take_along_axis(candidates, best[None], axis=0)[0]
+    best_lag = np.where(np.isnan(best_correlation), 0, offsets[best])
+
+    logger.info(
+        f"行业相关性已计算：{values.shape[0]} 个交易日 × {len(columns)} 个行业，偏移 ±{len(lags)}，"
+        f"耗时 {round((time.perf_counter() - start_time) * 1000, 1)}ms"
+    )
+    return {
+        'columns': columns,
+        'start_date': matrix.dates[start],
+        'end_date': matrix.dates[end - 1],
+        'trading_days': end - start,
+        'sync_token': matrix.sync_token,
+        'correlation': _nullable(correlation, 3),
+        'lags': lags,
+        'lagged': [_nullable(m, 3) for m in lagged],
+        'best_lag': best_lag.astype(int).tolist(),
+        'best_correlation': _nullable(best_correlation, 3)
+    }
+
+
+class MarketBreadthAnalytics:
+    """
+    市场宽度滚动统计（按窗口参数和数据版本缓存）
+    在完整历史上计算（日期范围只截取输出，起始日附近的窗口也使用更早的数据），各序列同时向量化计算：
+    - ma / zscore: window 日滚动均值和 z-score
+    - percentile: 当前值在最近 history 个交易日中的百分位
+    - thrust: 比例的 10 日 EMA 与宽度推力信号日（total_breadth 是比例之和，不计算）
+    """
+
+    def __init__(self, matrix: MarketBreadthMatrix, window: int, history: int):
+        start_time = time.perf_counter()
+        self.matrix = matrix
+        self.window = window
+        self.history = history
+        self.series = list(MARKET_SERIES) + list(matrix.industries)
+        self.positions = {name: i for i, name in enumerate(self.series)}
+
+        industries = np.where(matrix.presence, matrix.values.astype(np.float64), np.nan)
+        values = np.column_stack([
+            matrix.market_breadth.astype(np.float64),
+            matrix.total_breadth.astype(np.float64),
+            industries
+        ]) if len(matrix.trade_dates) else np.empty((0, len(self.series)))
+        self.values = values
+
+        self.ma, std = rolling_mean_std(values, window)
+        self.zscore = np.full(values.shape, np.nan)
+        np.divide(values - self.ma, std, out=self.zscore, where=std > 0)
+        self.percentile = rolling_percentile(values, history, min(window, history))
+        self.ema = exponential_average(values, THRUST_EMA_SPAN)
+        self.thrust = thrust_signals(self.ema)
+        # total_breadth 不是比例
+        self.ema[:, self.positions['total_breadth']] = np.nan
+        self.thrust[:, self.positions['total_breadth']] = False
+
+        logger.info(
+            f"市场宽度滚动统计已计算：{values.shape[0]} 个交易日 × {values.shape[1]} 个序列，"
+            f"窗口 {window}/{history}，耗时 {round((time.perf_counter() - start_time) * 1000, 1)}ms"
+        )
+
+    def unknown_series(self, names: Sequence[str]) -> List[str]:
+        return [name for name in names if name not in self.positions]
+
+    def query(
+        self,
+        series: Sequence[str],
+        stats: Sequence[str],
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None
+    ) -> Optional[dict]:
+        """只返回请求的序列和统计量；日期范围内没有数据时返回 None"""
+        start, end = self.matrix.row_range(start_date, end_date)
+        if start >= end:
+            return None
+
+        dates = self.matrix.dates[start:end]
+        result: Dict[str, dict] = {}
+        for name in series:
+            column = self.positions[name]
+            item = {'value': _nullable(self.values[start:end, column], 2)}
+            if 'ma' in stats:
+                item['ma'] = _nullable(self.ma[start:end, column], 2)
+            if 'zscore' in stats:
+                item['zscore'] = _nullable(self.zscore[start:end, column], 3)
+            if 'percentile' in stats:
+                item['percentile'] = _nullable(self.percentile[start:end, column], 1)
+            if 'thrust' in stats and name != 'total_breadth':
+                item['ema'] = _nullable(self.ema[start:end, column], 2)
+                item['thrust_dates'] = [dates[i] for i in np.flatnonzero(self.thrust[start:end, column])]
+            result[name] = item
+
+        return {
+            'window': self.window,
+            'history': self.history,
+            'sync_token': self.matrix.sync_token,
+            'dates': dates,
+            'series': result
+        }
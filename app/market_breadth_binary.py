@@ -0,0 +1,75 @@
+import json
+import struct
+from datetime import date
+from typing import Optional
+from app.market_breadth_matrix import smallest_int_dtype
+
+try:
+    import numpy as np
+except ImportError:  # 未安装 numpy 时只返回 JSON
+    np = None
+
+# 市场宽度热力图的紧凑二进制格式（请求头 Accept 包含该类型时返回）
+MARKET_BREADTH_MEDIA_TYPE = 'application/vnd.market-breadth+octet-stream'
+
+# 文件头：魔数、格式版本、交易日数、列数、首个交易日（距 1970-01-01 的天数）、元数据长度
+# 之后依次为：元数据 JSON（UTF-8，补齐到 8 字节）、各交易日相对首日的天数（int32，缺失日期为 MISSING_DAY）、
+# 比例矩阵（按行存储）、全市场上涨家数；数组均为小端序，起始位置按 8 字节对齐，前端可直接构造 TypedArray
+HEADER = struct.Struct('<4sHxxIIiI')
+MAGIC = b'MBH1'
+VERSION = 1
+# 交易日期为空的行（JSON 格式中为 null）的天数偏移
+MISSING_DAY = -2 ** 31
+
+_EPOCH = date(1970, 1, 1)
+
+
+def wants_binary(accept: Optional[str]) -> bool:
+    """请求是否接受二进制格式（未安装 numpy 时总是返回 JSON）"""
+    return np is not None and bool(accept) and MARKET_BREADTH_MEDIA_TYPE in accept
+
+
+def _pad(buffer: bytearray):
+    buffer.extend(b'\0' * (-len(buffer) % 8))
+
+
+def _int_array(values, default_dtype: str) -> "np.ndarray":
+    """转为能容纳全部取值的最小小端整数数组"""
+    array = np.asarray(values, dtype=np.int64)
+    if array.size == 0:
+        return array.astype(default_dtype)
+    return array.astype(smallest_int_dtype(array))
+
+
+def encode_market_breadth(payload: dict) -> bytes:
+    """
+    把 get_market_breadth_data / get_market_breadth_delta 的结果编码为二进制
+    dates/data/total_breadth_data 编码为定长数组，其余字段（columns、statistics、sync_token 等）放在元数据 JSON 中
+    """
+    dates = payload['dates']
+    columns = payload['columns']
+    known_days = [(date.fromisoformat(day) - _EPOCH).days for day in dates if day]
+    base_day = known_days[0] if known_days else 0
+    offsets = iter(known_days)
+    days = np.array([next(offsets) - base_day if day else MISSING_DAY for day in dates], dtype=np.int64)
+
+    values = _int_array(payload['data'], '<i1').reshape(len(dates), len(columns))
+    total_breadth = _int_array(payload['total_breadth_data'], '<i4')
+    if total_breadth.dtype == np.dtype('<i8'):
+        # JavaScript 没有便捷的 64 位整数数组，超出 int32 时用 float64（整数精确到 2^53）
+        total_breadth = total_breadth.astype('<f8')
+
+    meta = {key: value for key, value in payload.items() if key not in ('dates', 'data', 'total_breadth_data')}
+    meta['value_dtype'] = values.dtype.str
+    meta['total_dtype'] = total_breadth.dtype.str
+    meta_bytes = json.dumps(meta, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+
+    buffer = bytearray(HEADER.pack(MAGIC, VERSION, len(dates), len(columns), base_day, len(meta_bytes)))
+    buffer.extend(meta_bytes)
+    _pad(buffer)
+    buffer.extend(days.astype('<i4').tobytes())
+    _pad(buffer)
+    buffer.extend(values.tobytes())
+    _pad(buffer)
+    buffer.extend(total_breadth.tobytes())
+    return bytes(buffer)
@@ -0,0 +1,119 @@
+import json
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.engine import Connection
+from app.cache_database import engine as cache_engine
+from app.models import MarketBreadthMetricsCache, MarketBreadthIndustryCache
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 行业名称 -> [首次出现日期, 最近出现日期]
+IndustrySpans = Dict[str, List[str]]
+
+
+def _trade_day(trade_date) -> str:
+    """交易日期（远程为 datetime，缓存表为文本）统一为 YYYY-MM-DD"""
+    text = trade_date.isoformat() if hasattr(trade_date, 'isoformat') else str(trade_date)
+    return text.replace('T', ' ').split(' ')[0]
+
+
+def collect_industry_spans(rows: Iterable[Tuple[object, Optional[str]]], spans: Optional[IndustrySpans] = None) -> IndustrySpans:
+    """从 (trade_date, industries_data) 记录中统计各行业出现的日期范围，可在已有统计上累加"""
+    if spans is None:
+        spans = {}
+    for trade_date, industries_data in rows:
+        if not industries_data:
+            continue
+        try:
+            industries_dict = json.loads(industries_data)
+        except (json.JSONDecodeError, TypeError):
+            continue
+        if not isinstance(industries_dict, dict):
+            continue
+        day = _trade_day(trade_date)
+        for name in industries_dict:
+            span = spans.get(name)
+            if span is None:
+                spans[name] = [day, day]
+            else:
+                span[0] = min(span[0], day)
+                span[1] = max(span[1], day)
+    return spans
+
+
+def merge_industry_spans(target: IndustrySpans, spans: IndustrySpans) -> IndustrySpans:
+    """把一批统计结果合并到累计结果中"""
+    for name, (first, last) in spans.items():
+        span = target.get(name)
+        if span is None:
+            target[name] = [first, last]
+        else:
+            span[0] = min(span[0], first)
+            span[1] = max(span[1], last)
+    return target
+
+
+def upsert_industry_spans(conn: Connection, spans: IndustrySpans):
+    """
+    增量同步：新行业分配ID，已有行业只扩展首次/最近出现日期
+    已有行业不走 INSERT ... ON CONFLICT，避免 AUTOINCREMENT 序号被冲突的插入消耗
+    """
+    if not spans:
+        return
+    table = MarketBreadthIndustryCache.__table__
+    existing = set(conn.execute(select(table.c.name).where(table.c.name.in_(list(spans)))).scalars())
+
+    for name in existing:
+        first, last = spans[name]
+        conn.execute(
+            update(table).where(table.c.name == name).values(
+                first_seen_date=func.min(table.c.first_seen_date, first),
+                last_seen_date=func.max(table.c.last_seen_date, last)
+            )
+        )
+    new_rows = [
+        {'name': name, 'first_seen_date': first, 'last_seen_date': last}
+        for name, (first, last) in spans.items()
+        if name not in existing
+    ]
+    if new_rows:
+        conn.execute(table.insert(), new_rows)
+
+
+def reconcile_industry_spans(conn: Connection, spans: IndustrySpans):
+    """全量同步完成后按本次数据校准维表：日期范围取精确值，不再出现的行业删除（保留行业ID不变）"""
+    table = MarketBreadthIndustryCache.__table__
+    upsert_industry_spans(conn, spans)
+    for name, (first, last) in spans.items():
+        conn.execute(
+            update(table).where(table.c.name == name).values(first_seen_date=first, last_seen_date=last)
+        )
+    conn.execute(delete(table).where(table.c.name.not_in(list(spans))))
+
+
+def backfill_market_breadth_industries() -> int:
+    """旧版本缓存没有行业维表，启动时从已缓存的市场宽度数据一次性生成；返回行业数量"""
+    table = MarketBreadthIndustryCache.__table__
+    metrics = MarketBreadthMetricsCache.__table__
+    with cache_engine.begin() as conn:
+        if conn.execute(select(func.count()).select_from(table)).scalar():
+            return 0
+        spans = collect_industry_spans(
+            conn.execute(select(metrics.c.trade_date, metrics.c.industries_data)).all()
+        )
+        # 按名称顺序分配ID
+        upsert_industry_spans(conn, dict(sorted(spans.items())))
+
+    if spans:
+        logger.info(f"已从市场宽度缓存生成行业维表，共 {len(spans)} 个行业")
+    return len(spans)
+
+
+def get_industry_dimension() -> List[dict]:
+    """行业维表全部记录（按名称排序）"""
+    table = MarketBreadthIndustryCache.__table__
+    with cache_engine.connect() as conn:
+        rows = conn.execute(select(table).order_by(table.c.name)).mappings().all()
+    return [dict(row) for row in rows]
@@ -0,0 +1,400 @@
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+from sqlalchemy import delete, select
+from app.cache_database import engine as cache_engine
+from app.cache_generation import get_generation
+from app.models import MarketBreadthMetricsCache, MarketBreadthMatrixCache
+
+try:
+    import numpy as np
+except ImportError:  # 未安装 numpy 时市场宽度接口直接解析缓存表
+    np = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MATRIX_ROW_ID = 1
+
+
+def breadth_cell_value(value: Any) -> int:
+    """行业比例取整（与热力图原有口径一致：浮点数四舍五入，缺失为 0）"""
+    if isinstance(value, float):
+        value = int(round(value))
+    try:
+        return int(value) if value is not None else 0
+    except (TypeError, ValueError):
+        return 0
+
+
+def format_trade_date(trade_date: Optional[str]) -> Optional[str]:
+    """去掉交易日期的时间部分，只保留 YYYY-MM-DD"""
+    if trade_date:
+        if ' ' in trade_date:
+            return trade_date.split(' ')[0]
+        if 'T' in trade_date:
+            return trade_date.split('T')[0]
+    return trade_date
+
+
+def smallest_int_dtype(values: "np.ndarray") -> str:
+    """能容纳全部取值的最小整数类型（比例数据通常为 int8）"""
+    for dtype in ('<i1', '<i2', '<i4'):
+        info = np.iinfo(np.dtype(dtype))
+        if values.size == 0 or (values.min() >= info.min and values.max() <= info.max):
+            return dtype
+    return '<i8'
+
+
+class MarketBreadthMatrix:
+    """
+    市场宽度稠密矩阵（行：交易日升序，列：行业名称升序）
+    日期范围筛选是交易日期索引上的二分查找，行业筛选是列下标选择，不解析 JSON
+    presence 记录行业在当日是否有数据：返回的列只包含所选日期范围内出现过的行业
+    row_generations / column_generations 记录每个交易日最近变化、每个行业首次出现时的数据版本号，
+    用于增量返回（客户端持有旧矩阵时只下载新增/变化的交易日和新增行业列）
+    """
+
+    def __init__(
+        self,
+        generation: int,
+        trade_dates: List[str],
+        update_times: List[Optional[str]],
+        industries: List[str],
+        values: "np.ndarray",
+        presence: "np.ndarray",
+        total_breadth: "np.ndarray",
+        market_breadth: "np.ndarray",
+        row_generations: "np.ndarray",
+        column_generations: "np.ndarray",
+        reset_generation: int
+    ):
+        self.generation = generation
+        self.trade_dates = trade_dates
+        self.dates = [format_trade_date(trade_date) for trade_date in trade_dates]
+        self.update_times = update_times
+        self.industries = industries
+        self.values = values
+        self.presence = presence
+        self.total_breadth = total_breadth
+        self.market_breadth = market_breadth
+        self.row_generations = row_generations
+        self.column_generations = column_generations
+        self.reset_generation = reset_generation
+
+    @property
+    def sync_token(self) -> str:
+        """增量令牌：客户端下次请求时作为 since 传回"""
+        return f"g{self.generation}"
+
+    def row_range(self, start_date: Optional[str], end_date: Optional[str]) -> Tuple[int, int]:
+        """日期范围对应的行区间 [start, end)"""
+        # 与 SQL 条件 trade_date >= start_date / trade_date <= end_date 一致（按文本比较）
+        start = bisect_left(self.trade_dates, start_date) if start_date else 0
+        end = bisect_right(self.trade_dates, end_date) if end_date else len(self.trade_dates)
+        return start, end
+
+    def _column_indexes(self, start: int, end: int, industries: Optional[List[str]]) -> List[int]:
+        present = self.presence[start:end].any(axis=0)
+        selected = set(industries) if industries else None
+        return [
+            i for i, name in enumerate(self.industries)
+            if present[i] and (selected is None or name in selected)
+        ]
+
+    def query(
+        self,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        industries: Optional[List[str]] = None
+    ) -> Optional[dict]:
+        """按日期范围和行业切片，返回与 get_market_breadth_data 相同结构的数据"""
+        start, end = self.row_range(start_date, end_date)
+        if start >= end:
+            return None
+
+        column_indexes = self._column_indexes(start, end, industries)
+        columns = [self.industries[i] for i in column_indexes]
+        values = self.values[start:end, column_indexes]
+        dates = self.dates[start:end]
+
+        statistics = {
+            'total_records': end - start,
+            'date_range': f"{dates[-1]} to {dates[0]}" if dates else None,
+            'industry_count': len(columns),
+            'trading_days': len(dates),
+        }
+        if values.size:
+            statistics.update({
+                'min_value': int(values.min()),
+                'max_value': int(values.max()),
+                'avg_value': round(int(values.sum(dtype=np.int64)) / values.size, 2),
+            })
+
+        last_update = max((t for t in self.update_times[start:end] if t), default=None)
+
+        return {
+            'dates': dates,
+            'columns': columns,
+            'data': values.tolist(),
+            'total_breadth_data': self.total_breadth[start:end].tolist(),
+            'statistics': statistics,
+            'last_update': last_update if last_update else None,
+            'sync_token': self.sync_token
+        }
+
+    def delta(
+        self,
+        since: str,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        industries: Optional[List[str]] = None
+    ) -> Optional[dict]:
+        """
+        增量数据：since 为上次响应的 sync_token（g<版本号>）或日期（YYYY-MM-DD）
+        - 令牌：返回该版本之后新增/变化的交易日，以及之后首次出现的行业列
+        - 日期：返回该日期之后的交易日，以及该日期及以前没有出现过的行业列
+        返回的行按完整列 columns 对齐；令牌过期（之后删除过交易日或行业）或格式错误时返回 None，调用方返回全量数据
+        """
+        start, end = self.row_range(start_date, end_date)
+        if start >= end:
+            return None
+        column_indexes = self._column_indexes(start, end, industries)
+
+        if since.startswith('g') and since[1:].isdigit():
+            base_generation = int(since[1:])
+            if base_generation < self.reset_generation or base_generation > self.generation:
+                return None
+            row_mask = self.row_generations > base_generation
+            new_columns = self.column_generations > base_generation
+        else:
+            try:
+                datetime.strptime(since, '%Y-%m-%d')
+            except ValueError:
+                return None
+            # 格式化后的日期与交易日期同序，按日期比较避免带时间的交易日期被误判
+            boundary = bisect_right(self.dates, since)
+            row_mask = np.zeros(len(self.trade_dates), dtype=bool)
+            row_mask[boundary:] = True
+            new_columns = ~self.presence[:boundary].any(axis=0)
+
+        rows = np.flatnonzero(row_mask[start:end]) + start
+        last_update = max((t for t in self.update_times[start:end] if t), default=None)
+        return {
+            'delta': True,
+            'since': since,
+            'sync_token': self.sync_token,
+            'columns': [self.industries[i] for i in column_indexes],
+            'new_columns': [self.industries[i] for i in column_indexes if new_columns[i]],
+            'dates': [self.dates[i] for i in rows],
+            'data': self.values[np.ix_(rows, column_indexes)].tolist(),
+            'total_breadth_data': self.total_breadth[rows].tolist(),
+            'last_update': last_update if last_update else None
+        }
+
+
+_matrix: Optional[MarketBreadthMatrix] = None
+_matrix_lock = threading.Lock()
+
+
+def _change_generations(
+    previous: Optional[MarketBreadthMatrix],
+    generation: int,
+    trade_dates: List[str],
+    industries: List[str],
+    values: "np.ndarray",
+    presence: "np.ndarray",
+    total_breadth: "np.ndarray"
+) -> Tuple["np.ndarray", "np.ndarray", int]:
+    """
+    与上一版矩阵逐行比较，得到 (各交易日变化版本, 各行业首次出现版本, 增量令牌失效版本)
+    未变化的交易日/行业沿用上一版的版本号；上一版有交易日或行业被删除时，更早的令牌全部失效
+    """
+    row_generations = np.full(len(trade_dates), generation, dtype='<i4')
+    column_generations = np.full(len(industries), generation, dtype='<i4')
+    if previous is None:
+        return row_generations, column_generations, generation
+
+    previous_columns = {name: i for i, name in enumerate(previous.industries)}
+    previous_rows = {trade_date: i for i, trade_date in enumerate(previous.trade_dates)}
+    removed = (
+        len(previous_columns.keys() - set(industries)) > 0
+        or len(previous_rows.keys() - set(trade_dates)) > 0
+    )
+
+    shared = [(i, previous_columns[name]) for i, name in enumerate(industries) if name in previous_columns]
+    for i, j in shared:
+        column_generations[i] = previous.column_generations[j]
+
+    # 新增行业列在旧矩阵中视为缺失（值 0、无数据），新行业出现的交易日因此会被判定为变化
+    current_shared = [i for i, _ in shared]
+    previous_shared = [j for _, j in shared]
+    new_columns = [i for i in range(len(industries)) if industries[i] not in previous_columns]
+    for row, trade_date in enumerate(trade_dates):
+        previous_row = previous_rows.get(trade_date)
+        if previous_row is None:
+            continue
+        unchanged = (
+            total_breadth[row] == previous.total_breadth[previous_row]
+            and np.array_equal(values[row, current_shared], previous.values[previous_row, previous_shared])
+            and np.array_equal(presence[row, current_shared], previous.presence[previous_row, previous_shared])
+            and not presence[row, new_columns].any()
+        )
+        if unchanged:
+            row_generations[row] = previous.row_generations[previous_row]
+
+    reset_generation = generation if removed else previous.reset_generation
+    return row_generations, column_generations, reset_generation
+
+
+def build_market_breadth_matrix() -> Optional[MarketBreadthMatrix]:
+    """
+    同步后调用：从缓存表构建矩阵并写入 market_breadth_matrix_cache
+    每条记录的 industries_data 只在这里解析一次
+    """
+    global _matrix
+    if np is None:
+        return None
+
+    with _matrix_lock:
+        start_time = time.perf_counter()
+        generation = get_generation('market_breadth', max_age=0)
+        table = MarketBreadthMetricsCache.__table__
+        with cache_engine.connect() as conn:
+            records = conn.execute(
+                select(
+                    table.c.trade_date, table.c.industries_data, table.c.total_breadth,
+                    table.c.market_breadth, table.c.update_time
+                )
+                .order_by(table.c.trade_date.asc())
+            ).all()
+
+        parsed = []
+        industries = set()
+        for record in records:
+            industries_dict = {}
+            if record.industries_data:
+                try:
+                    industries_dict = json.loads(record.industries_data)
+                except (json.JSONDecodeError, TypeError):
+                    industries_dict = {}
+            if not isinstance(industries_dict, dict):
+                industries_dict = {}
+            industries.update(industries_dict.keys())
+            parsed.append(industries_dict)
+
+        industries = sorted(industries)
+        values = np.array(
+            [[breadth_cell_value(row.get(industry, 0)) for industry in industries] for row in parsed],
+            dtype=np.int64
+        ).reshape(len(parsed), len(industries))
+        value_dtype = smallest_int_dtype(values)
+        values = values.astype(value_dtype)
+        presence = np.array(
+            [[industry in row for industry in industries] for row in parsed],
+            dtype=bool
+        ).reshape(len(parsed), len(industries))
+        total_breadth = np.array(
+            [int(record.total_breadth) if record.total_breadth is not None else 0 for record in records],
+            dtype='<i8'
+        )
+        market_breadth = np.array(
+            [float(record.market_breadth) if record.market_breadth is not None else np.nan for record in records],
+            dtype='<f8'
+        )
+
+        trade_dates = [record.trade_date for record in records]
+        update_times = [record.update_time for record in records]
+        previous = _matrix if _matrix is not None else _load_stored_matrix()
+        row_generations, column_generations, reset_generation = _change_generations(
+            previous, generation, trade_dates, industries, values, presence, total_breadth
+        )
+        matrix_table = MarketBreadthMatrixCache.__table__
+        with cache_engine.begin() as conn:
+            conn.execute(delete(matrix_table))
+            conn.execute(matrix_table.insert().values(
+                id=MATRIX_ROW_ID,
+                generation=generation,
+                trade_dates=json.dumps(trade_dates, ensure_ascii=False),
+                update_times=json.dumps(update_times, ensure_ascii=False),
+                industries=json.dumps(industries, ensure_ascii=False),
+                value_dtype=value_dtype,
+                matrix=values.tobytes(),
+                presence=np.packbits(presence).tobytes(),
+                total_breadth=total_breadth.tobytes(),
+                market_breadth=market_breadth.tobytes(),
+                row_generations=row_generations.tobytes(),
+                column_generations=column_generations.tobytes(),
+                reset_generation=reset_generation,
+                built_at=datetime.now().isoformat()
+            ))
+
+        _matrix = MarketBreadthMatrix(
+            generation, trade_dates, update_times, industries, values, presence, total_breadth, market_breadth,
+            row_generations, column_generations, reset_generation
+        )
+        logger.info(
+            f"市场宽度矩阵已重建：{len(trade_dates)} 个交易日 × {len(industries)} 个行业（{value_dtype}），"
+            f"数据版本 {generation}，耗时 {round((time.perf_counter() - start_time) * 1000, 1)}ms"
+        )
+        return _matrix
+
+
+def refresh_market_breadth_matrix() -> Optional[MarketBreadthMatrix]:
+    """矩阵与当前数据版本不一致（或尚未构建）时重建"""
+    if np is None:
+        return None
+    matrix = get_market_breadth_matrix()
+    return matrix if matrix is not None else build_market_breadth_matrix()
+
+
+def get_market_breadth_matrix() -> Optional[MarketBreadthMatrix]:
+    """
+    获取与当前数据版本一致的矩阵
+    进程内缓存失效时从 market_breadth_matrix_cache 加载（其他进程完成的同步）；
+    矩阵尚未按当前版本构建时返回 None，调用方回退到解析缓存表
+    """
+    global _matrix
+    if np is None:
+        return None
+
+    generation = get_generation('market_breadth')
+    matrix = _matrix
+    if matrix is not None and matrix.generation == generation:
+        return matrix
+
+    matrix = _load_stored_matrix()
+    if matrix is None or matrix.generation != generation:
+        return None
+    _matrix = matrix
+    return matrix
+
+
+def _load_stored_matrix() -> Optional[MarketBreadthMatrix]:
+    """从 market_breadth_matrix_cache 加载矩阵（不检查数据版本）；旧版本缓存缺少字段时视为不存在，由调用方重建"""
+    with cache_engine.connect() as conn:
+        row = conn.execute(
+            select(MarketBreadthMatrixCache.__table__).where(MarketBreadthMatrixCache.id == MATRIX_ROW_ID)
+        ).first()
+    if row is None or row.row_generations is None or row.column_generations is None or row.market_breadth is None:
+        return None
+
+    trade_dates = json.loads(row.trade_dates)
+    industries = json.loads(row.industries)
+    shape = (len(trade_dates), len(industries))
+    values = np.frombuffer(row.matrix, dtype=row.value_dtype).reshape(shape)
+    presence = np.unpackbits(
+        np.frombuffer(row.presence, dtype=np.uint8), count=shape[0] * shape[1]
+    ).astype(bool).reshape(shape)
+    total_breadth = np.frombuffer(row.total_breadth, dtype='<i8')
+    return MarketBreadthMatrix(
+        row.generation, trade_dates, json.loads(row.update_times), industries, values, presence, total_breadth,
+        np.frombuffer(row.market_breadth, dtype='<f8'),
+        np.frombuffer(row.row_generations, dtype='<i4'),
+        np.frombuffer(row.column_generations, dtype='<i4'),
+        row.reset_generation if row.reset_generation is not None else row.generation
+    )
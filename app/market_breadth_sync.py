@@ -5,6 +5,19 @@ from sqlalchemy import desc
 from app.database import SessionLocal as RemoteSessionLocal
 from app.cache_database import SessionLocal as CacheSessionLocal, engine as cache_engine, Base as CacheBase
 from app.models import MarketBreadthMetrics, MarketBreadthMetricsCache, SyncMetadata
+from app.cache_writer import bulk_upsert, ensure_unique_key, create_shadow_table, swap_shadow_table, drop_shadow_table
+from app.sync_pipeline import (
+    iter_query_chunks, iter_rows_by_keys, get_peak_rss_mb, get_remote_bytes, start_progress, update_progress,
+    timed_phase, row_hash_expr, parse_watermark, after_watermark, max_watermark, find_changed_keys
+)
+from app.sync_lock import single_flight
+from app.cache_generation import bump_generation, result_changed_data
+from app.sync_history import record_sync_run
+from app.market_breadth_matrix import refresh_market_breadth_matrix
+from app.market_breadth_industries import (
+    IndustrySpans, collect_industry_spans, merge_industry_spans, upsert_industry_spans, reconcile_industry_spans,
+    backfill_market_breadth_industries
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -14,6 +27,11 @@ def init_market_breadth_cache_db():
     """初始化市场宽度数据缓存数据库表结构"""
     try:
         CacheBase.metadata.create_all(bind=cache_engine)
+        # 旧版本缓存表的trade_date只有普通索引，批量upsert需要唯一索引
+        ensure_unique_key(cache_engine, MarketBreadthMetricsCache.__table__, ['trade_date'])
+        backfill_market_breadth_industries()
+        # 旧版本没有物化矩阵，或矩阵落后于缓存数据时重建
+        refresh_market_breadth_matrix()
         logger.info("市场宽度数据缓存数据库表结构初始化完成")
     except Exception as e:
         logger.error(f"初始化市场宽度数据缓存数据库失败: {e}")
@@ -33,9 +51,74 @@ def get_last_market_breadth_sync_info() -> Optional[SyncMetadata]:
         cache_db.close()
 
 
-def sync_market_breadth_data_from_remote() -> dict:
+def market_breadth_hash_expr():
+    """市场宽度远程行内容哈希（不含更新时间）"""
+    return row_hash_expr(
+        MarketBreadthMetrics.industries_data,
+        MarketBreadthMetrics.market_breadth,
+        MarketBreadthMetrics.total_breadth
+    ).label('row_hash')
+
+
+def _cache_text(value) -> Optional[str]:
+    """远程日期时间值转为缓存表中的文本格式（如 2026-06-03 00:00:00）"""
+    return str(value) if value is not None else None
+
+
+def _write_market_breadth_chunk(
+    cache_db,
+    target_table,
+    chunk,
+    write_stats: Optional[dict],
+    industry_spans: Optional[IndustrySpans] = None
+) -> dict:
+    """
+    把一块远程 (MarketBreadthMetrics, row_hash) 记录写入缓存表，同时在同一事务内更新行业维表
+    industry_spans: 全量同步时传入，累计本次出现的行业，完成后用于校准维表
+    """
+    with timed_phase('market_breadth', 'transform'):
+        chunk_spans = collect_industry_spans(
+            (remote_item.trade_date, remote_item.industries_data) for remote_item, _ in chunk
+        )
+        if industry_spans is not None:
+            merge_industry_spans(industry_spans, chunk_spans)
+        cache_rows = [
+            {
+                'industries_data': remote_item.industries_data,
+                'market_breadth': remote_item.market_breadth,
+                'total_breadth': remote_item.total_breadth,
+                # 缓存表的日期列为文本：按 str() 统一格式，与增量比对的主键一致，
+                # 也使写入前按唯一键判断记录是否已存在时能匹配到已有行
+                'trade_date': _cache_text(remote_item.trade_date),
+                'update_time': _cache_text(remote_item.update_time),
+                'row_hash': remote_hash
+            }
+            for remote_item, remote_hash in chunk
+        ]
+
+    # 批量upsert：按trade_date去重，只有内容哈希变化时才覆盖本地记录
+    with timed_phase('market_breadth', 'cache_write'):
+        upsert_industry_spans(cache_db.connection(), chunk_spans)
+        return bulk_upsert(
+            cache_db.connection(),
+            target_table,
+            cache_rows,
+            key_columns=['trade_date'],
+            version_column='update_time',
+            hash_column='row_hash',
+            stats=write_stats
+        )
+
+
+@single_flight('market_breadth')
+@record_sync_run('market_breadth')
+def sync_market_breadth_data_from_remote(full: bool = False) -> dict:
     """
     从远程MySQL同步市场宽度数据到本地SQLite缓存
+    - 全量同步：写入影子表后整表替换
+    - 增量同步：按复合水位线 (update_time, trade_date) 先拉取窄投影比对内容哈希，
+      只对内容变化的交易日批量拉取industries_data等完整数据
+    full=True 时（强制全量同步）持有同步锁后先清除本数据集的同步元数据（水位线），再执行全量同步
     """
     result = {
         'success': False,
@@ -47,90 +130,139 @@ def sync_market_breadth_data_from_remote() -> dict:
 
     remote_db = RemoteSessionLocal()
     cache_db = CacheSessionLocal()
+    shadow_table = None
 
     try:
         logger.info("开始同步市场宽度数据...")
+        start_progress('market_breadth')
+
+        if full:
+            cache_db.query(SyncMetadata)\
+                .filter(SyncMetadata.sync_status.in_(['market_breadth_success', 'market_breadth_failed']))\
+                .delete(synchronize_session=False)
+            cache_db.commit()
+            logger.info("已清除market_breadth同步元数据，执行全量同步")
 
         last_sync = get_last_market_breadth_sync_info()
+        row_hash = market_breadth_hash_expr()
+        watermark = last_sync.remote_max_update_time if last_sync else None
+        watermark_key = last_sync.remote_max_key if last_sync else None
+
+        record_count = 0
+        remote_max = None
+        write_stats = None
+        industry_spans: IndustrySpans = {}
 
-        if last_sync and last_sync.remote_max_update_time:
-            logger.info(f"执行市场宽度数据增量同步，上次同步时间: {last_sync.remote_max_update_time}")
-            query = remote_db.query(MarketBreadthMetrics)\
-                .filter(MarketBreadthMetrics.update_time > last_sync.remote_max_update_time)
+        if watermark:
+            logger.info(f"执行市场宽度数据增量同步，上次同步水位线: ({watermark}, {watermark_key})")
             result['sync_type'] = 'incremental'
+
+            # 先只拉取交易日期、更新时间和内容哈希，industries_data只对内容变化的交易日拉取
+            key_query = remote_db.query(MarketBreadthMetrics.trade_date, MarketBreadthMetrics.update_time, row_hash)\
+                .filter(after_watermark(
+                    MarketBreadthMetrics.update_time, MarketBreadthMetrics.trade_date,
+                    parse_watermark(watermark), parse_watermark(watermark_key)
+                ))
+            # 本地缓存的trade_date为文本，比对时按文本作为主键
+            remote_hashes = {}
+            remote_dates = {}
+            for chunk in iter_query_chunks(key_query, dataset='market_breadth'):
+                for row in chunk:
+                    remote_hashes[str(row.trade_date)] = row.row_hash
+                    remote_dates[str(row.trade_date)] = row.trade_date
+                    remote_max = max_watermark(remote_max, (row.update_time, row.trade_date))
+
+            with timed_phase('market_breadth', 'transform'):
+                changed_dates = find_changed_keys(
+                    cache_db, MarketBreadthMetricsCache.trade_date, MarketBreadthMetricsCache.row_hash, remote_hashes
+                )
+            result['unchanged'] = len(remote_hashes) - len(changed_dates)
+
+            update_progress('market_breadth', phase='payload')
+            payload_query = remote_db.query(MarketBreadthMetrics, row_hash)
+            for chunk in iter_rows_by_keys(
+                payload_query, MarketBreadthMetrics.trade_date,
+                [remote_dates[key] for key in changed_dates], dataset='market_breadth'
+            ):
+                record_count += len(chunk)
+                write_stats = _write_market_breadth_chunk(
+                    cache_db, MarketBreadthMetricsCache.__table__, chunk, write_stats
+                )
+                with timed_phase('market_breadth', 'commit'):
+                    cache_db.commit()
         else:
             logger.info("执行市场宽度数据全量同步")
-            query = remote_db.query(MarketBreadthMetrics)
+            query = remote_db.query(MarketBreadthMetrics, row_hash)
 
-        remote_data = query.all()
-        record_count = len(remote_data)
+            for chunk in iter_query_chunks(query, dataset='market_breadth'):
+                if shadow_table is None:
+                    # 全量同步写入影子表，完成后整表替换
+                    logger.info("全量同步：写入市场宽度影子表")
+                    shadow_table = create_shadow_table(cache_engine, MarketBreadthMetricsCache.__table__)
 
-        if record_count == 0:
-            logger.info("没有新市场宽度数据需要同步")
-            result.update({
-                'success': True,
-                'record_count': 0,
-                'last_sync_time': last_sync.remote_max_update_time if last_sync else None
-            })
-            return result
-
-        logger.info(f"从远程获取到 {record_count} 条市场宽度记录")
-
-        remote_max_update_time = max([item.update_time for item in remote_data if item.update_time]) if remote_data else None
-
-        if result['sync_type'] == 'full':
-            logger.info("全量同步：清空本地市场宽度缓存表")
-            cache_db.query(MarketBreadthMetricsCache).delete()
-
-        for remote_item in remote_data:
-            existing = cache_db.query(MarketBreadthMetricsCache)\
-                .filter(MarketBreadthMetricsCache.trade_date == remote_item.trade_date)\
-                .first()
+                record_count += len(chunk)
+                for item, _ in chunk:
+                    remote_max = max_watermark(remote_max, (item.update_time, item.trade_date))
 
-            cache_item_data = {
-                'industries_data': remote_item.industries_data,
-                'market_breadth': remote_item.market_breadth,
-                'total_breadth': remote_item.total_breadth,
-                'trade_date': remote_item.trade_date,
-                'update_time': remote_item.update_time
-            }
+                write_stats = _write_market_breadth_chunk(cache_db, shadow_table, chunk, write_stats, industry_spans)
+                with timed_phase('market_breadth', 'commit'):
+                    cache_db.commit()
 
-            if existing:
-                if remote_item.update_time and existing.update_time and remote_item.update_time > existing.update_time:
-                    for key, value in cache_item_data.items():
-                        setattr(existing, key, value)
-                    logger.debug(f"更新市场宽度记录: {remote_item.trade_date}")
-                else:
-                    logger.debug(f"跳过记录（数据未更新）: {remote_item.trade_date}")
-            else:
-                cache_item = MarketBreadthMetricsCache(**cache_item_data)
-                cache_db.add(cache_item)
-                logger.debug(f"新增市场宽度记录: {remote_item.trade_date}")
-
-        cache_db.commit()
-
-        total_count = cache_db.query(MarketBreadthMetricsCache).count()
+        update_progress('market_breadth', phase='finalizing')
+        if record_count == 0:
+            logger.info("没有新市场宽度数据需要同步")
+        else:
+            logger.info(
+                f"从远程获取到 {record_count} 条市场宽度记录: 新增 {write_stats['inserted']} 条，"
+                f"更新 {write_stats['updated']} 条，跳过 {write_stats['skipped']} 条"
+            )
+            if shadow_table is not None:
+                with timed_phase('market_breadth', 'commit'):
+                    result['swap_ms'] = swap_shadow_table(cache_engine, MarketBreadthMetricsCache.__table__, shadow_table)
+                shadow_table = None
+                # 全量数据已替换，行业维表按本次数据校准
+                with timed_phase('market_breadth', 'cache_write'):
+                    reconcile_industry_spans(cache_db.connection(), industry_spans)
+            result.update(write_stats)
+
+        with timed_phase('market_breadth', 'post_sync_counts'):
+            total_count = cache_db.query(MarketBreadthMetricsCache).count()
 
         sync_metadata = SyncMetadata(
             last_sync_time=datetime.now().isoformat(),
             record_count=total_count,
             sync_status='market_breadth_success',
             error_message=None,
-            remote_max_update_time=remote_max_update_time.isoformat() if remote_max_update_time else None
+            remote_max_update_time=remote_max[0].isoformat() if remote_max else watermark,
+            remote_max_key=str(remote_max[1]) if remote_max else watermark_key
         )
         cache_db.add(sync_metadata)
-        cache_db.commit()
+        with timed_phase('market_breadth', 'commit'):
+            cache_db.commit()
+
+        if result_changed_data(result):
+            bump_generation('market_breadth')
+        try:
+            refresh_market_breadth_matrix()
+        except Exception as e:
+            # 矩阵构建失败不影响同步结果，接口会回退到解析缓存表
+            logger.error(f"构建市场宽度矩阵失败: {e}")
 
         logger.info(f"市场宽度数据同步成功！本地缓存共 {total_count} 条记录")
+        update_progress('market_breadth', phase='done')
 
         result.update({
             'success': True,
             'record_count': total_count,
-            'last_sync_time': datetime.now()
+            'last_sync_time': datetime.now(),
+            'remote_bytes': get_remote_bytes('market_breadth'),
+            'peak_rss_mb': get_peak_rss_mb()
         })
 
     except Exception as e:
         cache_db.rollback()
+        drop_shadow_table(cache_engine, shadow_table)
+        update_progress('market_breadth', phase='failed')
         logger.error(f"市场宽度数据同步失败: {e}")
 
         sync_metadata = SyncMetadata(
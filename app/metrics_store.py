@@ -0,0 +1,128 @@
+import json
+import logging
+import math
+import operator
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import Table, delete, update
+from sqlalchemy.engine import Connection
+from app.cache_database import engine as cache_engine
+from app.cache_writer import DEFAULT_BATCH_SIZE, bulk_upsert
+from app.models import FinancialScoresCache, FinancialMetricCache
+from app.schemas import MetricFilter
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# 按指标排序时 sort_by 的前缀，如 metric.roe
+METRIC_PREFIX = 'metric.'
+
+# 指标筛选支持的运算符（同时适用于 SQLAlchemy 列和 NumPy 数组）
+METRIC_OPERATORS = {
+    '>=': operator.ge,
+    '<=': operator.le,
+    '>': operator.gt,
+    '<': operator.lt,
+    '=': operator.eq,
+}
+
+_METRIC_FILTER_PATTERN = re.compile(r'^\s*(?:metric\.)?(?P<key>[^<>=]+?)\s*(?P<op>>=|<=|>|<|==?)\s*(?P<value>\S+)\s*$')
+
+
+def parse_metric_filter(expression: str) -> MetricFilter:
+    """解析指标筛选表达式，如 roe>=15、metric.debt_ratio<60、gross_margin>=30%；格式错误时抛出 ValueError"""
+    match = _METRIC_FILTER_PATTERN.match(expression)
+    value = metric_numeric_value(match.group('value')) if match else None
+    if match is None or value is None:
+        raise ValueError(f"指标筛选格式错误: {expression}，应为 指标名>=数值，如 roe>=15")
+    op = '=' if match.group('op') == '==' else match.group('op')
+    return MetricFilter(key=match.group('key'), op=op, value=value)
+
+
+def metric_numeric_value(value: Any) -> Optional[float]:
+    """把指标值转换为数值，用于按指标筛选和排序；支持 "15.2%" 这类带百分号的文本"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        number = float(value)
+    elif isinstance(value, str):
+        try:
+            number = float(value.strip().rstrip('%').replace(',', ''))
+        except ValueError:
+            return None
+    else:
+        return None
+    return number if math.isfinite(number) else None
+
+
+def parse_metrics_detail(stock_code: str, metrics_detail: Optional[str]) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    同步时拆分 metrics_detail：
+    返回 (metrics_detail_parsed 响应片段, financial_metrics_cache 行列表)
+    无法解析或不是 JSON 对象时视为没有指标
+    """
+    metrics = {}
+    if metrics_detail:
+        try:
+            metrics = json.loads(metrics_detail)
+        except (json.JSONDecodeError, TypeError):
+            metrics = {}
+    if not isinstance(metrics, dict):
+        metrics = {}
+
+    fragment = json.dumps(
+        [{"key": key, "value": value} for key, value in metrics.items()],
+        ensure_ascii=False
+    )
+    metric_rows = [
+        {
+            'stock_code': stock_code,
+            'metric_key': key,
+            'position': position,
+            'value': metric_numeric_value(value),
+            'value_text': value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+        }
+        for position, (key, value) in enumerate(metrics.items())
+    ]
+    return fragment, metric_rows
+
+
+def replace_metrics(conn: Connection, table: Table, stock_codes: List[str], metric_rows: List[Dict[str, Any]]):
+    """用新拆分的指标替换这些股票在指标明细表中的记录"""
+    for start in range(0, len(stock_codes), DEFAULT_BATCH_SIZE):
+        conn.execute(delete(table).where(table.c.stock_code.in_(stock_codes[start:start + DEFAULT_BATCH_SIZE])))
+    bulk_upsert(conn, table, metric_rows)
+
+
+def backfill_financial_metrics() -> int:
+    """
+    旧版本同步的记录没有预拆分的指标，启动时一次性补齐（只处理缺少响应片段的记录）
+    返回补齐的记录数
+    """
+    scores = FinancialScoresCache.__table__
+    backfilled = 0
+    with cache_engine.begin() as conn:
+        pending = conn.execute(
+            scores.select()
+            .with_only_columns(scores.c.stock_code, scores.c.metrics_detail)
+            .where(scores.c.metrics_detail_parsed_json.is_(None))
+        ).all()
+
+        for start in range(0, len(pending), DEFAULT_BATCH_SIZE):
+            batch = pending[start:start + DEFAULT_BATCH_SIZE]
+            metric_rows = []
+            for row in batch:
+                fragment, rows = parse_metrics_detail(row.stock_code, row.metrics_detail)
+                metric_rows.extend(rows)
+                conn.execute(
+                    update(scores)
+                    .where(scores.c.stock_code == row.stock_code)
+                    .values(metrics_detail_parsed_json=fragment)
+                )
+            replace_metrics(conn, FinancialMetricCache.__table__, [row.stock_code for row in batch], metric_rows)
+            backfilled += len(batch)
+
+    if backfilled:
+        logger.info(f"已为 {backfilled} 条financial_scores缓存记录补齐指标明细")
+    return backfilled
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DECIMAL, Date, DateTime, Boolean, Index, Text, Float
+from sqlalchemy import Column, Integer, String, DECIMAL, Date, DateTime, Boolean, Index, Text, Float, UniqueConstraint, LargeBinary
 from datetime import datetime
 from app.database import Base
 from app.cache_database import Base as CacheBase
@@ -22,8 +22,40 @@ class MarketBreadthMetricsCache(CacheBase):
     industries_data = Column(Text, comment='各行业BIAS>0比例数据(JSON格式)')
     market_breadth = Column(DECIMAL(5, 2), comment='全市场BIAS>0比例')
     total_breadth = Column(DECIMAL(5, 2), comment='各行业BIAS>0比例总和')
-    trade_date = Column(String(50), index=True, comment='交易日期')
+    trade_date = Column(String(50), unique=True, index=True, comment='交易日期')
     update_time = Column(String(50), comment='更新时间')
+    row_hash = Column(String(32), comment='远程行内容哈希(MD5)')
+
+
+class MarketBreadthIndustryCache(CacheBase):
+    """市场宽度行业维表：同步时增量维护，行业ID一经分配不再变化"""
+    __tablename__ = 'market_breadth_industries_cache'
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id = Column(Integer, primary_key=True, comment='行业ID')
+    name = Column(String(100), nullable=False, unique=True, comment='行业名称')
+    first_seen_date = Column(String(20), comment='首次出现的交易日期')
+    last_seen_date = Column(String(20), comment='最近出现的交易日期')
+
+
+class MarketBreadthMatrixCache(CacheBase):
+    """同步时物化的市场宽度稠密矩阵（日期 × 行业），只保留一行"""
+    __tablename__ = 'market_breadth_matrix_cache'
+
+    id = Column(Integer, primary_key=True, comment='ID')
+    generation = Column(Integer, nullable=False, comment='构建时的market_breadth数据版本号')
+    trade_dates = Column(Text, comment='交易日期索引(JSON数组，升序，与矩阵行对应)')
+    update_times = Column(Text, comment='各交易日的更新时间(JSON数组)')
+    industries = Column(Text, comment='行业列(JSON数组，与矩阵列对应)')
+    value_dtype = Column(String(10), comment='矩阵元素类型(NumPy dtype，小端序)')
+    matrix = Column(LargeBinary, comment='行业BIAS>0比例矩阵(按行存储)')
+    presence = Column(LargeBinary, comment='行业在当日是否有数据的位图(np.packbits，按行存储)')
+    total_breadth = Column(LargeBinary, comment='各交易日全市场上涨家数总和(小端序int64)')
+    market_breadth = Column(LargeBinary, comment='各交易日全市场BIAS>0比例(小端序float64，缺失为NaN)')
+    row_generations = Column(LargeBinary, comment='各交易日最近一次变化时的数据版本号(小端序int32)')
+    column_generations = Column(LargeBinary, comment='各行业首次出现时的数据版本号(小端序int32)')
+    reset_generation = Column(Integer, comment='最近一次删除交易日或行业时的数据版本号，更早的增量令牌失效')
+    built_at = Column(String(50), comment='构建时间')
 
 
 class FinancialScores(Base):
@@ -54,6 +86,30 @@ class FinancialScoresCache(CacheBase):
     data_date = Column(Date, comment='数据日期')
     created_at = Column(DateTime, comment='创建时间')
     updated_at = Column(DateTime, comment='更新时间')
+    row_hash = Column(String(32), comment='远程行内容哈希(MD5)')
+    metrics_detail_parsed_json = Column(Text, comment='同步时预序列化的metrics_detail_parsed响应片段(JSON)')
+    name_pinyin = Column(String(200), comment='名称拼音全拼和首字母（SQLite回退搜索按前缀匹配）')
+
+    # 游标分页按 (综合得分, 股票代码) 定位，避免深分页扫描
+    __table_args__ = (
+        Index('ix_financial_scores_cache_score_code', 'total_score', 'stock_code'),
+    )
+
+
+class FinancialMetricCache(CacheBase):
+    """financial_scores指标明细缓存表（同步时由metrics_detail拆分，每个指标一行）"""
+    __tablename__ = 'financial_metrics_cache'
+    __table_args__ = (
+        UniqueConstraint('stock_code', 'metric_key'),
+        Index('ix_financial_metrics_key_value', 'metric_key', 'value'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    stock_code = Column(String(20), nullable=False, index=True, comment='股票代码')
+    metric_key = Column(String(100), nullable=False, comment='指标名称')
+    position = Column(Integer, comment='指标在metrics_detail中的顺序')
+    value = Column(Float, comment='指标数值（无法转换为数值时为空）')
+    value_text = Column(Text, comment='指标原始值的文本表示')
 
 
 class StockDetails(Base):
@@ -79,6 +135,7 @@ class StockDetailsCache(CacheBase):
     detail_info = Column(Text, comment='详细信息(JSON格式)')
     created_at = Column(DateTime, comment='创建时间')
     updated_at = Column(DateTime, comment='更新时间')
+    row_hash = Column(String(32), comment='远程行内容哈希(MD5)')
 
 
 class SyncMetadata(CacheBase):
@@ -90,6 +147,35 @@ class SyncMetadata(CacheBase):
     sync_status = Column(String(50), comment='同步状态')
     error_message = Column(Text, comment='错误信息')
     remote_max_update_time = Column(String(50), comment='远程最大更新时间')
+    remote_max_key = Column(String(100), comment='远程最大更新时间对应的最大主键（复合水位线）')
+
+
+class CacheGeneration(CacheBase):
+    """缓存数据版本号：数据集每次同步提交了数据变化后加1，用于内存索引和响应缓存失效"""
+    __tablename__ = 'cache_generation'
+
+    dataset = Column(String(50), primary_key=True, comment='数据集')
+    generation = Column(Integer, nullable=False, default=0, comment='数据版本号')
+    updated_at = Column(String(50), comment='最后变化时间')
+
+
+class SyncRunHistory(CacheBase):
+    """数据集同步运行历史（各阶段耗时、处理速度、传输量）"""
+    __tablename__ = 'sync_run_history'
+
+    id = Column(Integer, primary_key=True, comment='ID')
+    dataset = Column(String(50), nullable=False, index=True, comment='数据集')
+    sync_type = Column(String(20), comment='同步类型')
+    status = Column(String(20), comment='同步结果')
+    started_at = Column(String(50), comment='开始时间')
+    finished_at = Column(String(50), comment='结束时间')
+    total_seconds = Column(Float, comment='总耗时（秒）')
+    rows_scanned = Column(Integer, comment='从远程读取的行数')
+    rows_written = Column(Integer, comment='写入（新增+更新）的行数')
+    rows_per_sec = Column(Float, comment='处理速度（行/秒）')
+    remote_bytes = Column(Integer, comment='远程传输字节数（估算）')
+    phase_timings = Column(Text, comment='各阶段耗时(JSON格式，秒)')
+    error_message = Column(Text, comment='错误信息')
 
 
 class EtfClusterSelection(Base):
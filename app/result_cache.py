@@ -0,0 +1,55 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+from app.cache_generation import get_generation
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class GenerationCache:
+    """
+    按数据版本失效的查询结果缓存（LRU，容量有限）
+    - 数据集版本号变化（同步提交了数据变化）后整体清空
+    - 缓存的结果由所有请求共享，调用方不要修改返回的对象
+    """
+
+    def __init__(self, dataset: str, max_entries: int):
+        self.dataset = dataset
+        self.max_entries = max_entries
+        self.generation = None
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(
+        self,
+        key: Hashable,
+        compute: Callable[[], Any],
+        cache_if: Optional[Callable[[Any], bool]] = None
+    ) -> Any:
+        """
+        命中时直接返回缓存结果，否则计算并缓存（计算期间不持有锁）
+        cache_if 对计算结果返回 False 时只返回结果、不缓存（如索引重建期间的回退查询结果）
+        """
+        generation = get_generation(self.dataset)
+        with self._lock:
+            if generation != self.generation:
+                if self._entries:
+                    logger.info(f"{self.dataset} 数据版本变为 {generation}，清空 {len(self._entries)} 条查询结果缓存")
+                self._entries.clear()
+                self.generation = generation
+            elif key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        value = compute()
+
+        with self._lock:
+            # 计算期间数据版本已变化时不缓存，避免旧结果混入新版本
+            if generation == self.generation and (cache_if is None or cache_if(value)):
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
@@ -1,14 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.orm import Session
 from app.cache_database import get_cache_db
 from app.crud import get_etf_cluster_selection_latest
 from app.etf_cluster_sync import sync_etf_cluster_data_from_remote
+from app.http_cache import cache_headers, not_modified_response
+from app.sync_jobs import submit_sync_job
 
 router = APIRouter(prefix="/fund-analysis", tags=["基金分析"])
 
 
 @router.get("/etf-clusters", summary="获取ETF聚类选股数据")
-async def get_etf_clusters(db: Session = Depends(get_cache_db)):
+async def get_etf_clusters(request: Request, response: Response, db: Session = Depends(get_cache_db)):
     """
     获取最新一天的ETF聚类选股数据
 
@@ -26,26 +28,28 @@ async def get_etf_clusters(db: Session = Depends(get_cache_db)):
             ...
         ]
     }
+
+    响应带有按数据版本生成的 ETag/Last-Modified，数据未变化时条件请求返回 304
     """
+    headers = cache_headers('etf_cluster')
+    not_modified = not_modified_response(request, headers)
+    if not_modified is not None:
+        return not_modified
+
     result = get_etf_cluster_selection_latest(db)
 
     if not result:
         raise HTTPException(status_code=404, detail="暂无ETF聚类选股数据")
 
+    response.headers.update(headers)
     return result
 
 
-@router.post("/sync", summary="同步ETF聚类选股数据")
+@router.post("/sync", status_code=202, summary="同步ETF聚类选股数据")
 async def sync_etf_clusters():
     """
     手动触发ETF聚类选股数据同步
-    从远程MySQL同步最新数据到本地SQLite缓存
+    从远程MySQL同步最新数据到本地SQLite缓存（后台执行，立即返回任务ID）
+    通过 GET /api/sync/jobs/{job_id} 查询进度
     """
-    try:
-        result = sync_etf_cluster_data_from_remote()
-        return result
-    except Exception as e:
-        return {
-            "success": False,
-            "error": str(e)
-        }
+    return submit_sync_job('etf_cluster', sync_etf_cluster_data_from_remote)
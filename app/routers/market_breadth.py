@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from typing import Optional, List
@@ -6,7 +6,11 @@ from datetime import datetime, date, timedelta
 import logging
 
 from app.cache_database import get_cache_db
-from app.crud import get_market_breadth_data, get_market_breadth_industries
+from app.config import settings
+from app.crud import breadth_response_cache, get_market_breadth_data, get_market_breadth_delta, get_market_breadth_industry_items
+from app.json_response import FragmentJSONResponse, dumps
+from app.http_cache import cache_headers, not_modified_response, representation_headers
+from app.market_breadth_binary import MARKET_BREADTH_MEDIA_TYPE, encode_market_breadth, wants_binary
 from app.schemas import MarketBreadthResponse, MarketBreadthIndustriesResponse
 
 logger = logging.getLogger(__name__)
@@ -15,9 +19,12 @@ router = APIRouter(prefix="/market-breadth")
 
 @router.get("")
 async def get_market_breadth(
+    request: Request,
+    response: Response,
     start_date: Optional[str] = Query(None, description="开始日期 (YYYY-MM-DD)"),
     end_date: Optional[str] = Query(None, description="结束日期 (YYYY-MM-DD)"),
     industries: Optional[str] = Query(None, description="行业列表，逗号分隔"),
+    since: Optional[str] = Query(None, description="增量起点：上次响应的 sync_token（如 g12）或日期 (YYYY-MM-DD)"),
     cache_db: Session = Depends(get_cache_db)
 ):
     """
@@ -27,6 +34,11 @@ async def get_market_breadth(
     - 支持日期范围筛选
     - 支持行业筛选（逗号分隔）
     - 包含 index_all（全市场汇总）和 sum（各行业总和）列
+    - 响应带有按数据版本生成的 ETag/Last-Modified，数据未变化时条件请求返回 304
+    - 传入 since 时返回增量（delta=true）：dates/data/total_breadth_data 只包含之后新增或变化的交易日，
+      new_columns 为新增行业，columns 为完整列；令牌失效时返回全量数据（delta=false）
+    - 请求头 Accept 包含 application/vnd.market-breadth+octet-stream 时返回紧凑二进制格式
+      （日期为相对首日的天数，矩阵为小端序定长数组，格式见 app/market_breadth_binary.py）
     """
     # 解析日期
     parsed_start_date = None
@@ -56,12 +68,46 @@ async def get_market_breadth(
     if industries:
         parsed_industries = [i.strip() for i in industries.split(',') if i.strip()]
 
-    data = get_market_breadth_data(
-        cache_db,
-        start_date=parsed_start_date,
-        end_date=parsed_end_date,
-        industries=parsed_industries
-    )
+    binary = wants_binary(request.headers.get('accept'))
+    headers = representation_headers(cache_headers('market_breadth'), 'Accept', 'bin' if binary else None)
+    not_modified = not_modified_response(request, headers)
+    if not_modified is not None:
+        return not_modified
+
+    def load_data():
+        if since:
+            return get_market_breadth_delta(
+                cache_db,
+                since.strip(),
+                start_date=parsed_start_date,
+                end_date=parsed_end_date,
+                industries=parsed_industries
+            )
+        return get_market_breadth_data(
+            cache_db,
+            start_date=parsed_start_date,
+            end_date=parsed_end_date,
+            industries=parsed_industries
+        )
+
+    def serialize():
+        data = load_data()
+        if not data:
+            return None
+        return encode_market_breadth(data) if binary else dumps(data).encode('utf-8')
+
+    if settings.FAST_JSON_RESPONSES:
+        # 快速路径：响应体按规范化的查询条件和数据版本缓存，相同查询直接返回序列化好的字节
+        cache_key = (
+            parsed_start_date, parsed_end_date,
+            tuple(sorted(set(parsed_industries))) if parsed_industries else None,
+            since.strip() if since else None, binary
+        )
+        data = breadth_response_cache.get_or_compute(cache_key, serialize)
+    else:
+        data = load_data()
+        if data and binary:
+            data = encode_market_breadth(data)
 
     if not data:
         return JSONResponse(
@@ -72,16 +118,121 @@ async def get_market_breadth(
             }
         )
 
+    if binary:
+        return Response(content=data, media_type=MARKET_BREADTH_MEDIA_TYPE, headers=headers)
+    if isinstance(data, bytes):
+        return FragmentJSONResponse(data, headers=headers)
+
+    response.headers.update(headers)
     return data
 
 
 @router.get("/industries", response_model=MarketBreadthIndustriesResponse)
-async def get_industries(cache_db: Session = Depends(get_cache_db)):
+async def get_industries(request: Request, response: Response, cache_db: Session = Depends(get_cache_db)):
     """
     获取所有可用行业列表（排除 index_all）
+    同时返回行业维表（稳定的行业ID、首次/最近出现日期），同步时增量维护，接口不扫描历史数据
+    """
+    headers = cache_headers('market_breadth')
+    not_modified = not_modified_response(request, headers)
+    if not_modified is not None:
+        return not_modified
+
+    items = get_market_breadth_industry_items(cache_db)
+    response.headers.update(headers)
+    return {"industries": [item["name"] for item in items], "items": items}
+
+
+@router.get("/analytics")
+def get_market_breadth_analytics_data(
+    request: Request,
+    response: Response,
+    window: int = Query(20, ge=2, le=250, description="滚动均值/z-score 窗口（交易日）"),
+    history: int = Query(250, ge=2, le=2500, description="历史百分位的回看交易日数"),
+    series: Optional[str] = Query(None, description="序列列表，逗号分隔：market_breadth、total_breadth 或行业名称（默认全市场两条）"),
+    stats: Optional[str] = Query(None, description="统计量，逗号分隔：ma、zscore、percentile、thrust（默认全部）"),
+    start_date: Optional[str] = Query(None, description="开始日期 (YYYY-MM-DD)，只截取输出，窗口仍使用更早的数据"),
+    end_date: Optional[str] = Query(None, description="结束日期 (YYYY-MM-DD)")
+):
+    """
+    市场宽度滚动统计：在同步时物化的矩阵上用 NumPy 计算，按 (window, history) 和数据版本缓存
+    - ma / zscore: window 日滚动均值和 z-score（窗口内有缺失时为 null）
+    - percentile: 当日值在最近 history 个交易日中的百分位
+    - thrust: 10 日 EMA（ema）和宽度推力信号日（thrust_dates：EMA 10 日内从 40 以下升至 61.5 以上）
+    客户端只请求需要绘制的序列和统计量
+    普通函数（非 async）：缓存未命中时的 NumPy 计算在线程池中执行，不阻塞事件循环
+    """
+    from app.crud import get_market_breadth_analytics
+    from app.market_breadth_analytics import ANALYTICS_STATS, DEFAULT_SERIES
+
+    parsed_series = [s.strip() for s in series.split(',') if s.strip()] if series else list(DEFAULT_SERIES)
+    parsed_stats = [s.strip() for s in stats.split(',') if s.strip()] if stats else list(ANALYTICS_STATS)
+    unknown_stats = [s for s in parsed_stats if s not in ANALYTICS_STATS]
+    if unknown_stats:
+        raise HTTPException(status_code=400, detail=f"未知的统计量: {', '.join(unknown_stats)}")
+
+    headers = cache_headers('market_breadth')
+    not_modified = not_modified_response(request, headers)
+    if not_modified is not None:
+        return not_modified
+
+    try:
+        data = get_market_breadth_analytics(window, history, parsed_series, parsed_stats, start_date, end_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not data:
+        return JSONResponse(
+            status_code=503,
+            content={
+                "error": "市场宽度分析数据尚未就绪，请稍后再试",
+                "message": "市场宽度矩阵尚未构建或所选日期范围内没有数据"
+            }
+        )
+
+    response.headers.update(headers)
+    return data
+
+
+@router.get("/correlation")
+def get_market_breadth_correlation_data(
+    request: Request,
+    response: Response,
+    start_date: Optional[str] = Query(None, description="开始日期 (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="结束日期 (YYYY-MM-DD)"),
+    days: Optional[int] = Query(None, ge=2, description="只使用日期范围内最近的交易日数"),
+    industries: Optional[str] = Query(None, description="行业列表，逗号分隔（默认区间内出现过的全部行业）"),
+    max_lag: int = Query(3, ge=0, le=10, description="领先/滞后的最大交易日偏移")
+):
+    """
+    行业 × 行业的宽度相关系数矩阵（可直接作为第二张热力图）和领先/滞后相关
+    - correlation: 同日相关系数（两个行业都有数据的交易日少于 10 天时为 null）
+    - lagged[k][i][j]: 行业 i 与 lags[k] 个交易日后的行业 j 的相关系数（i 领先 j）
+    - best_lag / best_correlation: ±max_lag 内相关系数最高的偏移（正数表示行业 i 领先行业 j）及其相关系数
+    在同步时物化的矩阵上用 NumPy 矩阵乘法计算，按 (交易日区间, 行业, max_lag) 和数据版本缓存
+    普通函数（非 async）：缓存未命中时的矩阵计算在线程池中执行，不阻塞事件循环
     """
-    industries = get_market_breadth_industries(cache_db)
-    return {"industries": industries}
+    from app.crud import get_market_breadth_correlation
+
+    parsed_industries = [i.strip() for i in industries.split(',') if i.strip()] if industries else None
+
+    headers = cache_headers('market_breadth')
+    not_modified = not_modified_response(request, headers)
+    if not_modified is not None:
+        return not_modified
+
+    data = get_market_breadth_correlation(start_date, end_date, days, parsed_industries, max_lag)
+    if not data:
+        return JSONResponse(
+            status_code=503,
+            content={
+                "error": "市场宽度相关性数据尚未就绪，请稍后再试",
+                "message": "市场宽度矩阵尚未构建或所选日期范围内没有数据"
+            }
+        )
+
+    response.headers.update(headers)
+    return data
 
 
 @router.get("/sync-status")
@@ -98,16 +249,13 @@ async def get_market_breadth_sync_status():
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/sync")
+@router.post("/sync", status_code=202)
 async def sync_market_breadth():
     """
     手动触发市场宽度数据同步（从远程MySQL同步到本地SQLite缓存）
+    后台执行并立即返回任务ID，通过 GET /api/sync/jobs/{job_id} 查询进度
     """
     from app.market_breadth_sync import sync_market_breadth_data_from_remote
-    try:
-        logger.info("收到市场宽度数据同步请求")
-        result = sync_market_breadth_data_from_remote()
-        return result
-    except Exception as e:
-        logger.error(f"市场宽度数据同步失败: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    from app.sync_jobs import submit_sync_job
+    logger.info("收到市场宽度数据同步请求")
+    return submit_sync_job('market_breadth', sync_market_breadth_data_from_remote)
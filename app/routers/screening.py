@@ -1,27 +1,50 @@
-from fastapi import APIRouter, Depends, Query
-from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
+from typing import List, Optional
 from sqlalchemy.orm import Session
 from app.cache_database import get_cache_db
-from app.crud import get_screening_list, get_top3_by_overall_score, search_stock_suggestions, get_top_stocks_by_overall_score
+from app.cache_generation import get_generation
+from app.config import settings
+from app.crud import (
+    financial_score_fragment, financial_score_metrics, get_screening_list, get_screening_page,
+    get_top3_by_overall_score, get_top_stocks_by_overall_score, screening_result_cache, search_stock_suggestions,
+    search_stock_suggestions_with_source, suggestion_response_cache
+)
 from app.schemas import ScreeningFilterParams, ScreeningResponse, SearchSuggestionsResponse
+from app.http_cache import cache_headers, not_modified_response
+from app.json_response import FragmentJSONResponse, dumps, fragment
+from app.metrics_store import parse_metric_filter
+from app.screening_cursor import cursor_sort_column, decode_cursor, encode_cursor
 
 router = APIRouter(prefix="/screening", tags=["基本面选股"])
 
+# include_raw_metrics=false 时从响应模型中去掉的字段
+RAW_METRICS_EXCLUDE = {
+    "top3": {"__all__": {"metrics_detail"}},
+    "data": {"__all__": {"metrics_detail"}}
+}
+
 
 @router.get("", response_model=ScreeningResponse, summary="获取基本面选股数据列表")
 async def get_screening_data(
+    request: Request,
+    response: Response,
     page: int = Query(1, ge=1, description="页码"),
     page_size: int = Query(20, ge=1, le=100, description="每页数量"),
     stock_code: Optional[str] = Query(None, description="股票代码"),
     stock_name: Optional[str] = Query(None, description="股票名称"),
     sector_name: Optional[str] = Query(None, description="板块名称"),
-    search: Optional[str] = Query(None, description="搜索关键词（代码或名称，OR逻辑）"),
+    search: Optional[str] = Query(None, description="搜索关键词（代码、名称或名称拼音，OR逻辑）"),
     min_overall_score: Optional[float] = Query(None, ge=0, le=100, description="最小综合得分"),
     max_overall_score: Optional[float] = Query(None, ge=0, le=100, description="最大综合得分"),
     pass_filters: Optional[bool] = Query(None, description="是否通过筛选"),
     recommendation: Optional[str] = Query(None, description="投资建议"),
-    sort_by: str = Query("overall_score", description="排序字段"),
+    sort_by: str = Query("overall_score", description="排序字段（metric.<指标名> 按指标数值排序）"),
     sort_order: str = Query("desc", description="排序方向 (asc/desc)"),
+    metric: List[str] = Query([], description="指标范围筛选，可重复，如 metric=roe>=15"),
+    pagination: str = Query("page", pattern="^(page|cursor)$", description="分页方式 (page/cursor)"),
+    cursor: Optional[str] = Query(None, description="游标分页：上一页返回的 next_cursor"),
+    include_raw_metrics: bool = Query(True, description="是否返回原始metrics_detail字符串"),
     db: Session = Depends(get_cache_db)
 ):
     """
@@ -37,9 +60,42 @@ async def get_screening_data(
     - **max_overall_score**: 最大综合得分
     - **pass_filters**: 是否通过筛选
     - **recommendation**: 投资建议（STRONG_BUY/BUY/HOLD/AVOID）
-    - **sort_by**: 排序字段（默认：overall_score）
+    - **sort_by**: 排序字段（默认：overall_score；metric.<指标名> 按指标数值排序，如 metric.roe）
     - **sort_order**: 排序方向（asc/desc，默认：desc）
+    - **metric**: 指标范围筛选，可重复传入（AND逻辑），格式为 指标名+运算符+数值，
+      运算符支持 >=、<=、>、<、=，如 metric=roe>=15&metric=debt_ratio<60（指标名可带 metric. 前缀）
+    - **pagination**: 分页方式（page：按页码，默认；cursor：游标分页，按排序值定位，深分页耗时不变）
+    - **cursor**: 游标分页时传入上一页返回的 next_cursor（传入即使用游标分页，忽略 page）；
+      游标只在同一数据版本内有效，同步更新数据后返回 409，需要从第一页重新开始
+    - **include_raw_metrics**: 是否返回原始metrics_detail字符串（默认：true；
+      metrics_detail_parsed 始终返回，前端只需要解析后的指标时可传 false 减小响应体积）
+
+    响应带有按数据版本生成的 ETag/Last-Modified，数据未变化时条件请求返回 304
     """
+    try:
+        metric_filters = [parse_metric_filter(expression) for expression in metric]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    cursor_mode = pagination == "cursor" or cursor is not None
+    after = None
+    if cursor_mode:
+        try:
+            sort_column = cursor_sort_column(sort_by)
+            after = decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if after is not None and (after.sort_by != sort_column or after.sort_order != sort_order):
+            raise HTTPException(status_code=400, detail="分页游标与当前排序条件不一致")
+        generation = get_generation('financial_scores')
+        if after is not None and after.generation != generation:
+            raise HTTPException(status_code=409, detail="数据已更新，分页游标已失效，请从第一页重新开始")
+
+    headers = cache_headers('financial_scores')
+    not_modified = not_modified_response(request, headers)
+    if not_modified is not None:
+        return not_modified
+
     params = ScreeningFilterParams(
         page=page,
         page_size=page_size,
@@ -52,22 +108,61 @@ async def get_screening_data(
         pass_filters=pass_filters,
         recommendation=recommendation if recommendation and recommendation.strip() else None,
         sort_by=sort_by,
-        sort_order=sort_order
+        sort_order=sort_order,
+        metric_filters=metric_filters,
+        after=after
     )
 
-    data, total = get_screening_list(db, params)
-    top3 = get_top3_by_overall_score(db)
-
+    next_cursor = None
+    if cursor_mode:
+        data, total, next_after = get_screening_page(db, params)
+        if next_after is not None:
+            next_cursor = encode_cursor(sort_column, sort_order, next_after[0], next_after[1], generation)
+    else:
+        data, total = get_screening_list(db, params)
     total_pages = (total + page_size - 1) // page_size if total > 0 else 0
 
-    return ScreeningResponse(
+    # top3只有概要字段，按响应模型补齐默认值（结果按数据版本缓存）
+    top3 = screening_result_cache.get_or_compute(
+        ('top3_response',),
+        lambda: ScreeningResponse(top3=get_top3_by_overall_score(db)).model_dump()['top3']
+    )
+    if settings.FAST_JSON_RESPONSES:
+        # 快速路径：跳过响应模型校验，每行按数据版本预序列化一次（metrics_detail_parsed 是同步时预序列化的片段），
+        # 响应只拼接片段
+        top3 = screening_result_cache.get_or_compute(
+            ('top3_fragment', include_raw_metrics),
+            lambda: fragment(top3 if include_raw_metrics else [_without_raw_metrics(item) for item in top3])
+        )
+        return FragmentJSONResponse({
+            "top3": top3,
+            "data": [financial_score_fragment(item, include_raw_metrics) for item in data],
+            "total": total,
+            "page": page,
+            "page_size": page_size,
+            "total_pages": total_pages,
+            "next_cursor": next_cursor
+        }, headers=headers)
+
+    # 默认路径：按响应模型校验和过滤，metrics_detail_parsed 使用按数据版本缓存的解析结果
+    result = ScreeningResponse(
         top3=top3,
-        data=data,
+        data=[dict(item, metrics_detail_parsed=financial_score_metrics(item)) for item in data],
         total=total,
         page=page,
         page_size=page_size,
-        total_pages=total_pages
+        total_pages=total_pages,
+        next_cursor=next_cursor
     )
+    if not include_raw_metrics:
+        return JSONResponse(result.model_dump(mode='json', exclude=RAW_METRICS_EXCLUDE), headers=headers)
+
+    response.headers.update(headers)
+    return result
+
+
+def _without_raw_metrics(item: dict) -> dict:
+    return {key: value for key, value in item.items() if key != "metrics_detail"}
 
 
 @router.get("/search/suggestions", response_model=SearchSuggestionsResponse, summary="搜索股票代码或名称的建议")
@@ -77,22 +172,24 @@ async def search_suggestions(
     db: Session = Depends(get_cache_db)
 ):
     """
-    搜索股票代码或名称的建议（OR逻辑，模糊匹配）
+    搜索股票代码或名称的建议（OR逻辑，模糊匹配，也支持名称拼音全拼/首字母，如 gzmt），按综合得分排序
 
     - **q**: 搜索关键词
     - **limit**: 返回数量，1-20
     """
+    if settings.FAST_JSON_RESPONSES:
+        # 快速路径：建议字段已是响应模型的类型，跳过校验，响应体按数据版本缓存
+        # 只缓存来自内存索引的结果：索引重建期间的 SQLite 回退结果不占用整个数据版本的缓存
+        def compute():
+            suggestions, from_index = search_stock_suggestions_with_source(db, q, limit)
+            return dumps({"suggestions": suggestions}).encode('utf-8'), from_index
+
+        body, _ = suggestion_response_cache.get_or_compute((q, limit), compute, cache_if=lambda value: value[1])
+        return FragmentJSONResponse(body)
+
     suggestions = search_stock_suggestions(db, q, limit)
     
-    return SearchSuggestionsResponse(
-        suggestions=[
-            {
-                "stock_code": item.stock_code,
-                "stock_name": item.stock_name
-            }
-            for item in suggestions
-        ]
-    )
+    return SearchSuggestionsResponse(suggestions=suggestions)
 
 
 @router.get("/top-stocks", summary="获取综合排名前N的股票")
@@ -105,14 +202,13 @@ async def get_top_stocks(
 
     - **limit**: 返回数量，1-20
     """
+    if settings.FAST_JSON_RESPONSES:
+        body = screening_result_cache.get_or_compute(
+            ('top_stocks_body', limit),
+            lambda: dumps({"suggestions": get_top_stocks_by_overall_score(db, limit)}).encode('utf-8')
+        )
+        return FragmentJSONResponse(body)
+
     top_stocks = get_top_stocks_by_overall_score(db, limit)
     
-    return SearchSuggestionsResponse(
-        suggestions=[
-            {
-                "stock_code": item.stock_code,
-                "stock_name": item.stock_name
-            }
-            for item in top_stocks
-        ]
-    )
+    return SearchSuggestionsResponse(suggestions=top_stocks)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Union
 from datetime import datetime, date
 
 
@@ -23,6 +23,20 @@ class FinancialScoresSchema(BaseModel):
         from_attributes = True
 
 
+class MetricFilter(BaseModel):
+    key: str = Field(..., description="指标名称")
+    op: str = Field(..., description="比较运算符（>=、<=、>、<、=）")
+    value: float = Field(..., description="比较值")
+
+
+class ScreeningCursor(BaseModel):
+    sort_by: str = Field(..., description="排序字段")
+    sort_order: str = Field(..., description="排序方向")
+    value: Optional[Union[float, str]] = Field(None, description="上一页最后一条记录的排序值")
+    stock_code: str = Field(..., description="上一页最后一条记录的股票代码")
+    generation: int = Field(..., description="生成游标时的数据版本")
+
+
 class ScreeningFilterParams(BaseModel):
     page: int = Field(1, ge=1, description="页码")
     page_size: int = Field(20, ge=1, le=100, description="每页数量")
@@ -34,8 +48,10 @@ class ScreeningFilterParams(BaseModel):
     max_overall_score: Optional[float] = Field(None, ge=0, le=100, description="最大综合得分")
     pass_filters: Optional[bool] = Field(None, description="是否通过筛选")
     recommendation: Optional[str] = Field(None, description="投资建议")
-    sort_by: str = Field("overall_score", description="排序字段")
+    sort_by: str = Field("overall_score", description="排序字段（metric.<指标名> 按指标数值排序）")
     sort_order: str = Field("desc", description="排序方向 (asc/desc)")
+    metric_filters: List[MetricFilter] = Field(default_factory=list, description="指标范围筛选（AND逻辑）")
+    after: Optional[ScreeningCursor] = Field(None, description="游标分页：从该位置之后继续")
 
 
 class ScreeningResponse(BaseModel):
@@ -45,6 +61,7 @@ class ScreeningResponse(BaseModel):
     page: int = Field(1, description="当前页")
     page_size: int = Field(20, description="每页数量")
     total_pages: int = Field(0, description="总页数")
+    next_cursor: Optional[str] = Field(None, description="游标分页的下一页游标（没有下一页时为空）")
 
 
 class SearchSuggestionItem(BaseModel):
@@ -81,5 +98,13 @@ class MarketBreadthResponse(BaseModel):
     last_update: Optional[str] = Field(None, description="最后更新时间")
 
 
+class MarketBreadthIndustryItem(BaseModel):
+    id: int = Field(..., description="行业ID（稳定，不随同步变化）")
+    name: str = Field(..., description="行业名称")
+    first_seen_date: Optional[str] = Field(None, description="首次出现的交易日期")
+    last_seen_date: Optional[str] = Field(None, description="最近出现的交易日期")
+
+
 class MarketBreadthIndustriesResponse(BaseModel):
     industries: List[str] = Field(..., description="行业列表（排除 index_all）")
+    items: List[MarketBreadthIndustryItem] = Field(default_factory=list, description="行业维表（含行业ID和出现日期范围）")
@@ -0,0 +1,49 @@
+import base64
+import json
+from typing import Optional, Union
+from pydantic import ValidationError
+from app.metrics_store import METRIC_PREFIX
+from app.schemas import ScreeningCursor
+
+# 游标分页支持的排序字段（另外支持 metric.<指标名>），都以股票代码作为第二排序键
+CURSOR_SORT_COLUMNS = ('total_score', 'completeness_ratio', 'stock_code')
+
+
+def cursor_sort_column(sort_by: str) -> str:
+    """把排序参数转换为游标分页的排序字段，不支持时抛出 ValueError"""
+    sort_by = 'total_score' if sort_by == 'overall_score' else sort_by
+    if sort_by in CURSOR_SORT_COLUMNS or (sort_by.startswith(METRIC_PREFIX) and len(sort_by) > len(METRIC_PREFIX)):
+        return sort_by
+    raise ValueError(f"游标分页不支持按 {sort_by} 排序，可选: overall_score、completeness_ratio、stock_code、metric.<指标名>")
+
+
+def encode_cursor(
+    sort_by: str,
+    sort_order: str,
+    value: Optional[Union[float, str]],
+    stock_code: str,
+    generation: int
+) -> str:
+    """把 (排序值, 股票代码, 数据版本) 编码为不透明的游标字符串"""
+    payload = json.dumps(
+        [sort_by, sort_order, value, stock_code, generation],
+        ensure_ascii=False,
+        separators=(',', ':')
+    )
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token: str) -> ScreeningCursor:
+    """解析游标字符串，格式错误时抛出 ValueError"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        sort_by, sort_order, value, stock_code, generation = json.loads(base64.urlsafe_b64decode(padded))
+        return ScreeningCursor(
+            sort_by=sort_by,
+            sort_order=sort_order,
+            value=value,
+            stock_code=stock_code,
+            generation=generation
+        )
+    except (ValueError, TypeError, ValidationError) as e:
+        raise ValueError(f"无效的分页游标: {token}") from e
@@ -0,0 +1,318 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from app.cache_database import SessionLocal as CacheSessionLocal
+from app.cache_generation import get_generation
+from app.crud import financial_score_to_dict
+from app.metrics_store import METRIC_OPERATORS, METRIC_PREFIX
+from app.screening_cursor import cursor_sort_column
+from app.search_index import StockSearchIndex
+from app.models import FinancialScoresCache, FinancialMetricCache
+from app.schemas import ScreeningFilterParams
+
+try:
+    import numpy as np
+except ImportError:  # 未安装 numpy 时选股查询直接使用 SQLite
+    np = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 支持排序的字段（与 FinancialScoresCache 列名一致）
+SORT_COLUMNS = (
+    'id', 'stock_code', 'stock_name', 'total_score', 'grade', 'completeness_ratio',
+    'sector_name', 'data_date', 'created_at', 'updated_at'
+)
+
+
+def _categorize(values: Sequence[Optional[str]]) -> Tuple[Dict[str, int], "np.ndarray"]:
+    """把文本列编码为分类编号（按文本排序编号，空值为 -1）"""
+    categories = {value: code for code, value in enumerate(sorted({v for v in values if v is not None}))}
+    codes = np.fromiter((categories.get(v, -1) if v is not None else -1 for v in values), dtype=np.int32, count=len(values))
+    return categories, codes
+
+
+def _sort_keys(values: Sequence[Any]) -> Tuple["np.ndarray", "np.ndarray"]:
+    """生成排序键：数值列直接使用数值，文本/日期列使用排序编号；同时返回空值标记"""
+    nulls = np.fromiter((v is None for v in values), dtype=bool, count=len(values))
+    if all(isinstance(v, (int, float)) for v in values if v is not None):
+        keys = np.fromiter((v if v is not None else 0.0 for v in values), dtype=np.float64, count=len(values))
+    else:
+        keys = _categorize(values)[1].astype(np.float64)
+    return keys, nulls
+
+
+class ScreeningIndex:
+    """
+    financial_scores 缓存的内存列式索引（只读，数据变化后整体重建替换）
+    - 数值列、分类编号和小写搜索文本保存为 NumPy 数组，筛选条件计算为向量化掩码
+    - 每个排序字段预先计算升序/降序排列（与 SQLite 一致：升序空值在前，降序空值在后）
+    - 每个指标一列 float64 数组（缺失为 NaN），指标筛选和按指标排序同样走向量化计算
+    - 关键词搜索（含拼音全拼/首字母）使用按综合得分排列的 n-gram 倒排索引
+    - 响应行在建立索引时转换好，查询只做掩码、切片和取行
+    """
+
+    def __init__(self, items: List[FinancialScoresCache], generation: int, metric_rows: Sequence[Tuple[str, str, Optional[float]]] = ()):
+        self.generation = generation
+        self.size = len(items)
+        self.rows = [financial_score_to_dict(item) for item in items]
+
+        self.ids = np.fromiter((row['id'] for row in self.rows), dtype=np.int64, count=self.size)
+        self.codes = np.array([row['stock_code'] for row in self.rows], dtype=str)
+        # 股票代码的排序名次，游标分页用作第二排序键
+        self.code_ranks = np.argsort(np.argsort(self.codes, kind='stable'), kind='stable')
+        self.codes_lower = np.array([(row['stock_code'] or '').lower() for row in self.rows], dtype=str)
+        self.names_lower = np.array([(row['stock_name'] or '').lower() for row in self.rows], dtype=str)
+        self.total_score = np.fromiter(
+            (row['total_score'] if row['total_score'] is not None else np.nan for row in self.rows),
+            dtype=np.float64, count=self.size
+        )
+        self.completeness_ratio = np.fromiter(
+            (row['completeness_ratio'] if row['completeness_ratio'] is not None else np.nan for row in self.rows),
+            dtype=np.float64, count=self.size
+        )
+        self.grades, self.grade_codes = _categorize([row['grade'] for row in self.rows])
+        self.sectors, self.sector_codes = _categorize([row['sector_name'] for row in self.rows])
+
+        # 排序字段 -> (升序排列, 降序排列)，相同值按股票代码同向排列（与游标分页的顺序一致）
+        self.sort_orders: Dict[str, Tuple["np.ndarray", "np.ndarray"]] = {}
+        for column in SORT_COLUMNS:
+            keys, nulls = _sort_keys([row[column] for row in self.rows])
+            self.sort_orders[column] = (
+                np.lexsort((self.code_ranks, keys, ~nulls)),
+                np.lexsort((-self.code_ranks, -keys, nulls))
+            )
+
+        self.search_index = StockSearchIndex(
+            [row['stock_code'] for row in self.rows],
+            [row['stock_name'] for row in self.rows],
+            self.sort_orders['total_score'][1]
+        )
+
+        # 指标名 -> 与 rows 对齐的数值数组；排序字段 metric.<指标名> 同样预先计算排列
+        positions = {row['stock_code']: i for i, row in enumerate(self.rows)}
+        self.metric_values: Dict[str, "np.ndarray"] = {}
+        for stock_code, metric_key, value in metric_rows:
+            position = positions.get(stock_code)
+            if position is None or value is None:
+                continue
+            values = self.metric_values.get(metric_key)
+            if values is None:
+                values = self.metric_values[metric_key] = np.full(self.size, np.nan)
+            values[position] = value
+        for metric_key, values in self.metric_values.items():
+            nulls = np.isnan(values)
+            keys = np.where(nulls, 0.0, values)
+            self.sort_orders[f'{METRIC_PREFIX}{metric_key}'] = (
+                np.lexsort((self.code_ranks, keys, ~nulls)),
+                np.lexsort((-self.code_ranks, -keys, nulls))
+            )
+
+    def _mask(self, params: ScreeningFilterParams) -> Optional["np.ndarray"]:
+        """按筛选参数计算匹配掩码；条件不可能满足时返回 None"""
+        mask = np.ones(self.size, dtype=bool)
+
+        # SQLite 的 LIKE 对 ASCII 不区分大小写，这里统一按小写匹配；搜索关键词另外匹配名称拼音
+        if params.search:
+            search_mask = np.zeros(self.size, dtype=bool)
+            search_mask[self.search_index.search(params.search)] = True
+            mask &= search_mask
+        else:
+            if params.stock_code:
+                mask &= np.char.find(self.codes_lower, params.stock_code.lower()) >= 0
+            if params.stock_name:
+                mask &= np.char.find(self.names_lower, params.stock_name.lower()) >= 0
+
+        if params.sector_name:
+            code = self.sectors.get(params.sector_name)
+            if code is None:
+                return None
+            mask &= self.sector_codes == code
+
+        # 得分为空的记录与 SQL 比较结果一致（NaN 比较为 False）
+        if params.min_overall_score is not None:
+            mask &= self.total_score >= params.min_overall_score
+        if params.max_overall_score is not None:
+            mask &= self.total_score <= params.max_overall_score
+
+        if params.recommendation:
+            code = self.grades.get(params.recommendation)
+            if code is None:
+                return None
+            mask &= self.grade_codes == code
+
+        # 指标缺失（NaN）的股票比较结果为 False，与 SQL 子查询一致
+        for metric_filter in params.metric_filters:
+            values = self.metric_values.get(metric_filter.key)
+            if values is None:
+                return None
+            mask &= METRIC_OPERATORS[metric_filter.op](values, metric_filter.value)
+
+        return mask
+
+    def query(self, params: ScreeningFilterParams) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+        """筛选、排序、分页，返回 (当前页数据, 总数)；排序字段不支持时返回 None 由调用方回退到 SQLite"""
+        sort_by = 'total_score' if params.sort_by == 'overall_score' else params.sort_by
+        if sort_by and sort_by.startswith(METRIC_PREFIX):
+            # 没有任何股票具有该指标时，所有值都为空，只按股票代码排列
+            sort_by = sort_by if sort_by in self.sort_orders else 'stock_code'
+        elif sort_by and sort_by not in SORT_COLUMNS:
+            if hasattr(FinancialScoresCache, sort_by):
+                return None
+            sort_by = None
+
+        mask = self._mask(params)
+        if mask is None:
+            return [], 0
+
+        if sort_by:
+            ascending, descending = self.sort_orders[sort_by]
+            order = descending if params.sort_order == 'desc' else ascending
+            matched = order[mask[order]]
+        else:
+            matched = np.flatnonzero(mask)
+
+        offset = (params.page - 1) * params.page_size
+        page = matched[offset:offset + params.page_size]
+        return [self.rows[i] for i in page], int(matched.size)
+
+    def query_after(self, params: ScreeningFilterParams) -> Tuple[List[Dict[str, Any]], int, Optional[Tuple[Any, str]]]:
+        """游标分页：按 (排序值, 股票代码) 取 params.after 之后的一页，返回 (当前页数据, 总数, 下一页起点)"""
+        sort_by = cursor_sort_column(params.sort_by)
+        mask = self._mask(params)
+        if mask is None:
+            return [], 0, None
+        total = int(np.count_nonzero(mask))
+
+        if sort_by == 'stock_code':
+            values = None
+        elif sort_by.startswith(METRIC_PREFIX):
+            values = self.metric_values.get(sort_by[len(METRIC_PREFIX):], np.full(self.size, np.nan))
+        else:
+            values = getattr(self, sort_by)
+
+        descending = params.sort_order == 'desc'
+        if params.after is not None:
+            code = params.after.stock_code
+            after_code = self.codes < code if descending else self.codes > code
+            if values is None:
+                mask &= after_code
+            else:
+                # 与 SQLite 一致：空值（NaN）升序排在最前，降序排在最后
+                nulls = np.isnan(values)
+                value = params.after.value
+                if value is None:
+                    mask &= (nulls & after_code) if descending else ((nulls & after_code) | ~nulls)
+                elif descending:
+                    mask &= (values < value) | ((values == value) & after_code) | nulls
+                else:
+                    mask &= (values > value) | ((values == value) & after_code)
+
+        candidates = np.flatnonzero(mask)
+        ranks = self.code_ranks[candidates]
+        if values is None:
+            order = np.argsort(-ranks if descending else ranks)
+        else:
+            keys = values[candidates]
+            nulls = np.isnan(keys)
+            keys = np.where(nulls, 0.0, keys)
+            order = np.lexsort((-ranks, -keys, nulls)) if descending else np.lexsort((ranks, keys, ~nulls))
+        page = candidates[order[:params.page_size]]
+
+        next_after = None
+        if candidates.size > params.page_size:
+            last = page[-1]
+            if values is None:
+                next_after = (self.rows[last]['stock_code'], self.rows[last]['stock_code'])
+            else:
+                next_after = (None if np.isnan(values[last]) else float(values[last]), self.rows[last]['stock_code'])
+        return [self.rows[i] for i in page], total, next_after
+
+    def suggest(self, keyword: str, limit: int, fields: Sequence[str]) -> List[Dict[str, Any]]:
+        """代码、名称或拼音匹配关键词的股票，按综合得分取前 limit 名，只返回指定字段"""
+        return [
+            {field: self.rows[i][field] for field in fields}
+            for i in self.search_index.search(keyword, limit)
+        ]
+
+    def top(self, limit: int, fields: Sequence[str]) -> List[Dict[str, Any]]:
+        """综合得分前 limit 名，只返回指定字段"""
+        descending = self.sort_orders['total_score'][1]
+        return [
+            {field: self.rows[i][field] for field in fields}
+            for i in descending[:limit]
+        ]
+
+
+_index: Optional[ScreeningIndex] = None
+_build_lock = threading.Lock()
+_schedule_lock = threading.Lock()
+_rebuild_thread: Optional[threading.Thread] = None
+
+
+def build_screening_index() -> Optional[ScreeningIndex]:
+    """从缓存数据库重建索引，建好后整体替换当前索引；数据版本未变化时直接返回当前索引"""
+    global _index
+    if np is None:
+        return None
+
+    with _build_lock:
+        generation = get_generation('financial_scores', max_age=0)
+        if _index is not None and _index.generation == generation:
+            return _index
+
+        start = time.perf_counter()
+        cache_db = CacheSessionLocal()
+        try:
+            items = cache_db.query(FinancialScoresCache).order_by(FinancialScoresCache.id).all()
+            metric_rows = cache_db.query(
+                FinancialMetricCache.stock_code,
+                FinancialMetricCache.metric_key,
+                FinancialMetricCache.value
+            ).all()
+        finally:
+            cache_db.close()
+
+        index = ScreeningIndex(items, generation, metric_rows)
+        _index = index
+        logger.info(
+            f"选股内存索引已重建：{index.size} 条记录，数据版本 {generation}，"
+            f"耗时 {round((time.perf_counter() - start) * 1000, 1)}ms"
+        )
+        return index
+
+
+def schedule_screening_index_rebuild():
+    """在后台线程重建索引（已有重建在进行时不重复启动）"""
+    global _rebuild_thread
+    if np is None:
+        return
+
+    def rebuild():
+        try:
+            build_screening_index()
+        except Exception as e:
+            logger.error(f"重建选股内存索引失败: {e}")
+
+    with _schedule_lock:
+        if _rebuild_thread is not None and _rebuild_thread.is_alive():
+            return
+        _rebuild_thread = threading.Thread(target=rebuild, name='screening-index', daemon=True)
+        _rebuild_thread.start()
+
+
+def get_screening_index() -> Optional[ScreeningIndex]:
+    """
+    获取与当前数据版本一致的索引
+    索引尚未建立或数据已更新时触发后台重建并返回 None，调用方回退到 SQLite 查询
+    """
+    if np is None:
+        return None
+
+    index = _index
+    if index is not None and index.generation == get_generation('financial_scores'):
+        return index
+
+    schedule_screening_index_rebuild()
+    return None
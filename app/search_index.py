@@ -0,0 +1,87 @@
+import logging
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    from pypinyin import Style, lazy_pinyin
+except ImportError:  # 未安装 pypinyin 时只按代码和名称匹配
+    lazy_pinyin = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 名称拼音的缓存数量（股票名称很少变化，重建索引时直接复用）
+PINYIN_CACHE_SIZE = 20000
+# 缓存表 name_pinyin 列中每个拼音键前的分隔符，SQLite 回退查询用 LIKE '%|关键词%' 做拼音前缀匹配
+PINYIN_SEPARATOR = '|'
+
+
+@lru_cache(maxsize=PINYIN_CACHE_SIZE)
+def pinyin_keys(name: str) -> Tuple[str, ...]:
+    """名称的 (全拼, 首字母)，如 贵州茅台 -> (guizhoumaotai, gzmt)；未安装 pypinyin 时为空"""
+    if lazy_pinyin is None or not name:
+        return ()
+    full = ''.join(lazy_pinyin(name)).lower()
+    initials = ''.join(lazy_pinyin(name, style=Style.FIRST_LETTER)).lower()
+    return full, initials
+
+
+def pinyin_search_text(name: Optional[str]) -> Optional[str]:
+    """写入缓存表 name_pinyin 列的拼音文本，如 贵州茅台 -> |guizhoumaotai|gzmt；未安装 pypinyin 时为 None"""
+    keys = pinyin_keys((name or '').lower())
+    return ''.join(PINYIN_SEPARATOR + key for key in keys) or None
+
+
+def _ngrams(text: str) -> set:
+    """单字和相邻两字组成的 n-gram"""
+    return set(text) | {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class StockSearchIndex:
+    """
+    股票代码/名称的 n-gram 倒排索引，同时索引名称的拼音全拼和首字母（如 gzmt -> 贵州茅台）
+    - 倒排表按综合得分从高到低排列，取前 N 条时遇到足够的匹配即可停止
+    - 关键词的 n-gram 只用于缩小候选范围，最终确认：代码/名称按子串匹配（与 LIKE '%q%' 语义一致），
+      拼音按前缀匹配（否则单个字母几乎匹配所有名称）
+    """
+
+    def __init__(self, codes: Sequence[Optional[str]], names: Sequence[Optional[str]], rank_order: Sequence[int]):
+        self.rank_order = [int(position) for position in rank_order]
+        self.keys: List[Tuple[str, str]] = []
+        self.pinyin: List[Tuple[str, ...]] = []
+        for code, name in zip(codes, names):
+            name = (name or '').lower()
+            self.keys.append(((code or '').lower(), name))
+            self.pinyin.append(pinyin_keys(name))
+
+        self.postings: Dict[str, List[int]] = {}
+        for position in self.rank_order:
+            grams = set()
+            for key in self.keys[position] + self.pinyin[position]:
+                grams |= _ngrams(key)
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(position)
+
+    def search(self, keyword: str, limit: Optional[int] = None) -> List[int]:
+        """返回匹配记录的位置（按综合得分从高到低），limit 为空时返回全部匹配"""
+        keyword = keyword.strip().lower()
+        if not keyword:
+            return self.rank_order[:limit]
+
+        grams = _ngrams(keyword) if len(keyword) > 1 else {keyword}
+        candidates = None
+        for gram in grams:
+            posting = self.postings.get(gram)
+            if posting is None:
+                return []
+            if candidates is None or len(posting) < len(candidates):
+                candidates = posting
+
+        matched = []
+        for position in candidates:
+            if (any(keyword in key for key in self.keys[position])
+                    or any(key.startswith(keyword) for key in self.pinyin[position])):
+                matched.append(position)
+                if limit is not None and len(matched) >= limit:
+                    break
+        return matched
@@ -104,25 +104,201 @@ class API {
   }
   
   /**
-   * 手动触发数据同步
+   * 手动触发数据同步（后台任务，等待完成后返回同步结果）
    * @param {boolean} force - 是否强制全量同步
+   * @param {Function} onProgress - 进度回调，参数为任务状态
    * @returns {Promise<Object>} 同步结果
    */
-  static async triggerSync(force = false) {
-    const url = `${this.BASE_URL}/api/sync/trigger?force=${force}`;
-    
+  static async triggerSync(force = false, onProgress = null) {
     try {
-      const response = await this.fetch(url, {
-        method: 'POST',
-      });
-      const data = await response.json();
-      return data;
+      return await this.runSyncJob(`/api/sync/trigger?force=${force}`, onProgress);
     } catch (error) {
       console.error('触发数据同步失败:', error);
       throw error;
     }
   }
+
+  /**
+   * 查询后台同步任务状态
+   * @param {string} jobId - 任务ID
+   * @returns {Promise<Object>} 任务状态
+   */
+  static async getSyncJob(jobId) {
+    const url = `${this.BASE_URL}/api/sync/jobs/${jobId}`;
+    const response = await this.fetch(url);
+    return response.json();
+  }
+
+  /**
+   * 提交后台同步任务并轮询直到完成
+   * @param {string} path - 同步接口路径（POST）
+   * @param {Function} onProgress - 进度回调，参数为任务状态
+   * @param {number} interval - 轮询间隔（毫秒）
+   * @returns {Promise<Object>} 同步结果（任务的 result 字段）
+   */
+  static async runSyncJob(path, onProgress = null, interval = 1000) {
+    const response = await this.fetch(`${this.BASE_URL}${path}`, {
+      method: 'POST',
+    });
+    let job = await response.json();
+
+    while (job.status === 'queued' || job.status === 'running') {
+      if (onProgress) {
+        onProgress(job);
+      }
+      await new Promise(resolve => setTimeout(resolve, interval));
+      job = await this.getSyncJob(job.job_id);
+    }
+
+    return job.result || { success: false, error: job.error };
+  }
+
+  /**
+   * 格式化同步任务进度文本
+   * @param {Object} job - 任务状态
+   * @returns {string} 进度文本
+   */
+  static formatSyncProgress(job) {
+    if (job.rows_total) {
+      const percent = Math.min(100, Math.round(job.rows_processed / job.rows_total * 100));
+      return `同步中 ${percent}%`;
+    }
+    return '同步中...';
+  }
   
+  static MARKET_BREADTH_MEDIA_TYPE = 'application/vnd.market-breadth+octet-stream';
+
+  /**
+   * 获取市场宽度热力图数据（协商二进制格式，服务端不支持时为 JSON）
+   * @param {URLSearchParams|Object} params - 查询参数
+   * @returns {Promise<Object>} 与 JSON 响应结构相同的数据
+   */
+  static async getMarketBreadth(params) {
+    const query = params instanceof URLSearchParams ? params.toString() : this.buildQueryParams(params);
+    const response = await this.fetch(`${this.BASE_URL}/api/market-breadth${query ? '?' + query : ''}`, {
+      headers: { 'Accept': `${this.MARKET_BREADTH_MEDIA_TYPE}, application/json;q=0.9` },
+    });
+    const contentType = response.headers.get('Content-Type') || '';
+    if (contentType.startsWith(this.MARKET_BREADTH_MEDIA_TYPE)) {
+      return this.decodeMarketBreadth(await response.arrayBuffer());
+    }
+    return response.json();
+  }
+
+  /**
+   * 获取市场宽度滚动统计（服务端按窗口和数据版本缓存）
+   * @param {Object} params - { window, history, series, stats, start_date, end_date }，series/stats 为逗号分隔字符串
+   * @returns {Promise<Object>} { dates, series: { 名称: { value, ma, zscore, percentile, ema, thrust_dates } } }
+   */
+  static async getMarketBreadthAnalytics(params = {}) {
+    const queryParams = this.buildQueryParams(params);
+    const url = `${this.BASE_URL}/api/market-breadth/analytics${queryParams ? '?' + queryParams : ''}`;
+    const response = await this.fetch(url);
+    return response.json();
+  }
+
+  /**
+   * 获取行业宽度相关系数矩阵和领先/滞后相关（服务端按区间、行业和数据版本缓存）
+   * @param {Object} params - { start_date, end_date, days, industries, max_lag }，industries 为逗号分隔字符串
+   * @returns {Promise<Object>} { columns, correlation, lags, lagged, best_lag, best_correlation, ... }
+   */
+  static async getMarketBreadthCorrelation(params = {}) {
+    const queryParams = this.buildQueryParams(params);
+    const url = `${this.BASE_URL}/api/market-breadth/correlation${queryParams ? '?' + queryParams : ''}`;
+    const response = await this.fetch(url);
+    return response.json();
+  }
+
+  /**
+   * 解码市场宽度二进制格式（布局见 app/market_breadth_binary.py）
+   * 文件头 24 字节：魔数 MBH1、版本(uint16)、填充、交易日数(uint32)、列数(uint32)、首日天数(int32)、元数据长度(uint32)
+   * @param {ArrayBuffer} buffer - 响应内容
+   * @returns {Object} 与 JSON 响应结构相同的数据
+   */
+  static decodeMarketBreadth(buffer) {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic !== 'MBH1' || view.getUint16(4, true) !== 1) {
+      throw new Error('无法识别的市场宽度数据格式');
+    }
+    const dateCount = view.getUint32(8, true);
+    const columnCount = view.getUint32(12, true);
+    const baseDay = view.getInt32(16, true);
+    const metaLength = view.getUint32(20, true);
+
+    const align = offset => offset + ((8 - offset % 8) % 8);
+    const arrayTypes = { i1: Int8Array, i2: Int16Array, i4: Int32Array, f8: Float64Array };
+    let offset = 24;
+    const meta = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, offset, metaLength)));
+    offset = align(offset + metaLength);
+
+    const dayOffsets = new Int32Array(buffer, offset, dateCount);
+    offset = align(offset + dayOffsets.byteLength);
+    const ValueArray = arrayTypes[meta.value_dtype.slice(1)];
+    const values = new ValueArray(buffer, offset, dateCount * columnCount);
+    offset = align(offset + values.byteLength);
+    const TotalArray = arrayTypes[meta.total_dtype.slice(1)];
+    const totals = new TotalArray(buffer, offset, dateCount);
+
+    const { value_dtype, total_dtype, ...rest } = meta;
+    // 交易日期缺失的行偏移为 int32 最小值（MISSING_DAY），与 JSON 响应一致解码为 null
+    const dates = Array.from(dayOffsets, day => (
+      day === -2147483648 ? null : new Date((baseDay + day) * 86400000).toISOString().slice(0, 10)
+    ));
+    const data = dates.map((_, i) => Array.from(values.subarray(i * columnCount, (i + 1) * columnCount)));
+    return { ...rest, dates, data, total_breadth_data: Array.from(totals) };
+  }
+
+  /**
+   * 把市场宽度增量数据（since 请求返回 delta=true）合并到本地全量数据
+   * 新增/变化的交易日按日期替换或插入，行按增量返回的完整列重新对齐（新增行业在旧交易日补 0），并重新计算统计信息
+   * @param {Object} base - 本地全量数据
+   * @param {Object} delta - 增量数据
+   * @returns {Object} 合并后的全量数据
+   */
+  static applyMarketBreadthDelta(base, delta) {
+    const columns = delta.columns;
+    const baseIndex = new Map(base.columns.map((name, i) => [name, i]));
+    const rows = new Map();
+
+    base.dates.forEach((date, i) => {
+      const row = base.data[i];
+      rows.set(date, {
+        values: columns.map(name => (baseIndex.has(name) ? row[baseIndex.get(name)] : 0)),
+        total: base.total_breadth_data[i],
+      });
+    });
+    delta.dates.forEach((date, i) => {
+      rows.set(date, { values: delta.data[i], total: delta.total_breadth_data[i] });
+    });
+
+    const dates = Array.from(rows.keys()).sort();
+    const data = dates.map(date => rows.get(date).values);
+    const values = data.flat();
+
+    const statistics = {
+      total_records: dates.length,
+      date_range: dates.length ? `${dates[dates.length - 1]} to ${dates[0]}` : null,
+      industry_count: columns.length,
+      trading_days: dates.length,
+    };
+    if (values.length) {
+      statistics.min_value = values.reduce((min, v) => Math.min(min, v), Infinity);
+      statistics.max_value = values.reduce((max, v) => Math.max(max, v), -Infinity);
+      statistics.avg_value = Math.round(values.reduce((sum, v) => sum + v, 0) / values.length * 100) / 100;
+    }
+
+    return {
+      dates,
+      columns,
+      data,
+      total_breadth_data: dates.map(date => rows.get(date).total),
+      statistics,
+      last_update: delta.last_update || base.last_update,
+      sync_token: delta.sync_token,
+    };
+  }
+
   /**
    * 健康检查
    * @returns {Promise<Object>} 健康状态
@@ -653,7 +653,9 @@ class Events {
     syncBtnText.textContent = '同步中...';
 
     try {
-      const result = await API.triggerSync(false); // 使用增量同步
+      const result = await API.triggerSync(false, job => { // 使用增量同步
+        syncBtnText.textContent = API.formatSyncProgress(job);
+      });
 
       if (result.success) {
         this.showSuccessToast(`同步成功！共同步 ${result.record_count || 0} 条记录`);
@@ -720,11 +722,28 @@ class Events {
       }
 
       timeEl.innerHTML = `<i class="bi bi-clock"></i> 更新时间：${timeText}`;
+      // 鼠标悬停显示各数据集最近几次同步的耗时趋势
+      const trendText = this.formatSyncTrend(status.history);
+      if (trendText) {
+        timeEl.title = `最近同步耗时（秒，按时间先后）\n${trendText}`;
+      }
     } else {
       timeEl.innerHTML = '<i class="bi bi-clock"></i> 暂无数据';
     }
   }
 
+  /**
+   * 格式化同步耗时趋势
+   * @param {Object} history - /api/sync/status 返回的 sync.history
+   * @returns {string} 每个数据集一行的耗时序列
+   */
+  static formatSyncTrend(history) {
+    return Object.entries(history || {})
+      .filter(([, trend]) => trend.runs > 0)
+      .map(([dataset, trend]) => `${dataset}: ${trend.total_seconds.join(' → ')}`)
+      .join('\n');
+  }
+
   /**
    * 显示成功提示
    * @param {string} message - 成功消息
@@ -44,16 +44,10 @@ class FundAnalysis {
         syncBtnText.textContent = '同步中...';
 
         try {
-            const response = await API.fetch('/api/fund-analysis/sync', {
-                method: 'POST'
+            const result = await API.runSyncJob('/api/fund-analysis/sync', job => {
+                syncBtnText.textContent = API.formatSyncProgress(job);
             });
 
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
-            }
-
-            const result = await response.json();
-
             if (result.success) {
                 this.showSuccessToast(`同步成功！共同步 ${result.record_count || 0} 条记录`);
                 // 重新加载数据
@@ -2,6 +2,8 @@
  * 市场宽度分析模块
  */
 class MarketBreadth {
+    static CACHE_KEY = 'marketBreadthData';
+
     constructor() {
         this.heatmapChart = null;
         this.trendChart = null;
@@ -80,16 +82,10 @@ class MarketBreadth {
         syncBtnText.textContent = '同步中...';
 
         try {
-            const response = await API.fetch('/api/market-breadth/sync', {
-                method: 'POST'
+            const result = await API.runSyncJob('/api/market-breadth/sync', job => {
+                syncBtnText.textContent = API.formatSyncProgress(job);
             });
 
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
-            }
-
-            const result = await response.json();
-
             if (result.success) {
                 this.showSuccess(`同步成功！共同步 ${result.record_count} 条记录`);
                 // 重新加载数据
@@ -185,18 +181,24 @@ class MarketBreadth {
             if (endDate) params.append('end_date', endDate);
             if (industries && industries.length > 0) params.append('industries', industries.join(','));
 
-            const response = await API.fetch(`/api/market-breadth?${params.toString()}`);
+            // 未筛选时使用本地缓存的全量数据，只请求上次同步之后的增量
+            const unfiltered = !params.toString();
+            const cached = unfiltered ? this.loadCachedData() : null;
+            if (cached) params.append('since', cached.sync_token);
 
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
-            }
-
-            const data = await response.json();
+            let data = await API.getMarketBreadth(params);
 
             if (data.error) {
                 throw new Error(data.error || data.message);
             }
 
+            if (data.delta && cached) {
+                data = API.applyMarketBreadthDelta(cached, data);
+            }
+            if (unfiltered) {
+                this.saveCachedData(data);
+            }
+
             this.currentData = data;
             this.updateLastUpdateTime(data.last_update);
         } catch (error) {
@@ -205,6 +207,28 @@ class MarketBreadth {
         }
     }
 
+    loadCachedData() {
+        try {
+            const cached = JSON.parse(localStorage.getItem(MarketBreadth.CACHE_KEY));
+            return cached && cached.sync_token ? cached : null;
+        } catch (error) {
+            return null;
+        }
+    }
+
+    saveCachedData(data) {
+        try {
+            if (data.sync_token) {
+                localStorage.setItem(MarketBreadth.CACHE_KEY, JSON.stringify(data));
+            } else {
+                localStorage.removeItem(MarketBreadth.CACHE_KEY);
+            }
+        } catch (error) {
+            // 存储空间不足时放弃本地缓存，下次请求全量数据
+            console.warn('缓存市场宽度数据失败:', error);
+        }
+    }
+
     updateLastUpdateTime(lastUpdate) {
         const timeEl = document.getElementById('lastUpdateTime');
         if (timeEl && lastUpdate) {
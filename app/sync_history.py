@@ -0,0 +1,142 @@
+import functools
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+from sqlalchemy import desc
+from app.cache_database import SessionLocal as CacheSessionLocal
+from app.models import SyncRunHistory
+from app.sync_pipeline import SYNC_PHASES, get_progress
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 每个数据集保留的同步运行历史条数
+MAX_RUN_HISTORY = 200
+
+# /api/sync/status 默认返回的最近运行次数
+DEFAULT_TREND_RUNS = 10
+
+
+def _save_run(dataset: str, started_at: float, total_seconds: float, result: dict):
+    """把一次同步运行的耗时统计写入 sync_run_history，并清理过旧的记录"""
+    progress = get_progress(dataset) or {}
+    phase_times = progress.get('phase_times', {})
+    rows_scanned = progress.get('rows_processed', 0)
+
+    run = SyncRunHistory(
+        dataset=dataset,
+        sync_type=result.get('sync_type'),
+        status='success' if result.get('success') else 'failed',
+        started_at=datetime.fromtimestamp(started_at).isoformat(),
+        finished_at=datetime.now().isoformat(),
+        total_seconds=round(total_seconds, 3),
+        rows_scanned=rows_scanned,
+        rows_written=result.get('inserted', 0) + result.get('updated', 0),
+        rows_per_sec=round(rows_scanned / total_seconds, 1) if total_seconds > 0 else 0.0,
+        remote_bytes=progress.get('remote_bytes', 0),
+        phase_timings=json.dumps({
+            phase: round(phase_times[phase], 4) for phase in SYNC_PHASES if phase in phase_times
+        }),
+        error_message=(result.get('error') or '')[:500] or None
+    )
+
+    cache_db = CacheSessionLocal()
+    try:
+        cache_db.add(run)
+        stale_ids = [
+            row.id for row in cache_db.query(SyncRunHistory.id)
+            .filter(SyncRunHistory.dataset == dataset)
+            .order_by(desc(SyncRunHistory.id))
+            .offset(MAX_RUN_HISTORY)
+        ]
+        if stale_ids:
+            cache_db.query(SyncRunHistory)\
+                .filter(SyncRunHistory.id.in_(stale_ids))\
+                .delete(synchronize_session=False)
+        cache_db.commit()
+    finally:
+        cache_db.close()
+
+
+def record_sync_run(dataset: str) -> Callable:
+    """
+    同步函数装饰器：记录每次同步的总耗时、各阶段耗时、处理速度和传输量到 sync_run_history
+    因锁被占用而跳过的同步不记录；记录失败只打日志，不影响同步结果
+    """
+    def decorator(func: Callable[[], dict]) -> Callable[[], dict]:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs) -> dict:
+            started_at = time.time()
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            total_seconds = time.perf_counter() - start
+
+            if result.get('sync_type') != 'skipped':
+                try:
+                    _save_run(dataset, started_at, total_seconds, result)
+                except Exception as e:
+                    logger.warning(f"记录 {dataset} 同步运行历史失败: {e}")
+            return result
+        return wrapper
+    return decorator
+
+
+def _run_to_dict(run: SyncRunHistory) -> dict:
+    return {
+        'sync_type': run.sync_type,
+        'status': run.status,
+        'started_at': run.started_at,
+        'finished_at': run.finished_at,
+        'total_seconds': run.total_seconds,
+        'rows_scanned': run.rows_scanned,
+        'rows_written': run.rows_written,
+        'rows_per_sec': run.rows_per_sec,
+        'remote_bytes': run.remote_bytes,
+        'phase_timings': json.loads(run.phase_timings) if run.phase_timings else {},
+        'error_message': run.error_message
+    }
+
+
+def get_sync_run_history(dataset: str, limit: int = DEFAULT_TREND_RUNS) -> List[dict]:
+    """获取数据集最近 limit 次同步运行记录（最新的在前）"""
+    cache_db = CacheSessionLocal()
+    try:
+        runs = cache_db.query(SyncRunHistory)\
+            .filter(SyncRunHistory.dataset == dataset)\
+            .order_by(desc(SyncRunHistory.id))\
+            .limit(limit)\
+            .all()
+        return [_run_to_dict(run) for run in runs]
+    finally:
+        cache_db.close()
+
+
+def get_sync_trend(datasets: List[str], limit: int = DEFAULT_TREND_RUNS) -> Dict[str, dict]:
+    """
+    各数据集最近 limit 次同步的趋势：
+    - last: 最近一次运行的完整统计
+    - total_seconds / rows_per_sec / remote_bytes: 按时间先后排列的序列，便于画趋势图
+    - phase_avg_seconds: 各阶段平均耗时，定位变慢的阶段
+    """
+    trend = {}
+    for dataset in datasets:
+        runs = get_sync_run_history(dataset, limit)
+        runs.reverse()
+
+        phase_avg: Dict[str, float] = {}
+        for phase in SYNC_PHASES:
+            values = [run['phase_timings'][phase] for run in runs if phase in run['phase_timings']]
+            if values:
+                phase_avg[phase] = round(sum(values) / len(values), 4)
+
+        trend[dataset] = {
+            'runs': len(runs),
+            'last': runs[-1] if runs else None,
+            'total_seconds': [run['total_seconds'] for run in runs],
+            'rows_per_sec': [run['rows_per_sec'] for run in runs],
+            'remote_bytes': [run['remote_bytes'] for run in runs],
+            'phase_avg_seconds': phase_avg
+        }
+    return trend
@@ -0,0 +1,181 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from app.sync_pipeline import get_progress
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 保留最近的任务数量，超出后丢弃最早完成的任务
+MAX_JOB_HISTORY = 50
+
+# 任务类型 -> 覆盖的数据集
+JOB_DATASETS: Dict[str, List[str]] = {
+    'all': ['stock_details', 'financial_scores', 'market_breadth', 'etf_cluster'],
+    'market_breadth': ['market_breadth'],
+    'etf_cluster': ['etf_cluster'],
+}
+
+_jobs: "OrderedDict[str, dict]" = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def _job_runner(job: dict, func: Callable[[], dict]):
+    """在后台线程中执行同步任务并记录结果"""
+    job['status'] = 'running'
+    job['started_at'] = time.time()
+    try:
+        result = func()
+        job['result'] = result
+        job['status'] = 'success' if result.get('success') else 'failed'
+        job['error'] = result.get('error')
+    except Exception as e:
+        logger.error(f"后台同步任务 {job['job_id']} 异常: {e}")
+        job['status'] = 'failed'
+        job['error'] = str(e)
+    finally:
+        job['finished_at'] = time.time()
+        logger.info(f"后台同步任务 {job['job_id']} ({job['kind']}) 结束，状态: {job['status']}")
+
+
+def _find_running_job(kind: str, force: bool) -> Optional[dict]:
+    """查找覆盖相同数据集且仍在运行的任务（强制全量请求只合并到强制全量任务上）"""
+    datasets = set(JOB_DATASETS[kind])
+    for job in reversed(_jobs.values()):
+        if job['status'] not in ('queued', 'running'):
+            continue
+        if not datasets.issubset(job['datasets']):
+            continue
+        if force and not job['force']:
+            continue
+        return job
+    return None
+
+
+def submit_sync_job(kind: str, func: Callable[[], dict], force: bool = False) -> dict:
+    """
+    提交后台同步任务，立即返回任务信息
+    同一数据集已有任务在运行时，直接返回该任务（coalesced=True），不重复启动
+    """
+    if kind not in JOB_DATASETS:
+        raise ValueError(f"未知的同步任务类型: {kind}")
+
+    with _jobs_lock:
+        running_job = _find_running_job(kind, force)
+        if running_job:
+            logger.info(f"同步请求 {kind} 合并到正在运行的任务 {running_job['job_id']}")
+            return dict(get_job_status(running_job['job_id']), coalesced=True)
+
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'kind': kind,
+            'force': force,
+            'datasets': JOB_DATASETS[kind],
+            'status': 'queued',
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'result': None,
+            'error': None
+        }
+        _jobs[job['job_id']] = job
+
+        # 清理过多的已完成任务
+        while len(_jobs) > MAX_JOB_HISTORY:
+            oldest_id = next(
+                (job_id for job_id, item in _jobs.items() if item['status'] not in ('queued', 'running')),
+                None
+            )
+            if oldest_id is None:
+                break
+            _jobs.pop(oldest_id)
+
+    thread = threading.Thread(
+        target=_job_runner,
+        args=(job, func),
+        name=f"sync-job-{kind}",
+        daemon=True
+    )
+    thread.start()
+    logger.info(f"已提交后台同步任务 {job['job_id']} ({kind})")
+
+    return dict(get_job_status(job['job_id']), coalesced=False)
+
+
+def _format_time(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+
+
+def get_job_status(job_id: str) -> Optional[dict]:
+    """
+    获取同步任务状态：阶段、已处理行数、处理速度（行/秒）和预计剩余时间
+    进度由各数据集同步过程上报，任务汇总其覆盖的数据集
+    """
+    job = _jobs.get(job_id)
+    if job is None:
+        return None
+
+    datasets = {}
+    rows_processed = 0
+    rows_total = 0
+    total_known = True
+    phases = []
+
+    for dataset in job['datasets']:
+        progress = get_progress(dataset)
+        # 只统计本任务开始之后的进度，忽略之前同步遗留的状态
+        if progress is None or job['started_at'] is None or progress['started_at'] < job['started_at']:
+            datasets[dataset] = {'phase': 'pending', 'rows_processed': 0, 'rows_total': None}
+            total_known = False
+            continue
+
+        datasets[dataset] = {
+            'phase': progress['phase'],
+            'rows_processed': progress['rows_processed'],
+            'rows_total': progress['rows_total']
+        }
+        rows_processed += progress['rows_processed']
+        if progress['rows_total'] is None:
+            total_known = False
+        else:
+            rows_total += progress['rows_total']
+        if progress['phase'] not in ('done', 'failed'):
+            phases.append(f"{dataset}:{progress['phase']}")
+
+    if job['status'] in ('queued', 'success', 'failed'):
+        phase = job['status']
+    else:
+        phase = ', '.join(phases) if phases else 'finalizing'
+
+    end_time = job['finished_at'] or time.time()
+    elapsed = end_time - job['started_at'] if job['started_at'] else 0
+    rows_per_sec = round(rows_processed / elapsed, 1) if elapsed > 0 else 0.0
+
+    eta_seconds = None
+    if job['status'] == 'running' and total_known and rows_per_sec > 0:
+        eta_seconds = round(max(rows_total - rows_processed, 0) / rows_per_sec, 1)
+    elif job['status'] in ('success', 'failed'):
+        eta_seconds = 0
+
+    return {
+        'job_id': job['job_id'],
+        'kind': job['kind'],
+        'force': job['force'],
+        'status': job['status'],
+        'phase': phase,
+        'created_at': _format_time(job['created_at']),
+        'started_at': _format_time(job['started_at']),
+        'finished_at': _format_time(job['finished_at']),
+        'elapsed_seconds': round(elapsed, 3),
+        'rows_processed': rows_processed,
+        'rows_total': rows_total if total_known else None,
+        'rows_per_sec': rows_per_sec,
+        'eta_seconds': eta_seconds,
+        'datasets': datasets,
+        'result': job['result'],
+        'error': job['error']
+    }
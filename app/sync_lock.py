@@ -0,0 +1,215 @@
+import contextlib
+import functools
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Callable, Optional
+try:
+    import fcntl
+except ImportError:  # Windows 上没有 fcntl，锁文件的修改不加互斥
+    fcntl = None
+from app.cache_database import CACHE_DIR
+from app.config import settings
+from app.sync_pipeline import set_progress_hook
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 等待锁释放时的轮询间隔（秒）
+LOCK_POLL_INTERVAL = 1.0
+
+
+def _lock_path(dataset: str) -> str:
+    return os.path.join(CACHE_DIR, f'sync_{dataset}.lock')
+
+
+@contextlib.contextmanager
+def _guarded(path: str):
+    """
+    修改锁文件（获取、续约、释放）时持有的互斥锁（旁路 .guard 文件上的 flock）
+    锁文件本身会被替换和移走，不能直接对它加 flock；检查持有者和写入在互斥锁内完成，续约不会覆盖别人刚接管的锁
+    """
+    if fcntl is None:
+        yield
+        return
+    fd = os.open(f'{path}.guard', os.O_CREAT | os.O_RDWR)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def _read_holder(path: str) -> Optional[dict]:
+    """读取锁文件中的持有者信息，文件不存在或内容不完整时返回 None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError, OSError):
+        return None
+
+
+class SyncLockLost(RuntimeError):
+    """同步过程中租约已过期并被其他进程接管，本次同步中止（未提交的写入回滚，影子表不替换）"""
+
+
+class SyncLock:
+    """
+    跨进程的数据集同步锁（缓存目录下的锁文件 + 租约）
+    - 通过 O_CREAT|O_EXCL 创建锁文件，同一时间只有一个进程（uvicorn worker）能持有
+    - 锁文件记录租约到期时间，由同步进度上报（读取块、进入提交等阶段）续约，同步卡住时不再续约
+    - 持有进程崩溃或卡死导致租约过期后，其他进程可以接管；原持有者在下一次上报进度时发现并中止
+    - 获取、续约和释放都在 .guard 文件的 flock 内检查持有者并修改锁文件，续约不会覆盖刚被接管的锁
+    """
+
+    def __init__(self, dataset: str, lease_seconds: Optional[int] = None):
+        self.dataset = dataset
+        self.path = _lock_path(dataset)
+        self.lease_seconds = lease_seconds or settings.SYNC_LOCK_LEASE_SECONDS
+        self.token = uuid.uuid4().hex
+        self.lost = False
+        self._renewed_at = 0.0
+
+    def _holder_info(self) -> dict:
+        now = time.time()
+        return {
+            'dataset': self.dataset,
+            'token': self.token,
+            'pid': os.getpid(),
+            'host': socket.gethostname(),
+            'acquired_at': now,
+            'expires_at': now + self.lease_seconds
+        }
+
+    def _try_create(self) -> bool:
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(self._holder_info(), f)
+        return True
+
+    def _break_expired(self) -> bool:
+        """租约过期时移走旧锁文件；移走后发现是刚被别人续上的锁则放回"""
+        holder = _read_holder(self.path)
+        if holder is not None and holder.get('expires_at', 0) > time.time():
+            return False
+
+        stale_path = f'{self.path}.{uuid.uuid4().hex}.stale'
+        try:
+            os.rename(self.path, stale_path)
+        except FileNotFoundError:
+            return True
+        except OSError:
+            return False
+
+        stale_holder = _read_holder(stale_path)
+        if stale_holder is not None and stale_holder.get('expires_at', 0) > time.time():
+            try:
+                os.link(stale_path, self.path)
+            except OSError:
+                pass
+            os.remove(stale_path)
+            return False
+
+        os.remove(stale_path)
+        logger.warning(f"同步锁 {self.dataset} 租约已过期，接管锁（原持有者: {holder}）")
+        return True
+
+    def acquire(self, wait_seconds: float = 0) -> bool:
+        """获取锁，最多等待 wait_seconds 秒；获取失败返回 False"""
+        deadline = time.time() + wait_seconds
+        while True:
+            with _guarded(self.path):
+                acquired = self._try_create() or (self._break_expired() and self._try_create())
+            if acquired:
+                self._renewed_at = time.monotonic()
+                return True
+            if time.time() >= deadline:
+                return False
+            time.sleep(LOCK_POLL_INTERVAL)
+
+    def _renew(self) -> bool:
+        """续约；锁文件已不属于自己时返回 False（检查和写入在互斥锁内完成）"""
+        with _guarded(self.path):
+            holder = _read_holder(self.path)
+            if holder is None or holder.get('token') != self.token:
+                return False
+            holder['expires_at'] = time.time() + self.lease_seconds
+            tmp_path = f'{self.path}.{self.token}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(holder, f)
+            os.replace(tmp_path, self.path)
+        return True
+
+    def on_progress(self, phase: Optional[str] = None):
+        """
+        同步进度钩子：距上次续约超过租约的 1/3 时续约（此前租约必然有效，无需读取锁文件）
+        发现锁已被其他进程接管时抛出 SyncLockLost；上报失败阶段时不再抛出，便于同步函数完成回滚
+        """
+        if not self.lost and time.monotonic() - self._renewed_at >= self.lease_seconds / 3:
+            try:
+                if self._renew():
+                    self._renewed_at = time.monotonic()
+                else:
+                    self.lost = True
+                    logger.error(f"同步锁 {self.dataset} 租约已过期并被其他进程接管，中止本次同步")
+            except OSError as e:
+                logger.warning(f"同步锁 {self.dataset} 续约失败: {e}")
+        if self.lost and phase != 'failed':
+            raise SyncLockLost(f"同步锁 {self.dataset} 已被其他进程接管")
+
+    def release(self):
+        """释放锁（只删除自己持有的锁文件）"""
+        with _guarded(self.path):
+            holder = _read_holder(self.path)
+            if holder is not None and holder.get('token') == self.token:
+                try:
+                    os.remove(self.path)
+                except FileNotFoundError:
+                    pass
+
+
+def get_lock_holder(dataset: str) -> Optional[dict]:
+    """获取数据集同步锁的当前持有者（租约未过期时）"""
+    holder = _read_holder(_lock_path(dataset))
+    if holder is None or holder.get('expires_at', 0) <= time.time():
+        return None
+    return holder
+
+
+def single_flight(dataset: str) -> Callable:
+    """
+    同步函数装饰器：同一数据集在所有进程中同时只执行一次
+    锁被占用时最多等待 SYNC_LOCK_WAIT_SECONDS 秒，仍未获取则跳过并返回 sync_type='skipped'（不改动同步进度）
+    持有锁期间把 SyncLock.on_progress 注册为进度钩子，按同步进度续约并检查锁是否丢失
+    """
+    def decorator(func: Callable[[], dict]) -> Callable[[], dict]:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs) -> dict:
+            lock = SyncLock(dataset)
+            if not lock.acquire(wait_seconds=settings.SYNC_LOCK_WAIT_SECONDS):
+                holder = get_lock_holder(dataset)
+                # 持有锁的同步可能就在本进程中运行，跳过时不能覆盖它的进度（任务状态和运行历史依赖这份进度）
+                logger.info(f"{dataset} 正在由其他进程同步，跳过本次同步（持有者: {holder}）")
+                return {
+                    'success': True,
+                    'record_count': 0,
+                    'sync_type': 'skipped',
+                    'error': None,
+                    'last_sync_time': None,
+                    'skipped_reason': 'locked',
+                    'lock_holder': holder
+                }
+            set_progress_hook(dataset, lock.on_progress)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                set_progress_hook(dataset, None)
+                lock.release()
+        return wrapper
+    return decorator
@@ -0,0 +1,109 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, List, Optional, Tuple
+from app.config import settings
+from app.data_sync import sync_financial_scores_from_remote, sync_stock_details_from_remote
+from app.market_breadth_sync import sync_market_breadth_data_from_remote
+from app.etf_cluster_sync import sync_etf_cluster_data_from_remote
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 同步任务依赖图：数据集 -> (同步函数, 依赖的数据集)
+# financial_scores 的板块名称取自本地 stock_details 缓存，必须等 stock_details 完成
+SYNC_DAG: Dict[str, Tuple[Callable[[], dict], List[str]]] = {
+    'stock_details': (sync_stock_details_from_remote, []),
+    'financial_scores': (sync_financial_scores_from_remote, ['stock_details']),
+    'market_breadth': (sync_market_breadth_data_from_remote, []),
+    'etf_cluster': (sync_etf_cluster_data_from_remote, []),
+}
+
+
+def _run_task(name: str, func: Callable[[], dict]) -> dict:
+    """执行单个同步任务，异常统一转换为失败结果"""
+    try:
+        return func()
+    except Exception as e:
+        logger.error(f"同步任务 {name} 异常: {e}")
+        return {'success': False, 'record_count': 0, 'error': str(e)}
+
+
+def _critical_path(dag: Dict[str, Tuple[Callable[[], dict], List[str]]], timings: Dict[str, dict]) -> Tuple[List[str], float]:
+    """按各任务耗时计算依赖图上的关键路径（耗时最长的依赖链）"""
+    memo: Dict[str, Tuple[List[str], float]] = {}
+
+    def longest(name: str) -> Tuple[List[str], float]:
+        if name not in memo:
+            best_path, best_time = [], 0.0
+            for dep in dag[name][1]:
+                if dep in dag:
+                    path, cost = longest(dep)
+                    if cost > best_time:
+                        best_path, best_time = path, cost
+            memo[name] = (best_path + [name], best_time + timings[name]['wall_time'])
+        return memo[name]
+
+    path, cost = max((longest(name) for name in dag), key=lambda item: item[1])
+    return path, round(cost, 3)
+
+
+def run_sync_dag(
+    dag: Optional[Dict[str, Tuple[Callable[[], dict], List[str]]]] = None,
+    max_workers: Optional[int] = None
+) -> dict:
+    """
+    按依赖图并行执行各数据集同步
+    - 无依赖的数据集同时提交到线程池，依赖完成后再提交下游任务
+    - 依赖失败时下游仍会执行（使用本地缓存中已有的依赖数据）
+    - 返回各数据集结果、耗时及关键路径耗时
+    """
+    dag = dag or SYNC_DAG
+    max_workers = max_workers or settings.SYNC_MAX_WORKERS
+
+    results: Dict[str, dict] = {}
+    timings: Dict[str, dict] = {}
+    pending = dict(dag)
+    running = {}
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sync') as executor:
+        while pending or running:
+            ready = [
+                name for name, (_, deps) in pending.items()
+                if all(dep in results or dep not in dag for dep in deps)
+            ]
+            for name in ready:
+                func, deps = pending.pop(name)
+                failed_deps = [dep for dep in deps if dep in results and not results[dep]['success']]
+                if failed_deps:
+                    logger.warning(f"同步任务 {name} 的依赖 {failed_deps} 失败，将使用本地缓存中的依赖数据继续")
+                logger.info(f"提交同步任务: {name}")
+                timings[name] = {'started_at': round(time.perf_counter() - start, 3)}
+                running[executor.submit(_run_task, name, func)] = name
+
+            if not running:
+                # 依赖图中存在环，剩余任务永远无法就绪
+                raise ValueError(f"同步依赖图存在循环依赖: {list(pending)}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name] = future.result()
+                finished_at = round(time.perf_counter() - start, 3)
+                timings[name].update({
+                    'finished_at': finished_at,
+                    'wall_time': round(finished_at - timings[name]['started_at'], 3),
+                    'success': results[name]['success']
+                })
+                logger.info(f"同步任务 {name} 完成，耗时 {timings[name]['wall_time']}s，成功: {results[name]['success']}")
+
+    critical_path, critical_path_time = _critical_path(dag, timings)
+
+    return {
+        'results': results,
+        'timings': timings,
+        'critical_path': critical_path,
+        'critical_path_time': critical_path_time,
+        'total_time': round(time.perf_counter() - start, 3)
+    }
@@ -0,0 +1,255 @@
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from sqlalchemy import String, and_, cast, func, or_
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Query, Session
+from app.config import settings
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块
+    resource = None
+
+# 各数据集当前同步进度：dataset -> {phase, rows_processed, rows_total, remote_bytes, phase_times, started_at, updated_at}
+_progress = {}
+_progress_lock = threading.Lock()
+
+# 各数据集同步过程中每次上报进度时调用的钩子：dataset -> hook(phase)
+# 同步锁借此随同步进度续约，并在租约被接管后让同步在下一个块边界/提交前中止
+_progress_hooks: Dict[str, Callable[[Optional[str]], None]] = {}
+
+# 计时的同步阶段：远程查询、数据传输、数据转换、缓存写入、提交、同步后统计
+SYNC_PHASES = ('remote_query', 'transfer', 'transform', 'cache_write', 'commit', 'post_sync_counts')
+
+
+def start_progress(dataset: str):
+    """开始一次数据集同步，重置进度"""
+    now = time.time()
+    with _progress_lock:
+        _progress[dataset] = {
+            'phase': 'starting',
+            'rows_processed': 0,
+            'rows_total': None,
+            'remote_bytes': 0,
+            'phase_times': {},
+            'started_at': now,
+            'updated_at': now
+        }
+
+
+def set_progress_hook(dataset: str, hook: Optional[Callable[[Optional[str]], None]]):
+    """设置（hook 为 None 时移除）数据集的进度钩子"""
+    with _progress_lock:
+        if hook is None:
+            _progress_hooks.pop(dataset, None)
+        else:
+            _progress_hooks[dataset] = hook
+
+
+def _run_progress_hook(dataset: str, phase: Optional[str]):
+    """在进度锁之外调用钩子（钩子可能读写文件或抛出异常中止同步）"""
+    hook = _progress_hooks.get(dataset)
+    if hook is not None:
+        hook(phase)
+
+
+def update_progress(
+    dataset: str,
+    phase: Optional[str] = None,
+    rows: int = 0,
+    rows_total: Optional[int] = None,
+    remote_bytes: int = 0
+):
+    """更新数据集同步进度：切换阶段、累加已处理行数和远程传输字节数，或设置总行数"""
+    with _progress_lock:
+        progress = _progress.get(dataset)
+        if progress is None:
+            return
+        if phase:
+            progress['phase'] = phase
+        if rows_total is not None:
+            progress['rows_total'] = rows_total
+        progress['rows_processed'] += rows
+        progress['remote_bytes'] += remote_bytes
+        progress['updated_at'] = time.time()
+    _run_progress_hook(dataset, phase)
+
+
+def get_progress(dataset: str) -> Optional[dict]:
+    """获取数据集同步进度快照"""
+    with _progress_lock:
+        progress = _progress.get(dataset)
+        if progress is None:
+            return None
+        return dict(progress, phase_times=dict(progress['phase_times']))
+
+
+@contextmanager
+def timed_phase(dataset: str, phase: str):
+    """
+    统计同步阶段耗时（秒），同一阶段多次进入时累加，结果记录在同步进度的 phase_times 中
+    进入阶段时调用进度钩子（提交、影子表替换之前确认同步锁仍然有效）
+    """
+    _run_progress_hook(dataset, phase)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _progress_lock:
+            progress = _progress.get(dataset)
+            if progress is not None:
+                phase_times = progress['phase_times']
+                phase_times[phase] = phase_times.get(phase, 0.0) + elapsed
+
+
+def estimate_bytes(value: Any) -> int:
+    """估算一行/一个值从远程传输的数据量（字节）：文本按UTF-8长度，其他值按文本表示长度"""
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, (Row, tuple, list)):
+        return sum(estimate_bytes(item) for item in value)
+    if hasattr(value, '__table__'):
+        return sum(estimate_bytes(getattr(value, column.key)) for column in value.__table__.columns)
+    return len(str(value))
+
+
+def iter_query_chunks(query: Query, chunk_size: Optional[int] = None, dataset: Optional[str] = None) -> Iterator[List]:
+    """
+    以服务端游标流式读取远程查询结果，每次产出 chunk_size 条记录
+    避免 query.all() 一次性把整张表（含大文本字段）加载到内存
+    指定 dataset 时先统计总行数，并在每块读取后上报进度和传输字节数
+    """
+    chunk_size = chunk_size or settings.SYNC_CHUNK_SIZE
+
+    if not dataset:
+        rows = iter(query.yield_per(chunk_size))
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    update_progress(dataset, phase='remote_query')
+    with timed_phase(dataset, 'remote_query'):
+        rows_total = query.order_by(None).count()
+        rows = iter(query.yield_per(chunk_size))
+    update_progress(dataset, phase='transfer', rows_total=rows_total)
+
+    while True:
+        with timed_phase(dataset, 'transfer'):
+            chunk = list(islice(rows, chunk_size))
+            remote_bytes = estimate_bytes(chunk)
+        if not chunk:
+            return
+        yield chunk
+        update_progress(dataset, rows=len(chunk), remote_bytes=remote_bytes)
+
+
+def row_hash_expr(*columns):
+    """
+    远程行内容哈希表达式：MD5(CONCAT_WS(分隔符, 各列文本))，在MySQL端计算
+    只包含业务内容列，不包含 updated_at 等时间戳，时间戳变化但内容未变的行哈希不变
+    """
+    return func.md5(func.concat_ws('\x1f', *[func.coalesce(cast(column, String), '') for column in columns]))
+
+
+def parse_watermark(value: Optional[str]) -> Any:
+    """把元数据中保存的 ISO 格式水位线还原为 datetime，无法解析时原样返回"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return value
+
+
+def after_watermark(time_column, key_column, watermark_time: Any, watermark_key: Optional[str] = None):
+    """
+    复合水位线 (更新时间, 主键) 之后的记录条件
+    同一更新时间的记录按主键继续，不会因为时间戳相同而漏掉或重复拉取；
+    旧版本元数据没有主键水位线时退化为 更新时间 > 水位线
+    """
+    if watermark_key is None:
+        return time_column > watermark_time
+    return or_(
+        time_column > watermark_time,
+        and_(time_column == watermark_time, key_column > watermark_key)
+    )
+
+
+def max_watermark(current: Optional[Tuple], candidate: Tuple) -> Tuple:
+    """比较 (更新时间, 主键) 复合水位线，返回较大者（更新时间为空的记录不参与）"""
+    if candidate[0] is None:
+        return current
+    if current is None or candidate > current:
+        return candidate
+    return current
+
+
+def find_changed_keys(
+    cache_db: Session,
+    key_column,
+    hash_column,
+    remote_hashes: Dict[Any, str],
+    batch_size: int = 500
+) -> List:
+    """比对远程与本地缓存的行哈希，返回本地不存在或内容已变化的主键"""
+    keys = list(remote_hashes)
+    changed = []
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start + batch_size]
+        local_hashes = dict(
+            cache_db.query(key_column, hash_column)
+            .filter(key_column.in_(batch))
+            .all()
+        )
+        changed.extend(key for key in batch if local_hashes.get(key) != remote_hashes[key])
+    return changed
+
+
+def iter_rows_by_keys(
+    query: Query,
+    key_column,
+    keys: Sequence,
+    chunk_size: Optional[int] = None,
+    dataset: Optional[str] = None
+) -> Iterator[List]:
+    """按主键分批（IN 查询）拉取完整记录，每批最多 chunk_size 条；指定 dataset 时上报传输字节数"""
+    chunk_size = chunk_size or settings.SYNC_CHUNK_SIZE
+    for start in range(0, len(keys), chunk_size):
+        batch = list(keys[start:start + chunk_size])
+        if not dataset:
+            yield query.filter(key_column.in_(batch)).all()
+            continue
+        with timed_phase(dataset, 'transfer'):
+            chunk = query.filter(key_column.in_(batch)).all()
+            remote_bytes = estimate_bytes(chunk)
+        update_progress(dataset, remote_bytes=remote_bytes)
+        yield chunk
+
+
+def get_remote_bytes(dataset: str) -> int:
+    """本次同步从远程传输的字节数（估算）"""
+    progress = get_progress(dataset)
+    return progress['remote_bytes'] if progress else 0
+
+
+def get_peak_rss_mb() -> Optional[float]:
+    """获取当前进程的内存峰值（MB），不支持的平台返回 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 下单位为 KB，macOS 下单位为字节
+    if sys.platform == 'darwin':
+        return round(peak / 1024 / 1024, 2)
+    return round(peak / 1024, 2)
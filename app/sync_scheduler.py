@@ -2,6 +2,7 @@ import logging
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from app.data_sync import sync_data_from_remote, init_cache_db
+from app.sync_jobs import submit_sync_job
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -9,6 +10,15 @@ logger = logging.getLogger(__name__)
 scheduler = None
 
 
+def run_scheduled_sync():
+    """
+    定时同步入口：通过后台任务管理器提交，与手动触发的同步合并
+    多个worker同时触发时，由跨进程同步锁保证每个数据集只同步一次
+    """
+    job = submit_sync_job('all', sync_data_from_remote)
+    logger.info(f"定时同步任务: {job['job_id']}（合并到已有任务: {job['coalesced']}）")
+
+
 def init_scheduler():
     """初始化定时任务调度器"""
     global scheduler
@@ -21,7 +31,7 @@ def init_scheduler():
         scheduler = BackgroundScheduler()
 
         scheduler.add_job(
-            sync_data_from_remote,
+            run_scheduled_sync,
             trigger=CronTrigger(hour=5, minute=0),
             id='daily_data_sync',
             name='每日数据同步',
@@ -0,0 +1,138 @@
+import os
+import sys
+import time
+import asyncio
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from app.cache_database import SessionLocal
+from app.crud import (
+    financial_score_fragment, financial_score_metrics, get_market_breadth_data, get_screening_list,
+    get_top3_by_overall_score, get_top_stocks_by_overall_score, search_stock_suggestions
+)
+from app.json_response import FragmentJSONResponse, dumps, fragment, orjson
+from app.routers import market_breadth, screening
+from app.schemas import ScreeningFilterParams, ScreeningResponse, SearchSuggestionsResponse
+
+# 每个场景重复的次数（取平均值）
+ROUNDS = 200
+
+_loop = asyncio.new_event_loop()
+
+
+def measure(func, rounds: int = ROUNDS) -> float:
+    """平均每次耗时（毫秒），先执行一次预热"""
+    func()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+def route_field(router, path: str):
+    """接口声明的响应模型字段（未声明 response_model 时为 None）"""
+    for route in router.routes:
+        if route.path == path and 'GET' in route.methods:
+            return route.response_field
+    raise ValueError(f"未找到接口: {path}")
+
+
+def default_path_body(field, content) -> bytes:
+    """
+    默认路径（未启用 FAST_JSON_RESPONSES）：与 FastAPI 处理接口返回值的方式相同，
+    有 response_model 时按模型校验和过滤，否则直接转换为 JSON 兼容对象，再由 JSONResponse 序列化
+    """
+    return JSONResponse(_loop.run_until_complete(serialize_response(field=field, response_content=content))).body
+
+
+def report(name: str, default: float, fast_hit: float, fast_miss: float):
+    print(f"{name:<24}{default:>12.3f}{fast_hit:>12.3f}{fast_miss:>12.3f}{default / fast_hit:>10.1f}x")
+
+
+def run_benchmark():
+    """
+    按缓存数据库中的数据测量各接口每次请求的序列化耗时（不含数据查询）
+    默认路径按各接口当前的实现构造返回值；快速路径分别测量命中按数据版本缓存的片段/响应体和未命中时的耗时
+    """
+    db = SessionLocal()
+    try:
+        rows, _ = get_screening_list(db, ScreeningFilterParams(page=1, page_size=100))
+        if not rows:
+            print("缓存数据库中没有选股数据，请先完成一次同步")
+            return
+        top3 = ScreeningResponse(top3=get_top3_by_overall_score(db)).model_dump()['top3']
+        keyword = rows[0]["stock_code"][:3]
+        suggestions = search_stock_suggestions(db, keyword, 20)
+        top_stocks = get_top_stocks_by_overall_score(db, 8)
+        breadth = get_market_breadth_data(db)
+    finally:
+        db.close()
+
+    print(f"orjson: {'已安装' if orjson is not None else '未安装（使用标准库 json）'}")
+    print(f"{'场景':<22}{'默认路径(ms)':>12}{'快速命中(ms)':>12}{'快速未命中(ms)':>12}{'加速':>10}")
+
+    # 选股列表：默认路径构造 ScreeningResponse（指标列表按数据版本缓存）并按 response_model 校验；
+    # 快速路径只拼接各行的片段（命中时片段已按数据版本缓存）
+    screening_field = route_field(screening.router, "/screening")
+    top3_fragment = fragment(top3)
+    for row in rows:
+        financial_score_fragment(row)
+
+    def screening_fast(top3_body, row_fragment) -> bytes:
+        return FragmentJSONResponse({
+            "top3": top3_body,
+            "data": [row_fragment(row) for row in rows],
+            "total": len(rows),
+            "page": 1,
+            "page_size": 100,
+            "total_pages": 1,
+            "next_cursor": None
+        }).body
+
+    report(
+        "选股列表（100行）",
+        measure(lambda: default_path_body(screening_field, ScreeningResponse(
+            top3=top3,
+            data=[dict(row, metrics_detail_parsed=financial_score_metrics(row)) for row in rows],
+            total=len(rows),
+            page=1,
+            page_size=100,
+            total_pages=1
+        ))),
+        measure(lambda: screening_fast(top3_fragment, financial_score_fragment)),
+        measure(lambda: screening_fast(fragment(top3), fragment))
+    )
+
+    # 其余接口的快速路径命中时直接输出按数据版本缓存的响应体
+    suggestions_field = route_field(screening.router, "/screening/search/suggestions")
+    body = dumps({"suggestions": suggestions}).encode('utf-8')
+    report(
+        "搜索建议（20条）",
+        measure(lambda: default_path_body(suggestions_field, SearchSuggestionsResponse(suggestions=suggestions))),
+        measure(lambda: FragmentJSONResponse(body).body),
+        measure(lambda: FragmentJSONResponse(dumps({"suggestions": suggestions}).encode('utf-8')).body)
+    )
+
+    top_stocks_field = route_field(screening.router, "/screening/top-stocks")
+    top_stocks_body = dumps({"suggestions": top_stocks}).encode('utf-8')
+    report(
+        "综合排名（8条）",
+        measure(lambda: default_path_body(top_stocks_field, SearchSuggestionsResponse(suggestions=top_stocks))),
+        measure(lambda: FragmentJSONResponse(top_stocks_body).body),
+        measure(lambda: FragmentJSONResponse(dumps({"suggestions": top_stocks}).encode('utf-8')).body)
+    )
+
+    if breadth:
+        breadth_field = route_field(market_breadth.router, "/market-breadth")
+        breadth_body = dumps(breadth).encode('utf-8')
+        report(
+            f"市场宽度（{len(breadth['dates'])}天）",
+            measure(lambda: default_path_body(breadth_field, breadth), rounds=20),
+            measure(lambda: FragmentJSONResponse(breadth_body).body, rounds=20),
+            measure(lambda: FragmentJSONResponse(dumps(breadth).encode('utf-8')).body, rounds=20)
+        )
+
+
+if __name__ == "__main__":
+    run_benchmark()
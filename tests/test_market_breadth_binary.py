@@ -0,0 +1,29 @@
+import os
+import struct
+
+import pytest
+
+for name, value in (('DB_HOST', 'localhost'), ('DB_PORT', '3306'), ('DB_USER', 'test'), ('DB_PASSWORD', 'test'), ('DB_NAME', 'test')):
+    os.environ.setdefault(name, value)
+
+pytest.importorskip('numpy')
+
+from app.market_breadth_binary import HEADER, MISSING_DAY, encode_market_breadth  # noqa: E402
+
+
+def test_missing_trade_date_is_encoded_as_sentinel():
+    payload = {
+        'dates': [None, '2025-01-02', '2025-01-05'],
+        'columns': ['银行', 'sum'],
+        'data': [[1, 2], [3, 4], [5, 6]],
+        'total_breadth_data': [1, 2, 3],
+        'statistics': {}
+    }
+    buffer = encode_market_breadth(payload)
+
+    _, _, date_count, _, base_day, meta_length = HEADER.unpack_from(buffer)
+    offset = HEADER.size + meta_length
+    offset += -offset % 8
+    assert date_count == 3
+    assert base_day == 20090  # 2025-01-02
+    assert struct.unpack_from('<3i', buffer, offset) == (MISSING_DAY, 0, 3)
@@ -0,0 +1,64 @@
+import os
+from datetime import datetime
+from types import SimpleNamespace
+
+# app.config 要求远程数据库配置，测试只使用内存 SQLite 缓存库
+for name, value in (('DB_HOST', 'localhost'), ('DB_PORT', '3306'), ('DB_USER', 'test'), ('DB_PASSWORD', 'test'), ('DB_NAME', 'test')):
+    os.environ.setdefault(name, value)
+
+from sqlalchemy import create_engine, select  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from app.cache_database import Base as CacheBase  # noqa: E402
+from app.market_breadth_sync import _write_market_breadth_chunk  # noqa: E402
+from app.models import MarketBreadthMetricsCache  # noqa: E402
+
+
+def _remote_row(day: int, market_breadth: int, update_time: datetime, row_hash: str):
+    item = SimpleNamespace(
+        industries_data='{"银行": 50, "医药": 40}',
+        market_breadth=market_breadth,
+        total_breadth=90,
+        trade_date=datetime(2026, 6, day),
+        update_time=update_time
+    )
+    return item, row_hash
+
+
+def _cache_session():
+    engine = create_engine('sqlite://')
+    CacheBase.metadata.create_all(engine)
+    return sessionmaker(bind=engine)()
+
+
+def test_updating_existing_breadth_day_is_counted_as_update():
+    db = _cache_session()
+    table = MarketBreadthMetricsCache.__table__
+    first_sync = datetime(2026, 6, 4, 18)
+    _write_market_breadth_chunk(
+        db, table, [_remote_row(3, 60, first_sync, 'a'), _remote_row(4, 55, first_sync, 'b')], None
+    )
+    db.commit()
+
+    # 远程修改已有交易日（内容哈希和更新时间变化），并新增一个交易日
+    second_sync = datetime(2026, 6, 5, 18)
+    stats = _write_market_breadth_chunk(
+        db, table, [_remote_row(3, 61, second_sync, 'c'), _remote_row(5, 50, second_sync, 'd')], None
+    )
+    db.commit()
+
+    assert (stats['inserted'], stats['updated'], stats['skipped']) == (1, 1, 0)
+    rows = db.execute(select(table.c.trade_date, table.c.market_breadth).order_by(table.c.trade_date)).all()
+    assert [(day, float(value)) for day, value in rows] == [
+        ('2026-06-03 00:00:00', 61.0), ('2026-06-04 00:00:00', 55.0), ('2026-06-05 00:00:00', 50.0)
+    ]
+
+
+def test_unchanged_breadth_day_is_skipped():
+    db = _cache_session()
+    table = MarketBreadthMetricsCache.__table__
+    sync_time = datetime(2026, 6, 4, 18)
+    _write_market_breadth_chunk(db, table, [_remote_row(3, 60, sync_time, 'a')], None)
+    db.commit()
+
+    stats = _write_market_breadth_chunk(db, table, [_remote_row(3, 60, sync_time, 'a')], None)
+    assert (stats['inserted'], stats['updated'], stats['skipped']) == (0, 0, 1)